@@ -1,11 +1,21 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import os
+import subprocess
+import sys
+
+# The preview loads MathJax from pymd_editor/assets/mathjax (url_scheme.py);
+# vendor it before the first build so the packaged app works offline
+if not os.path.isdir(os.path.join(SPECPATH, 'src', 'pymd_editor', 'assets', 'mathjax')):
+    subprocess.check_call([sys.executable, os.path.join(SPECPATH, 'tools', 'fetch_mathjax.py')])
 
 a = Analysis(
     ['src\\pymd_editor\\main.py'],
     pathex=['src'],
     binaries=[],
-    datas=[],
+    datas=[
+        ('src\\pymd_editor\\assets\\mathjax', 'pymd_editor\\assets\\mathjax'),
+    ],
     hiddenimports=[
         'PyQt6.QtCore',
         'PyQt6.QtGui',
@@ -2,12 +2,18 @@
 
 block_cipher = None
 
-import sys
 import os
+import subprocess
+import sys
 
 # Get Python DLL path
 python_dll = os.path.join(sys.base_prefix, 'python313.dll')
 
+# The preview loads MathJax from pymd_editor/assets/mathjax (url_scheme.py);
+# vendor it before the first build so the packaged app works offline
+if not os.path.isdir(os.path.join(SPECPATH, 'src', 'pymd_editor', 'assets', 'mathjax')):
+    subprocess.check_call([sys.executable, os.path.join(SPECPATH, 'tools', 'fetch_mathjax.py')])
+
 a = Analysis(
     ['src\\pymd_editor\\main.py'],
     pathex=[],
@@ -16,6 +22,7 @@ a = Analysis(
     ],
     datas=[
         ('src\\pymd_editor\\*.py', 'pymd_editor'),
+        ('src\\pymd_editor\\assets\\mathjax', 'pymd_editor\\assets\\mathjax'),
     ],
     hiddenimports=[
         'PyQt6.QtCore',
@@ -14,6 +14,8 @@ const APP_BASE_URL = new URL('./', window.location.href);
 const DEFAULT_LOCAL_API = 'http://127.0.0.1:8765';
 const DEFAULT_OFFICIAL_CLOUD = 'https://dataflowxx.dpdns.org';
 const BACKEND_PREF_KEY = 'pymd-backend-preference-v1';
+// Documents larger than this use the chunked /api/render/stream endpoint
+const STREAM_RENDER_THRESHOLD = 512 * 1024;
 const RUNTIME_CONFIG = Object.freeze({
   officialCloudUrl: (window.PYMD_CONFIG?.officialCloudUrl || DEFAULT_OFFICIAL_CLOUD).replace(/\/+$/, ''),
   demoLabel: window.PYMD_CONFIG?.demoLabel || 'Demo / Lite',
@@ -145,7 +147,16 @@ class ApiBackend {
     this.info = info;
   }
 
+  streams(markdown) {
+    return markdown.length > STREAM_RENDER_THRESHOLD && !!this.info?.features?.render_stream;
+  }
+
   async render(markdown, dark, basePath) {
+    if (this.streams(markdown)) {
+      const parts = [];
+      await this.renderStream(markdown, dark, basePath, chunk => { parts.push(chunk); });
+      return parts.join('');
+    }
     const resp = await fetchApi('/api/render', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -156,6 +167,30 @@ class ApiBackend {
     return html;
   }
 
+  // Plain text/html body: no JSON envelope to build and parse for big
+  // documents. onChunk gets each piece of the document as it arrives;
+  // returning false stops reading.
+  async renderStream(markdown, dark, basePath, onChunk) {
+    const resp = await fetchApi('/api/render/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ markdown, dark, base_path: basePath || undefined }),
+    }, this.baseUrl);
+    if (!resp.ok) throw new Error(`Render HTTP ${resp.status}`);
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      if (onChunk(decoder.decode(value, { stream: true })) === false) {
+        reader.cancel();
+        return;
+      }
+    }
+    const tail = decoder.decode();
+    if (tail) onChunk(tail);
+  }
+
   async listFiles(dir = '') {
     const types = 'md,pdf,docx,xlsx,pptx';
     const resp = await fetchApi(
@@ -597,9 +632,39 @@ function onEditorInput() {
   debounceRender();
 }
 
+// Adaptive debounce: the delay follows a moving average of render time per
+// character, and edits made while a render runs queue one follow-up render.
+const RENDER_DEBOUNCE = { initial: 280, min: 50, max: 2000, factor: 1.5, smoothing: 0.3 };
+const renderRate = { msPerChar: null, inFlight: false, pending: false };
+
+function renderDelay(size) {
+  if (renderRate.msPerChar === null) return RENDER_DEBOUNCE.initial;
+  const predicted = renderRate.msPerChar * size * RENDER_DEBOUNCE.factor;
+  return Math.round(Math.min(RENDER_DEBOUNCE.max, Math.max(RENDER_DEBOUNCE.min, predicted)));
+}
+
 function debounceRender() {
   clearTimeout(state.renderTimer);
-  state.renderTimer = setTimeout(renderPreview, 280);
+  if (renderRate.inFlight) { renderRate.pending = true; return; }
+  state.renderTimer = setTimeout(scheduledRender, renderDelay(state.content.length));
+}
+
+async function scheduledRender() {
+  renderRate.inFlight = true;
+  renderRate.pending = false;
+  const size = Math.max(state.content.length, 1);
+  const t0 = performance.now();
+  try {
+    await renderPreview();
+  } finally {
+    const rate = (performance.now() - t0) / size;
+    renderRate.msPerChar = renderRate.msPerChar === null
+      ? rate
+      : renderRate.msPerChar + RENDER_DEBOUNCE.smoothing * (rate - renderRate.msPerChar);
+    renderRate.inFlight = false;
+    // Edits arrived meanwhile: render the final state right away
+    if (renderRate.pending) scheduledRender();
+  }
 }
 
 function updateWordCount() {
@@ -623,7 +688,13 @@ async function renderPreview() {
       ? state.currentPath.split('/').slice(0, -1).join('/') || null
       : null;
     const renderer = usingLocalFiles() ? localFsBridge : backend;
+    if (renderer.streams?.(state.content)) {
+      await streamPreview(renderer, usingLocalFiles() ? null : basePath, savedY);
+      return;
+    }
+    const seq = ++previewStreamSeq;
     const html = await renderer.render(state.content, state.dark, usingLocalFiles() ? null : basePath);
+    if (seq !== previewStreamSeq) return;  // a newer render took over
     elPreview.srcdoc = html;
     elPreview.addEventListener('load', () => {
       elPreview.contentWindow?.scrollTo(0, savedY);
@@ -633,6 +704,27 @@ async function renderPreview() {
   }
 }
 
+// Large documents: write the chunked response into the preview frame as it
+// arrives, so the first blocks paint while the rest is still rendering.
+let previewStreamSeq = 0;
+
+async function streamPreview(renderer, basePath, savedY) {
+  const seq = ++previewStreamSeq;
+  let doc = null;
+  await renderer.renderStream(state.content, state.dark, basePath, chunk => {
+    if (seq !== previewStreamSeq) return false;  // a newer render took over
+    if (!doc) {
+      doc = elPreview.contentDocument;
+      doc.open();
+    }
+    doc.write(chunk);
+  });
+  if (doc && seq === previewStreamSeq) {
+    doc.close();
+    elPreview.contentWindow?.scrollTo(0, savedY);
+  }
+}
+
 // ── File tree ─────────────────────────────────────────────────────────────────
 
 async function loadFileTree(dir = '') {
@@ -32,6 +32,8 @@ let pyodide = null;
 const RENDER_PY = `
 import markdown2
 
+# pymd_editor is not installed in the worker, so this is the markdown2
+# backend spelled out: keep in sync with DEFAULT_EXTRAS in pymd_editor/renderer.py
 _EXTRAS = [
     "fenced-code-blocks",
     "tables",
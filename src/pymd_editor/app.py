@@ -1,10 +1,11 @@
 ﻿from __future__ import annotations
 
 import os
+from datetime import datetime
 from pathlib import Path
 
-from PyQt6.QtCore import QTimer, Qt, QUrl
-from PyQt6.QtGui import QAction, QCloseEvent
+from PyQt6.QtCore import QPoint, Qt, QUrl
+from PyQt6.QtGui import QAction, QCloseEvent, QTextCursor
 from PyQt6.QtWidgets import (
     QApplication,
     QFileDialog,
@@ -12,17 +13,37 @@ from PyQt6.QtWidgets import (
     QMessageBox,
     QSplitter,
     QStatusBar,
-    QTextEdit,
+    QPlainTextEdit,
+    QProgressDialog,
     QToolBar,
     QTabWidget,
     QTabBar,
     QWidget,
     QHBoxLayout,
+    QLabel,
 )
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 
-from .config import APP_NAME, APP_VERSION, UPDATE_MANIFEST_URL
-from .renderer import MarkdownRenderer
+from .autosave import Autosaver, atomic_write_text, find_recoverable
+from .config import (
+    APP_NAME,
+    APP_VERSION,
+    AUTOSAVE_DIR,
+    AUTOSAVE_INTERVAL_MS,
+    LARGE_FILE_BYTES,
+    LARGE_FILE_CHUNK_BYTES,
+    PREVIEW_SECTION_CHARS,
+    PREVIEW_SECTION_LINES,
+    UPDATE_MANIFEST_URL,
+)
+from .renderer import MarkdownRenderer, format_render_stats
+from .document_stats import DocumentStats
+from .file_loader import ChunkedFileReader
+from .live_preview import BackgroundRenderer, LivePreview, PdfPrinter
+from .markdown_highlighter import MarkdownHighlighter
+from .render_scheduler import DebouncePolicy, RenderScheduler
+from .text_diff import block_edit, utf16_length
+from .url_scheme import pymd_asset_base
 from .exporter import WordExporter, PDFExporter
 from .wysiwyg_editor import EnhancedWYSIWYGEditor
 from .three_column_layout import ThreeColumnLayout, AIAssistantPanel
@@ -44,9 +65,25 @@ class MainWindow(QMainWindow):
         self._current_language = 'zh'  # 初始化语言设置
         self._zen_mode: bool = False
         self._current_theme: str = "Default"
+        # 隐藏的视图不立即刷新，切换到对应标签页时再更新
+        self._preview_stale: bool = False
+        self._wysiwyg_stale: bool = True
+        self._current_tab = 0  # 上一次切换后的标签页
+        # 大文件：后台分块读取；预览只渲染光标附近的 (起始行, 结束行)
+        self._file_reader: ChunkedFileReader | None = None
+        self._load_progress: QProgressDialog | None = None
+        self._preview_section: tuple[int, int] | None = None
+        self._last_render: tuple[str, str | None, list] | None = None
 
         # Core widgets
-        self.editor = QTextEdit(self)
+        # 源码编辑器用纯文本布局，高亮和大文件编辑都快得多
+        self.editor = QPlainTextEdit(self)
+        self.highlighter = MarkdownHighlighter(self.editor.document())
+        # 字数等统计随编辑增量更新，无需每次复制全文
+        self.document_stats = DocumentStats(self.editor.document(), self)
+        # 后台定期把编辑增量写入日志，崩溃后启动时可恢复
+        self.autosaver = Autosaver(self.editor.document(), AUTOSAVE_DIR, AUTOSAVE_INTERVAL_MS, self)
+        self.autosaver.start(None, "")
         self._setup_drag_drop()  # 启用拖放功能
         self.preview = QWebEngineView(self)
         # Enable image loading, mixed content, and JavaScript for MathJax
@@ -60,15 +97,26 @@ class MainWindow(QMainWindow):
         settings.setAttribute(QWebEngineSettings.WebAttribute.LocalStorageEnabled, True)
         self.wysiwyg_editor = EnhancedWYSIWYGEditor(self)
         self.wysiwyg_editor.set_base_path(Path.cwd())
-        self.renderer = MarkdownRenderer()
+        # CSS、MathJax 和本地图片通过 pymd:// 协议从内存提供
+        # 公式只在滚动到可见区域时排版，并按源码缓存排版结果
+        self.renderer = MarkdownRenderer(incremental=True, asset_base=pymd_asset_base(),
+                                         lazy_math=True)
+        # 预览页面只加载一次，之后仅推送变化的块
+        self.live_preview = LivePreview(self.preview, self.renderer, self)
+        # 渲染在后台线程进行，过期的结果直接丢弃
+        self.background_renderer = BackgroundRenderer(self.renderer, self)
+        self.background_renderer.rendered.connect(self._on_preview_rendered)
+        self.background_renderer.failed.connect(self._on_preview_failed)
+        self.background_renderer.profiled.connect(self._on_render_profiled)
         self.word_exporter = WordExporter()
         self.pdf_exporter = PDFExporter()
+        # 导出 PDF 和打印用的离屏页面，首次使用时创建
+        self._pdf_printer: PdfPrinter | None = None
+        self._print_renderer: MarkdownRenderer | None = None
 
-        # Live preview debounce timer
-        self._render_timer = QTimer(self)
-        self._render_timer.setSingleShot(True)
-        self._render_timer.setInterval(150)  # ms
-        self._render_timer.timeout.connect(self.render_preview)
+        # Live preview debounce: interval adapts to recent render times and
+        # at most one scheduled render is in flight
+        self.render_scheduler = RenderScheduler(self.render_preview, self, DebouncePolicy(initial_ms=150))
 
         # 创建标签页界面
         self.tab_widget = QTabWidget(self)
@@ -138,9 +186,19 @@ class MainWindow(QMainWindow):
         # Status bar
         self.status = QStatusBar(self)
         self.setStatusBar(self.status)
+        # 调试用：显示各渲染阶段耗时（视图菜单或 PYMD_DEBUG_RENDER=1 开启）
+        self._render_stats_label = QLabel(self)
+        self._render_stats_label.hide()
+        self.status.addPermanentWidget(self._render_stats_label)
 
         # Connect editor changes
         self.editor.textChanged.connect(self._on_text_changed)
+        for panel in (self.ai_assistant, self.wysiwyg_ai_assistant):
+            panel.set_document_stats(self.document_stats.stats())
+            self.document_stats.changed.connect(panel.set_document_stats)
+        self.editor.verticalScrollBar().valueChanged.connect(self._sync_preview_scroll)
+        self.editor.cursorPositionChanged.connect(self._on_cursor_moved)
+        self.autosaver.failed.connect(lambda msg: self.status.showMessage(f"自动保存失败: {msg}", 5000))
         self.wysiwyg_editor.textChanged.connect(self._on_wysiwyg_changed)
         self.tab_widget.currentChanged.connect(self._on_tab_changed)
 
@@ -149,12 +207,8 @@ class MainWindow(QMainWindow):
         self._init_toolbar()
         self._init_menubar()
 
-        # Initial render
+        # Initial render (WYSIWYG is rendered lazily on first activation)
         self.render_preview()
-        
-        # 初始化WYSIWYG编辑器
-        self.wysiwyg_editor.set_markdown("")
-        self.wysiwyg_editor.set_dark_mode(self._dark_mode)
 
     def _get_text(self, key: str) -> str:
         """Get localized text"""
@@ -182,7 +236,9 @@ class MainWindow(QMainWindow):
                 'three_column_mode': '三栏编辑',
                 'wysiwyg_mode': 'WYSIWYG 编辑',
                 'zen_mode': '禅模式',
-                'themes': '主题'
+                'themes': '主题',
+                'render_stats': '显示渲染耗时',
+                'sync_scroll': '同步滚动'
             },
             'en': {
                 'file_menu': 'File',
@@ -207,7 +263,9 @@ class MainWindow(QMainWindow):
                 'three_column_mode': 'Three Column Editor',
                 'wysiwyg_mode': 'WYSIWYG Editor',
                 'zen_mode': 'Zen Mode',
-                'themes': 'Themes'
+                'themes': 'Themes',
+                'render_stats': 'Show Render Timings',
+                'sync_scroll': 'Sync Scrolling'
             }
         }
         return texts.get(self._current_language, {}).get(key, key)
@@ -247,6 +305,8 @@ class MainWindow(QMainWindow):
         self.toggle_ai_action.setText(self._get_text('toggle_ai'))
         self.check_updates_action.setText(self._get_text('check_updates'))
         self.zen_mode_action.setText(self._get_text('zen_mode'))
+        self.render_stats_action.setText(self._get_text('render_stats'))
+        self.sync_scroll_action.setText(self._get_text('sync_scroll'))
         self.themes_menu.setTitle(self._get_text('themes'))
         
         # Update tab texts
@@ -330,6 +390,20 @@ class MainWindow(QMainWindow):
         self.zen_mode_action.setCheckable(True)
         self.zen_mode_action.triggered.connect(self.toggle_zen_mode)
 
+        # 预览跟随编辑器滚动
+        self.sync_scroll_action = QAction(self._get_text('sync_scroll'), self)
+        self.sync_scroll_action.setCheckable(True)
+        self.sync_scroll_action.setChecked(True)
+
+        # 渲染耗时调试浮层
+        self.render_stats_action = QAction(self._get_text('render_stats'), self)
+        self.render_stats_action.setCheckable(True)
+        debug_render = os.getenv("PYMD_DEBUG_RENDER", "") not in ("", "0")
+        self.render_stats_action.setChecked(debug_render)
+        self.renderer.profile = debug_render
+        self._render_stats_label.setVisible(debug_render)
+        self.render_stats_action.toggled.connect(self.set_render_stats_visible)
+
         # Themes
         self.theme_actions = {}
         themes = ["Default", "Midnight Coffee", "Forest Walk", "Paper & Ink"]
@@ -398,8 +472,11 @@ class MainWindow(QMainWindow):
             
         view_menu.addSeparator()
         view_menu.addAction(self.zen_mode_action)
+        view_menu.addAction(self.sync_scroll_action)
         view_menu.addSeparator()
         view_menu.addAction(self.toggle_ai_action)
+        view_menu.addSeparator()
+        view_menu.addAction(self.render_stats_action)
         
         # Language menu
         lang_menu = menubar.addMenu(self._get_text('language_menu'))
@@ -413,9 +490,8 @@ class MainWindow(QMainWindow):
     # Slots
     def _on_text_changed(self):
         self._dirty = True
-        text = self.editor.toPlainText()
-        self.status.showMessage(f"字数: {len(text)}", 1500)
-        self._render_timer.start()
+        self._show_document_stats()
+        self._schedule_render()
 
     def _on_tab_close_requested(self, index: int):
         # Prevent closing main editor tabs
@@ -431,61 +507,207 @@ class MainWindow(QMainWindow):
         self.update_manager.check_for_updates(self)
 
     def render_preview(self):
-        text = self.editor.toPlainText()
+        if self._file_reader is not None:  # 加载完成后再渲染
+            self.render_scheduler.render_finished()
+            return
+        if self.editor.document().characterCount() > PREVIEW_SECTION_CHARS:
+            # 超大文档只渲染光标附近的一段，不复制全文
+            text, self._preview_section = self._cursor_section()
+            self._wysiwyg_stale = True
+        else:
+            self._preview_section = None
+            text = self.editor.toPlainText()
+            # WYSIWYG编辑器不再同步重渲染，切换过去时复用本次渲染结果
+            if text != self.wysiwyg_editor.get_markdown():
+                self._wysiwyg_stale = True
+        if self.tab_widget.currentIndex() == 1:  # 预览不可见，稍后再渲染
+            self._preview_stale = True
+            self.render_scheduler.render_finished()
+            return
+        self._preview_stale = False
+        self._update_preview(text)
+
+    def _update_preview(self, text: str):
+        """Queue a background render of *text* for the preview page."""
         # Pass current file path as base path for image resolution
         base_path = str(self._current_file) if self._current_file else None
-        html = self.renderer.to_html(text, dark=self._dark_mode, base_path=base_path)
+        context = (self._dark_mode, self._preview_base_url(), text, base_path)
+        self.background_renderer.submit(text, base_path, context)
+
+    def _show_document_stats(self):
+        stats = self.document_stats.stats()
+        self.status.showMessage(
+            f"字数: {stats.chars}  词: {stats.words + stats.cjk}  行: {stats.lines}  标题: {stats.headings}",
+            1500,
+        )
+
+    def _schedule_render(self):
+        size = min(self.editor.document().characterCount(), PREVIEW_SECTION_CHARS)
+        self.render_scheduler.schedule(size)
+
+    def _cursor_section(self) -> tuple[str, tuple[int, int]]:
+        """光标附近 PREVIEW_SECTION_LINES 行的文本及其 (起始行, 结束行)"""
+        doc = self.editor.document()
+        line = self.editor.textCursor().blockNumber()
+        first = max(0, line - PREVIEW_SECTION_LINES // 2)
+        last = min(doc.blockCount() - 1, first + PREVIEW_SECTION_LINES - 1)
+        first = max(0, last - PREVIEW_SECTION_LINES + 1)
+        # 从空行之后开始，避免从段落中间截断
+        block = doc.findBlockByNumber(first)
+        if first > 0:
+            probe = block
+            while probe.isValid() and probe.blockNumber() < line:
+                if not probe.text().strip():
+                    block = probe.next()
+                    break
+                probe = probe.next()
+        start = block.blockNumber()
+        lines = []
+        while block.isValid() and block.blockNumber() <= last:
+            lines.append(block.text())
+            block = block.next()
+        return "\n".join(lines), (start, last)
+
+    def _on_cursor_moved(self):
+        """分段预览时光标离开当前段落中部就重新取段渲染"""
+        if self._preview_section is None:
+            return
+        start, end = self._preview_section
+        line = self.editor.textCursor().blockNumber()
+        margin = PREVIEW_SECTION_LINES // 4
+        top = start + margin if start > 0 else start
+        bottom = end - margin if end < self.editor.document().blockCount() - 1 else end
+        if not top <= line <= bottom:
+            self._preview_section = None  # 只触发一次
+            self._schedule_render()
+
+    def _on_preview_failed(self, msg: str):
+        self.render_scheduler.render_finished()
+        self.status.showMessage(f"预览渲染失败: {msg}", 3000)
+
+    def _on_preview_rendered(self, block_map, context):
+        """Apply the newest background render to the preview."""
+        self.render_scheduler.render_finished()
+        dark, base_url, text, base_path = context
+        self._last_render = (text, base_path, block_map.blocks)
+        self.live_preview.show_blocks(block_map, dark, base_url)
+
+    def _sync_preview_scroll(self):
+        """编辑器滚动时让预览跟随到对应的源码块"""
+        if not self.sync_scroll_action.isChecked() or self.tab_widget.currentIndex() != 0:
+            return
+        line = self.editor.cursorForPosition(QPoint(0, 0)).blockNumber()
+        if self._preview_section is not None:
+            line = max(0, line - self._preview_section[0])
+        self.live_preview.scroll_to_line(line)
+
+    def set_render_stats_visible(self, visible: bool):
+        """开关渲染耗时统计及状态栏显示"""
+        self.renderer.profile = visible
+        self._render_stats_label.setVisible(visible)
+        self._render_stats_label.clear()
+        if visible:
+            self.render_preview()
+
+    def _on_render_profiled(self, stats: dict):
+        if self._render_stats_label.isVisible():
+            self._render_stats_label.setText(format_render_stats(stats))
 
+    def _sync_wysiwyg(self):
+        """Refresh the WYSIWYG editor if visible, otherwise mark it stale."""
+        if self.tab_widget.currentIndex() != 1:
+            self._wysiwyg_stale = True
+            return
+        self._wysiwyg_stale = False
+        text = self.editor.toPlainText()
+        base_path = str(self._current_file) if self._current_file else None
+        # 预览刚渲染过同一份内容时直接复用，不再渲染第二遍
+        html_body = None
+        if self._last_render and self._last_render[:2] == (text, base_path):
+            html_body = "\n".join(self._last_render[2])
+        self.wysiwyg_editor.set_base_path(self._current_file, re_render=False)
+        self.wysiwyg_editor.set_dark_mode(self._dark_mode, re_render=False)
+        self.wysiwyg_editor.set_markdown(text, html_body=html_body)
+
+    def _preview_base_url(self) -> QUrl:
         base_dir = Path(self._current_file).parent if self._current_file else Path.cwd()
         base_url = QUrl.fromLocalFile(str(base_dir.resolve()))
         # Ensure the base URL is treated as a directory for relative resources
         if not base_url.path().endswith('/'):
             base_url.setPath(base_url.path() + '/')
-
-        self.preview.setHtml(html, base_url)
-        
-        # 同时更新WYSIWYG编辑器（如果不是当前活动标签页则不更新，避免循环）
-        if self.tab_widget.currentIndex() != 1:  # 不是WYSIWYG标签页
-            self.wysiwyg_editor.set_markdown(text)
+        return base_url
 
     def _on_wysiwyg_changed(self, markdown_text: str):
         """WYSIWYG编辑器内容改变时的处理"""
-        # 更新传统编辑器内容（避免触发textChanged信号）
+        # 只把变化的一段写入传统编辑器（避免触发textChanged信号）
         self.editor.blockSignals(True)
-        self.editor.setPlainText(markdown_text)
+        changed = self._apply_changed_range(markdown_text)
         self.editor.blockSignals(False)
+        if not changed:
+            return
         
-        # 更新预览
-        base_path = str(self._current_file) if self._current_file else None
-        html = self.renderer.to_html(markdown_text, dark=self._dark_mode, base_path=base_path)
-
-        base_dir = Path(self._current_file).parent if self._current_file else Path.cwd()
-        base_url = QUrl.fromLocalFile(str(base_dir.resolve()))
-        if not base_url.path().endswith('/'):
-            base_url.setPath(base_url.path() + '/')
-
-        self.preview.setHtml(html, base_url)
+        # 预览当前不可见，切回三栏模式时再渲染
+        self._preview_stale = True
         
         # 标记为已修改
         self._dirty = True
         self._update_title()
         
         # 更新状态栏
-        self.status.showMessage(f"字数: {len(markdown_text)}", 1500)
+        self._show_document_stats()
+
+    def _apply_changed_range(self, new_text: str) -> bool:
+        """把页面的 Markdown 写回源码，只用一次光标编辑改动变化的块
+
+        页面给出的是规范写法，源码不一定是（* 列表、Setext 标题、缩进代码……），
+        所以比较的是源码各块的规范写法：没变的块原样保留，变化的块换成新写法，
+        且只替换其中真正不同的一段。撤销栈得以保留，重新布局和高亮也只涉及
+        被改动的块。
+        """
+        document = self.editor.document()
+        old_text = document.toPlainText()
+        edit = block_edit(old_text, self.wysiwyg_editor.canonical_blocks(old_text), new_text)
+        if edit is None:
+            return False
+        start, end, replacement = edit
+        # QTextDocument 的位置按 UTF-16 计
+        position = utf16_length(old_text[:start])
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        cursor.setPosition(position)
+        cursor.setPosition(position + utf16_length(old_text[start:end]),
+                           QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(replacement)
+        cursor.endEditBlock()
+        return True
 
     def _on_tab_changed(self, index: int):
         """标签页切换时的处理"""
         if index == 1:  # 切换到WYSIWYG模式
             # 同步传统编辑器的内容到WYSIWYG编辑器
-            text = self.editor.toPlainText()
-            self.wysiwyg_editor.set_base_path(self._current_file, re_render=False)
-            self.wysiwyg_editor.set_markdown(text)
-            # 设置暗色模式
-            self.wysiwyg_editor.set_dark_mode(self._dark_mode)
+            if self._wysiwyg_stale:
+                self._sync_wysiwyg()
         elif index == 0:  # 切换到三栏模式
-            # 同步内容到三栏模式的编辑器和预览
-            text = self.editor.toPlainText()
-            self.render_preview()
+            if self._current_tab == 1:
+                # 先写回还没同步的编辑，再让光标跟到所见即所得中编辑的位置
+                self.wysiwyg_editor.flush(self._follow_wysiwyg_selection)
+            # 同步内容到三栏模式的预览
+            if self._preview_stale:
+                self.render_preview()
+        self._current_tab = index
+
+    def _follow_wysiwyg_selection(self):
+        """源码编辑器光标移到所见即所得中最后编辑的块，预览随编辑器滚动同步"""
+        line = self.wysiwyg_editor.selection_line()
+        if line is None or self.tab_widget.currentIndex() != 0:
+            return
+        block = self.editor.document().findBlockByNumber(line)
+        if not block.isValid():
+            return
+        cursor = self.editor.textCursor()
+        cursor.setPosition(block.position())
+        self.editor.setTextCursor(cursor)
+        self.editor.centerCursor()
 
     def _on_layout_changed(self, proportions: list):
         """三栏布局比例改变时的处理"""
@@ -498,19 +720,22 @@ class MainWindow(QMainWindow):
         if not self._confirm_discard_changes():
             return
         self.editor.clear()
-        self.wysiwyg_editor.set_base_path(None, re_render=False)
-        self.wysiwyg_editor.set_markdown("")
+        self._set_large_file_mode(False)
+        self.autosaver.start(None, "")
         self._current_file = None
         self._dirty = False
         self._update_title()
         self.render_preview()
+        self._sync_wysiwyg()
 
     def open_file(self):
         path, _ = QFileDialog.getOpenFileName(self, "打开文件", str(Path.home()), "Markdown (*.md);;PDF Files (*.pdf)")
         if not path:
             return
-        
-        file_path = Path(path)
+        self.open_path(Path(path))
+
+    def open_path(self, file_path: Path):
+        """打开 Markdown 或 PDF 文件；当前文档有未保存更改时先确认是否放弃"""
         if file_path.suffix.lower() == '.pdf':
             self.open_pdf_viewer(file_path)
             return
@@ -547,8 +772,8 @@ class MainWindow(QMainWindow):
             md_text = PDFConverter.to_markdown(str(path))
             if md_text:
                 self.editor.setPlainText(md_text)
-                self.wysiwyg_editor.set_markdown(md_text)
                 self._current_file = None 
+                self._sync_wysiwyg()
                 self._dirty = True
                 self._update_title()
                 self.status.showMessage("PDF imported successfully", 3000)
@@ -569,26 +794,124 @@ class MainWindow(QMainWindow):
 
     def load_file(self, file_path: Path):
         """加载指定的文件（供外部调用，如命令行参数）"""
+        self._cancel_file_load()
         try:
+            if file_path.stat().st_size >= LARGE_FILE_BYTES:
+                self._load_large_file(file_path)
+                return
+            self._set_large_file_mode(False)
             with open(file_path, "r", encoding="utf-8") as f:
                 content = f.read()
                 self.editor.setPlainText(content)
-                self.wysiwyg_editor.set_base_path(file_path, re_render=False)
-                self.wysiwyg_editor.set_markdown(content)
+            self.autosaver.start(file_path, content)
             self._current_file = file_path
             self._dirty = False
             self._update_title()
             self.render_preview()
+            self._sync_wysiwyg()
             self.status.showMessage(f"已打开: {file_path}", 3000)
         except Exception as e:
             QMessageBox.critical(self, "打开失败", str(e))
 
+    def _set_large_file_mode(self, enabled: bool):
+        """大文件模式下关闭源码高亮"""
+        document = None if enabled else self.editor.document()
+        if self.highlighter.document() is not document:
+            self.highlighter.setDocument(document)
+
+    def _load_large_file(self, file_path: Path):
+        """后台线程分块读取大文件，边读边追加到编辑器，可取消"""
+        reader = ChunkedFileReader(file_path, LARGE_FILE_CHUNK_BYTES, self)
+        reader.chunk_read.connect(self._on_load_chunk)
+        reader.finished_reading.connect(self._on_load_finished)
+        reader.failed.connect(self._on_load_failed)
+        self._file_reader = reader
+
+        self._set_large_file_mode(True)
+        self.autosaver.set_paused(True)
+        # 加载期间不触发 textChanged（脏标记、预览），也不记录撤销
+        self.editor.blockSignals(True)
+        self.editor.clear()
+        self.editor.document().setUndoRedoEnabled(False)
+
+        progress = QProgressDialog(f"正在打开 {file_path.name} ...", "取消", 0, 1000, self)
+        progress.setWindowTitle("打开大文件")
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(300)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.canceled.connect(self._on_load_canceled)
+        self._load_progress = progress
+        reader.start()
+
+    def _on_load_chunk(self, text: str, done_bytes: int):
+        cursor = QTextCursor(self.editor.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        total = max(self._file_reader.total_bytes, 1)
+        self._load_progress.setValue(min(1000, done_bytes * 1000 // total))
+
+    def _on_load_finished(self):
+        file_path = self._file_reader.path
+        self._finish_file_load()
+        self.editor.moveCursor(QTextCursor.MoveOperation.Start)
+        self.autosaver.start(file_path)  # 基准文本由写日志的线程从磁盘读取
+        self._current_file = file_path
+        self._dirty = False
+        self._update_title()
+        self.render_preview()
+        self._sync_wysiwyg()
+        self.status.showMessage(f"已打开（大文件模式）: {file_path}", 3000)
+
+    def _on_load_failed(self, msg: str):
+        self._finish_file_load()
+        self._reset_partial_load()
+        QMessageBox.critical(self, "打开失败", msg)
+
+    def _on_load_canceled(self):
+        self._cancel_file_load()
+        self.status.showMessage("已取消打开", 3000)
+
+    def _cancel_file_load(self):
+        """取消进行中的大文件加载，丢弃已读入的部分"""
+        if self._file_reader is None:
+            return
+        self._file_reader.requestInterruption()
+        self._finish_file_load()
+        self._reset_partial_load()
+
+    def _finish_file_load(self):
+        reader, self._file_reader = self._file_reader, None
+        for signal in (reader.chunk_read, reader.finished_reading, reader.failed):
+            signal.disconnect()
+        reader.wait()
+        reader.deleteLater()
+        self._load_progress.canceled.disconnect(self._on_load_canceled)
+        self._load_progress.close()
+        self._load_progress.deleteLater()
+        self._load_progress = None
+        self.editor.document().setUndoRedoEnabled(True)
+        self.editor.blockSignals(False)
+        self.autosaver.set_paused(False)
+
+    def _reset_partial_load(self):
+        # 只读入一部分的文件不能留在编辑器里，否则保存会截断原文件
+        self.editor.clear()
+        self._set_large_file_mode(False)
+        self.autosaver.start(None, "")
+        self._current_file = None
+        self._dirty = False
+        self._update_title()
+        self.render_preview()
+
     def save_file(self):
         if self._current_file is None:
             return self.save_file_as()
         try:
-            with open(self._current_file, "w", encoding="utf-8") as f:
-                f.write(self.editor.toPlainText())
+            # 先写临时文件再替换，写到一半崩溃也不会丢失原文件
+            text = self.editor.toPlainText()
+            atomic_write_text(self._current_file, text)
+            self.autosaver.start(self._current_file, text)
             self._dirty = False
             self._update_title()
             self.status.showMessage("已保存", 2000)
@@ -600,10 +923,11 @@ class MainWindow(QMainWindow):
         if not path:
             return
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(self.editor.toPlainText())
+            text = self.editor.toPlainText()
+            atomic_write_text(Path(path), text)
             self._current_file = Path(path)
-            self.wysiwyg_editor.set_base_path(self._current_file)
+            self.autosaver.start(self._current_file, text)
+            self._sync_wysiwyg()
             self._dirty = False
             self._update_title()
             self.status.showMessage(f"已保存为: {path}", 3000)
@@ -612,9 +936,10 @@ class MainWindow(QMainWindow):
 
     def toggle_theme(self):
         self._dark_mode = not self._dark_mode
+        self.highlighter.set_dark_mode(self._dark_mode)
         self.render_preview()
         # 同时更新WYSIWYG编辑器的主题
-        self.wysiwyg_editor.set_dark_mode(self._dark_mode)
+        self._sync_wysiwyg()
 
     def toggle_zen_mode(self, checked: bool):
         """Toggle Zen Mode (Distraction Free)"""
@@ -645,7 +970,7 @@ class MainWindow(QMainWindow):
         if theme_name == "Midnight Coffee":
             self.setStyleSheet("""
                 QMainWindow { background-color: #2b2b2b; color: #dcdcdc; }
-                QTextEdit { background-color: #3c3f41; color: #dcdcdc; border: none; font-family: 'Consolas', 'Monaco', monospace; font-size: 14px; }
+                QTextEdit, QPlainTextEdit { background-color: #3c3f41; color: #dcdcdc; border: none; font-family: 'Consolas', 'Monaco', monospace; font-size: 14px; }
                 QStatusBar { background-color: #2b2b2b; color: #808080; }
                 QMenuBar { background-color: #2b2b2b; color: #dcdcdc; }
                 QMenuBar::item:selected { background-color: #3c3f41; }
@@ -656,14 +981,14 @@ class MainWindow(QMainWindow):
         elif theme_name == "Forest Walk":
             self.setStyleSheet("""
                 QMainWindow { background-color: #f0f5f0; color: #2e3b2e; }
-                QTextEdit { background-color: #ffffff; color: #2e3b2e; border: 1px solid #d0dcd0; font-family: 'Georgia', serif; font-size: 15px; }
+                QTextEdit, QPlainTextEdit { background-color: #ffffff; color: #2e3b2e; border: 1px solid #d0dcd0; font-family: 'Georgia', serif; font-size: 15px; }
                 QStatusBar { background-color: #e0e5e0; color: #4e5b4e; }
             """)
             self._dark_mode = False
         elif theme_name == "Paper & Ink":
             self.setStyleSheet("""
                 QMainWindow { background-color: #fdfbf7; color: #1a1a1a; }
-                QTextEdit { background-color: #fffefc; color: #1a1a1a; border: none; font-family: 'Times New Roman', serif; font-size: 16px; }
+                QTextEdit, QPlainTextEdit { background-color: #fffefc; color: #1a1a1a; border: none; font-family: 'Times New Roman', serif; font-size: 16px; }
                 QStatusBar { background-color: #fdfbf7; color: #5a5a5a; }
             """)
             self._dark_mode = False
@@ -671,8 +996,9 @@ class MainWindow(QMainWindow):
             self.setStyleSheet("")
             self._dark_mode = False
             
+        self.highlighter.set_dark_mode(self._dark_mode)
         self.render_preview()
-        self.wysiwyg_editor.set_dark_mode(self._dark_mode)
+        self._sync_wysiwyg()
 
     def export_pdf(self):
         """Export current document to PDF using rendered preview."""
@@ -683,7 +1009,7 @@ class MainWindow(QMainWindow):
             return
         
         try:
-            from PyQt6.QtCore import QMarginsF, QEventLoop
+            from PyQt6.QtCore import QMarginsF
             from PyQt6.QtGui import QPageLayout, QPageSize
             
             # 使用 Qt 原生 PDF 打印（无需 GTK 依赖）
@@ -693,23 +1019,11 @@ class MainWindow(QMainWindow):
                 QMarginsF(15, 15, 15, 15)
             )
             
-            # 创建事件循环等待 PDF 生成完成
-            loop = QEventLoop()
-            
-            def on_pdf_printed(file_path, success):
-                loop.quit()
-                if success:
-                    self.status.showMessage(f"已导出 PDF: {path}", 3000)
-                    QMessageBox.information(self, "导出成功", f"PDF 已保存到:\n{path}")
-                else:
-                    QMessageBox.critical(self, "导出失败", "PDF 生成失败")
-            
-            # 使用预览窗口的渲染结果直接打印
-            self.preview.page().printToPdf(str(path), page_layout)
-            self.preview.page().pdfPrintingFinished.connect(on_pdf_printed)
-            
-            # 等待 PDF 生成完成
-            loop.exec()
+            if self._print_to_pdf(str(path), page_layout):
+                self.status.showMessage(f"已导出 PDF: {path}", 3000)
+                QMessageBox.information(self, "导出成功", f"PDF 已保存到:\n{path}")
+            else:
+                QMessageBox.critical(self, "导出失败", "PDF 生成失败")
             
         except Exception as e:
             QMessageBox.critical(self, "导出失败", f"导出 PDF 时出错:\n{str(e)}")
@@ -717,7 +1031,7 @@ class MainWindow(QMainWindow):
     def print_preview(self):
         """Show print/save dialog for the rendered markdown."""
         try:
-            from PyQt6.QtCore import QMarginsF, QEventLoop, QUrl
+            from PyQt6.QtCore import QMarginsF, QUrl
             from PyQt6.QtGui import QPageLayout, QPageSize, QDesktopServices
             import tempfile
             import os
@@ -734,20 +1048,8 @@ class MainWindow(QMainWindow):
                 QMarginsF(15, 15, 15, 15)
             )
             
-            # 使用事件循环等待 PDF 生成
-            loop = QEventLoop()
-            pdf_success = [False]
-            
-            def on_pdf_ready(file_path, success):
-                pdf_success[0] = success
-                loop.quit()
-            
             # 生成临时 PDF
-            self.preview.page().printToPdf(temp_pdf_path, page_layout)
-            self.preview.page().pdfPrintingFinished.connect(on_pdf_ready)
-            loop.exec()
-            
-            if pdf_success[0]:
+            if self._print_to_pdf(temp_pdf_path, page_layout):
                 # 用系统默认 PDF 查看器打开（通常支持打印）
                 QDesktopServices.openUrl(QUrl.fromLocalFile(temp_pdf_path))
                 self.status.showMessage("已在默认 PDF 查看器中打开，您可以从那里打印", 5000)
@@ -761,6 +1063,59 @@ class MainWindow(QMainWindow):
             error_details = traceback.format_exc()
             QMessageBox.critical(self, "打印预览失败", f"无法显示打印预览:\n{str(e)}\n\n{error_details}")
 
+    def _flush_wysiwyg(self):
+        """所见即所得页面上还没同步的编辑先写回源码编辑器，等待完成"""
+        if self.tab_widget.currentIndex() != 1:
+            return
+        from PyQt6.QtCore import QEventLoop
+
+        loop = QEventLoop()
+        self.wysiwyg_editor.flush(loop.quit)
+        loop.exec()
+
+    def _print_to_pdf(self, path: str, page_layout) -> bool:
+        """在离屏页面中打印预览内容，等待完成并返回是否成功
+
+        预览页面在长文档时是虚拟化的（远离视口的块只是占位），不能直接打印。
+        """
+        from PyQt6.QtCore import QEventLoop
+
+        if self._pdf_printer is None:
+            # 预览的渲染器在后台线程中使用，打印用单独的一个
+            self._print_renderer = MarkdownRenderer(incremental=True, asset_base=pymd_asset_base(),
+                                                    lazy_math=True)
+            self._pdf_printer = PdfPrinter(self._print_renderer, self)
+        if self._pdf_printer.busy:
+            return False
+        self._flush_wysiwyg()
+        # 分段预览只渲染了光标附近的一段，打印始终渲染整篇文档
+        text = self.editor.toPlainText()
+        base_path = str(self._current_file) if self._current_file else None
+        if self._last_render and self._last_render[:2] == (text, base_path):
+            html_body = "\n".join(self._last_render[2])
+        else:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            try:
+                html_body = self._print_renderer.render_body(text, base_path)
+            finally:
+                QApplication.restoreOverrideCursor()
+
+        loop = QEventLoop()
+        result = [False]
+
+        def on_finished(file_path, success):
+            result[0] = success
+            loop.quit()
+
+        self._pdf_printer.finished.connect(on_finished)
+        try:
+            self._pdf_printer.print_pdf(html_body, self._dark_mode, self._preview_base_url(),
+                                        path, page_layout)
+            loop.exec()
+        finally:
+            self._pdf_printer.finished.disconnect(on_finished)
+        return result[0]
+
     def export_word(self):
         """Export current document to Word."""
         path, _ = QFileDialog.getSaveFileName(
@@ -769,6 +1124,7 @@ class MainWindow(QMainWindow):
         if not path:
             return
         try:
+            self._flush_wysiwyg()
             text = self.editor.toPlainText()
             self.word_exporter.export(text, Path(path))
             self.status.showMessage(f"已导出 Word: {path}", 3000)
@@ -776,6 +1132,37 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "导出失败", f"导出 Word 时出错:\n{str(e)}")
 
+    def recover_autosave(self) -> bool:
+        """启动时检查自动保存日志，询问是否恢复上次未保存的内容"""
+        for doc in find_recoverable(AUTOSAVE_DIR):
+            name = doc.doc_path.name if doc.doc_path else "未命名"
+            when = datetime.fromtimestamp(doc.saved_at).strftime("%Y-%m-%d %H:%M")
+            resp = QMessageBox.question(
+                self, "恢复未保存的内容",
+                f"发现 {name} 在 {when} 未保存的更改，是否恢复？",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            )
+            if resp != QMessageBox.StandardButton.Yes:
+                doc.journal_path.unlink(missing_ok=True)
+                continue
+            self.autosaver.start(doc.doc_path)
+            # 日志的基准是磁盘上的文件，恢复的文本整体记为一次快照
+            self.autosaver.set_paused(True)
+            self.editor.setPlainText(doc.text)
+            self.autosaver.set_paused(False)
+            self._current_file = doc.doc_path
+            self._dirty = True
+            self._update_title()
+            self.render_preview()
+            self._sync_wysiwyg()
+            # 新日志写好之后再删旧日志（同一文件时新日志直接覆盖旧日志）
+            self.autosaver.flush()
+            if doc.journal_path != self.autosaver.journal_path:
+                self.autosaver.remove_journal(doc.journal_path)
+            self.status.showMessage(f"已恢复: {name}", 3000)
+            return True
+        return False
+
     def _update_title(self):
         name = self._current_file.name if self._current_file else "未命名"
         star = "*" if self._dirty else ""
@@ -860,7 +1247,7 @@ class MainWindow(QMainWindow):
                 )
         
         # 触发预览更新
-        self._render_timer.start()
+        self._schedule_render()
         self.status.showMessage(f"已插入图片: {filename}", 3000)
             
     def _setup_drag_drop(self):
@@ -945,7 +1332,7 @@ class MainWindow(QMainWindow):
             cursor.insertText(markdown_image)
             
             # 触发预览更新
-            self._render_timer.start()
+            self._schedule_render()
             self.status.showMessage(f"已插入图片: {filename} (拖放)", 3000)
             
             print(f"✅ 拖放成功: {filename}")  # 调试信息
@@ -961,4 +1348,7 @@ class MainWindow(QMainWindow):
             if not ok:
                 event.ignore()
                 return
+        self._cancel_file_load()
+        # 已保存或用户选择放弃，日志不再需要
+        self.autosaver.shutdown(discard=True)
         event.accept()
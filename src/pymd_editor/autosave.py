@@ -0,0 +1,371 @@
+"""
+Crash-safe autosave.
+
+Every open document has a journal in the autosave directory.  The first
+line is a header naming the base text, either the document's file on disk
+(identified by mtime and size) or an inline snapshot; every later line is
+one edit ``{"at": i, "del": n, "ins": s}`` against the text so far, with
+offsets in UTF-16 code units like QTextDocument positions.  The edits are
+the document's own ``contentsChange`` notifications, collected on the UI
+thread and appended and fsynced each tick, so a tick costs what changed,
+not the document size.  Once the appended edits outgrow a fraction of the
+document the writer asks for one full copy of the text and compacts the
+journal into a single snapshot written with :func:`atomic_write_bytes`, so
+a crash leaves either the old or the new journal, never a torn one.  A
+half-written last line is ignored on replay.
+
+Journals are written on a single worker thread.  A journal is deleted when
+its document is saved or deliberately discarded; any journal found at
+startup holds unsaved work (see :func:`find_recoverable`).  Each journal
+is guarded by a ``.lock`` file naming its owner, so journals of another
+running instance are never offered for recovery; a crashed owner's lock
+is stale and taken over.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from PyQt6.QtCore import QLockFile, QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QTextCursor, QTextDocument
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+_VERSION = 2  # 1: edit offsets in code points
+# Mode a plain open() would give a new file; mkstemp always creates 0600
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_NEW_FILE_MODE = 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write *data* to *path* through a temp file and ``os.replace``.
+
+    Readers (and a crash) see either the previous content or the new one.
+    A symlink is followed, so its target is replaced rather than the link,
+    and the file keeps its permission bits.
+    """
+    path = Path(path).resolve()
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = _NEW_FILE_MODE
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = "utf-8") -> None:
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def _read_text(path: Path) -> str:
+    # Same newline handling as MainWindow.load_file
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class DocumentJournal:
+    """Edit journal of one document; all methods run on the writer thread."""
+
+    def __init__(self, journal_path: Path, doc_path: Path | None, base_text: str | None,
+                 compact_ratio: float = 0.5, min_compact_bytes: int = 256 * 1024):
+        self.journal_path = journal_path
+        self.doc_path = doc_path
+        self.compact_ratio = compact_ratio
+        self.min_compact_bytes = min_compact_bytes
+        # Text the first edit applies to; None until read from doc_path
+        self._base = base_text
+        self._started = False
+        self._appended = 0
+        # Set once the edits outgrow the document; the next tick sends a snapshot
+        self.wants_snapshot = False
+
+    def record(self, edits: list[tuple[int, int, str]], length: int) -> None:
+        """Append *edits* ``(at, removed, inserted)``; *length* is the text's
+        UTF-16 length after them."""
+        if not edits:
+            return
+        if not self._started:
+            self._start()
+        data = b"".join(
+            json.dumps({"at": at, "del": removed, "ins": inserted}, ensure_ascii=False).encode("utf-8") + b"\n"
+            for at, removed, inserted in edits
+        )
+        with open(self.journal_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._appended += len(data)
+        if self._appended > max(self.min_compact_bytes, length * self.compact_ratio):
+            self.wants_snapshot = True
+
+    def snapshot(self, text: str) -> None:
+        """Replace the journal with *text* (compaction, or after a wholesale change)."""
+        if not self._started and text == self._base_text():
+            return
+        self._base = None
+        self._compact(text)
+
+    def discard(self) -> None:
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+        self._started = False
+
+    def _base_text(self) -> str:
+        if self._base is None:
+            self._base = _read_text(self.doc_path) if self.doc_path else ""
+        return self._base
+
+    def _start(self):
+        base = self._base_text()
+        self._base = None  # the header holds or names it from here on
+        # Edits are relative to the file on disk while it still matches
+        if self.doc_path is not None:
+            try:
+                st = self.doc_path.stat()
+                if _read_text(self.doc_path) == base:
+                    self._write_header({"base": "file", "mtime_ns": st.st_mtime_ns, "size": st.st_size})
+                    return
+            except (OSError, UnicodeDecodeError):
+                pass
+        self._compact(base)
+
+    def _compact(self, text: str):
+        self._write_header({"base": "inline", "text": text})
+        self.wants_snapshot = False
+
+    def _write_header(self, fields: dict):
+        header = {"v": _VERSION, "path": str(self.doc_path) if self.doc_path else None,
+                  "time": time.time(), **fields}
+        data = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n"
+        atomic_write_bytes(self.journal_path, data)
+        self._started = True
+        self._appended = 0
+
+
+@dataclass
+class RecoveredDocument:
+    journal_path: Path
+    doc_path: Path | None
+    text: str
+    saved_at: float
+
+
+def replay_journal(journal_path: Path) -> RecoveredDocument | None:
+    """Rebuild the text recorded in *journal_path*, or None if it is unusable."""
+    try:
+        with open(journal_path, "rb") as f:
+            lines = f.read().split(b"\n")
+        header = json.loads(lines[0])
+        version = header.get("v")
+        if version not in (1, _VERSION):
+            return None
+        doc_path = Path(header["path"]) if header.get("path") else None
+        if header["base"] == "inline":
+            text = header["text"]
+        else:
+            st = doc_path.stat()
+            if (st.st_mtime_ns, st.st_size) != (header["mtime_ns"], header["size"]):
+                return None  # the file changed since; the edits no longer apply
+            text = _read_text(doc_path)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    # Edit offsets are code points in version 1, UTF-16 units since
+    codec, width = ("utf-32-le", 4) if version == 1 else ("utf-16-le", 2)
+    units = bytearray(text.encode(codec))
+    for raw in lines[1:]:
+        try:
+            edit = json.loads(raw)
+        except ValueError:
+            break  # torn last line
+        at = edit["at"] * width
+        units[at:at + edit["del"] * width] = edit["ins"].encode(codec)
+    text = units.decode(codec, errors="replace")
+    return RecoveredDocument(journal_path, doc_path, text, header.get("time", 0.0))
+
+
+def lock_journal(journal_path: Path) -> QLockFile | None:
+    """Lock *journal_path* for this process, or None if a live process holds it."""
+    lock = QLockFile(str(journal_path) + LOCK_SUFFIX)
+    # Only a dead owner makes the lock stale, however old it is
+    lock.setStaleLockTime(0)
+    return lock if lock.tryLock(0) else None
+
+
+def find_recoverable(directory: Path) -> list[RecoveredDocument]:
+    """Journals left by a crash whose text differs from the saved file, newest first.
+
+    Journals still locked by a running instance (this one included) are skipped.
+    """
+    found = []
+    for journal_path in Path(directory).glob(f"*{JOURNAL_SUFFIX}"):
+        lock = lock_journal(journal_path)
+        if lock is None:
+            continue
+        try:
+            doc = replay_journal(journal_path)
+            if doc is None:
+                continue
+            try:
+                if doc.doc_path is not None and _read_text(doc.doc_path) == doc.text:
+                    journal_path.unlink()
+                    continue
+            except (OSError, UnicodeDecodeError):
+                pass
+            found.append(doc)
+        finally:
+            lock.unlock()
+    return sorted(found, key=lambda d: d.saved_at, reverse=True)
+
+
+def journal_path_for(directory: Path, doc_path: Path | None) -> Path:
+    if doc_path is None:
+        name = f"untitled-{os.getpid()}-{time.time_ns()}"
+    else:
+        name = hashlib.sha1(str(Path(doc_path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return Path(directory) / f"{name}{JOURNAL_SUFFIX}"
+
+
+class Autosaver(QObject):
+    """Journal the editor's document every *interval_ms* on a writer thread."""
+
+    failed = pyqtSignal(str)
+
+    def __init__(self, document: QTextDocument, directory: Path, interval_ms: int, parent=None):
+        super().__init__(parent)
+        self._document = document
+        self.directory = Path(directory)
+        self._journal: DocumentJournal | None = None
+        self._lock: QLockFile | None = None
+        # Edits since the last tick, and the text length (UTF-16) after them
+        self._edits: list[tuple[int, int, str]] = []
+        self._length = document.characterCount() - 1
+        self._resync = False
+        self._paused = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pymd-autosave")
+        document.contentsChange.connect(self._on_contents_change)
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.flush)
+        self._timer.start()
+
+    @property
+    def journal_path(self) -> Path | None:
+        return self._journal.journal_path if self._journal else None
+
+    def start(self, doc_path: Path | None, base_text: str | None = None) -> None:
+        """Begin journaling a freshly loaded or saved document.
+
+        *base_text* is the text as on disk; if omitted it is read from
+        *doc_path* on the writer thread when the first edit is journaled.
+        Either way it must be the editor's current text, since later edits
+        are journaled against it.  The previous document's journal is
+        deleted.
+        """
+        self.discard()
+        journal_path = journal_path_for(self.directory, doc_path)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            self.failed.emit(str(e))
+        self._lock = lock_journal(journal_path)
+        if self._lock is None and doc_path is not None:
+            # Another running instance journals the same file: keep our own
+            journal_path = journal_path.with_name(
+                f"{journal_path.stem}-{os.getpid()}-{time.time_ns()}{JOURNAL_SUFFIX}")
+            self._lock = lock_journal(journal_path)
+        self._journal = DocumentJournal(journal_path, doc_path, base_text)
+        self._edits = []
+        self._length = self._document.characterCount() - 1
+        self._resync = False
+
+    def discard(self) -> None:
+        """Delete the current journal (the document was saved or abandoned)."""
+        if self._journal is not None:
+            self._submit(self._journal.discard)
+            self._journal = None
+        if self._lock is not None:
+            # Released after the journal is gone, on the writer thread
+            self._submit(self._lock.unlock)
+            self._lock = None
+
+    def remove_journal(self, journal_path: Path) -> None:
+        """Delete another journal once everything queued so far is written."""
+        self._submit(lambda: Path(journal_path).unlink(missing_ok=True))
+
+    def set_paused(self, paused: bool) -> None:
+        """Stop journaling while the document is being replaced wholesale.
+
+        Changes made while paused are journaled as one snapshot, unless
+        :meth:`start` begins a new journal first.
+        """
+        self._paused = paused
+
+    def flush(self) -> None:
+        if self._paused or self._journal is None:
+            return
+        if self._resync or self._journal.wants_snapshot:
+            self._resync = False
+            self._edits = []
+            self._submit(self._journal.snapshot, self._document.toPlainText())
+        elif self._edits:
+            edits, self._edits = self._edits, []
+            self._submit(self._journal.record, edits, self._length)
+
+    def shutdown(self, discard: bool) -> None:
+        self._timer.stop()
+        if discard:
+            self.discard()
+        else:
+            self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        length = self._document.characterCount() - 1
+        # Qt may count the final paragraph separator in both numbers (e.g. on
+        # setPlainText), so the removed count follows from the length change
+        added = max(0, min(added, length - position))
+        removed = added - (length - self._length)
+        self._length = length
+        if self._paused or self._journal is None or self._resync:
+            self._resync = self._journal is not None
+            return
+        if removed < 0:
+            self._resync = True  # a notification we cannot map
+            return
+        if removed == 0 and added == 0:
+            return
+        cursor = QTextCursor(self._document)
+        cursor.setPosition(position)
+        cursor.setPosition(position + added, QTextCursor.MoveMode.KeepAnchor)
+        self._edits.append((position, removed, cursor.selection().toPlainText()))
+
+    def _submit(self, fn, *args):
+        def run():
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                fn(*args)
+            except Exception as e:  # noqa: BLE001 - reported, never raised on the writer
+                self.failed.emit(str(e))
+        self._executor.submit(run)
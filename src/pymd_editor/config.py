@@ -7,6 +7,20 @@ APP_ID = "com.pymd.editor"
 APP_VERSION = "0.4.0"
 UPDATE_MANIFEST_URL = "https://example.com/pymd-editor/releases/latest.json"
 DEFAULT_DOWNLOAD_DIR = Path.home() / "Downloads" / "PyMDEditor"
+# Memory budget of the shared render cache (renderer.RenderCache)
+RENDER_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Preview keeps only blocks near the viewport mounted above this many blocks
+PREVIEW_VIRTUALIZE_BLOCKS = 800
+# Files at least this large are read in chunks on a background thread
+# (large-file mode: no source highlighting)
+LARGE_FILE_BYTES = 8 * 1024 * 1024
+LARGE_FILE_CHUNK_BYTES = 1024 * 1024
+# Above this many characters the preview renders only the lines around the cursor
+PREVIEW_SECTION_CHARS = 2 * 1024 * 1024
+PREVIEW_SECTION_LINES = 2000
+# Edit journals of unsaved documents (autosave.Autosaver)
+AUTOSAVE_DIR = Path.home() / ".pymd-editor" / "autosave"
+AUTOSAVE_INTERVAL_MS = 5000
 
 
 def get_version() -> str:
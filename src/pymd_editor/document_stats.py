@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QTextDocument
+
+# Han, kana and hangul are counted per character, not as words
+_CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RE = re.compile(f"[{_CJK_CHARS}]")
+_WORD_RE = re.compile(f"[^\\W{_CJK_CHARS}]+")
+_HEADING_RE = re.compile(r" {0,3}#{1,6}(?:\s|$)")
+# A fence line, possibly inside block quotes and list items (as in markdown_normalize)
+_FENCE_RE = re.compile(r"[ \t>]*(`{3,}|~{3,})")
+# Qt counts positions in UTF-16; these take two units but are one character
+_ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
+
+
+@dataclass(frozen=True)
+class TextStats:
+    chars: int = 0
+    words: int = 0
+    cjk: int = 0
+    lines: int = 1
+    headings: int = 0
+
+
+def line_stats(line: str, fence: str | None = None) -> tuple[int, int, int, int, str | None]:
+    """(words, cjk characters, is ATX heading, astral characters, fence after) for one line.
+
+    *fence* is the marker of the code fence open before the line; ``#``
+    lines inside fenced code are not headings.  The last item is the fence
+    still open after the line.
+    """
+    m = _FENCE_RE.match(line)
+    if fence is None:
+        heading = 1 if m is None and _HEADING_RE.match(line) else 0
+        fence = m.group(1) if m else None
+    else:
+        heading = 0
+        if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) \
+                and not line[m.end():].strip():
+            fence = None
+    return (
+        len(_WORD_RE.findall(line)),
+        len(_CJK_RE.findall(line)),
+        heading,
+        0 if line.isascii() else len(_ASTRAL_RE.findall(line)),
+        fence,
+    )
+
+
+class DocumentStats(QObject):
+    """Keep character, word and heading counts of a QTextDocument current.
+
+    Counts are kept per block (= line in a QPlainTextEdit) and updated from
+    ``contentsChange(position, removed, added)``, so an edit only rescans the
+    lines it touched instead of copying the whole text.  Each line also
+    keeps the code fence open after it; when an edit opens or closes a
+    fence, the following lines are rescanned until the states agree again.
+    """
+
+    changed = pyqtSignal(object)  # TextStats
+
+    def __init__(self, document: QTextDocument, parent=None):
+        super().__init__(parent)
+        self._document = document
+        self._lines: list[tuple[int, int, int, int, str | None]] = []
+        self._words = self._cjk = self._headings = self._astral = 0
+        self._rebuild()
+        document.contentsChange.connect(self._on_contents_change)
+
+    def stats(self) -> TextStats:
+        return TextStats(
+            chars=self._document.characterCount() - 1 - self._astral,
+            words=self._words,
+            cjk=self._cjk,
+            lines=self._document.blockCount(),
+            headings=self._headings,
+        )
+
+    def _rebuild(self):
+        block = self._document.begin()
+        self._lines = []
+        fence = None
+        while block.isValid():
+            stats = line_stats(block.text(), fence)
+            self._lines.append(stats)
+            fence = stats[4]
+            block = block.next()
+        self._words = sum(s[0] for s in self._lines)
+        self._cjk = sum(s[1] for s in self._lines)
+        self._headings = sum(s[2] for s in self._lines)
+        self._astral = sum(s[3] for s in self._lines)
+
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        doc = self._document
+        end = min(position + added, doc.characterCount() - 1)
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(end).blockNumber()
+        delta = doc.blockCount() - len(self._lines)
+        old_last = last - delta
+        if first < 0 or last < first or old_last < first or old_last >= len(self._lines):
+            # Change notifications we cannot map (e.g. during a reset)
+            self._rebuild()
+        else:
+            new = []
+            fence = self._lines[first - 1][4] if first > 0 else None
+            block = doc.findBlockByNumber(first)
+            for _ in range(last - first + 1):
+                new.append(line_stats(block.text(), fence))
+                fence = new[-1][4]
+                block = block.next()
+            # Lines after the edit whose fence state changed (a fence was
+            # opened or closed) are rescanned until the states agree again
+            old_fence = self._lines[old_last][4]
+            end = old_last + 1
+            while fence != old_fence and end < len(self._lines) and block.isValid():
+                old_fence = self._lines[end][4]
+                new.append(line_stats(block.text(), fence))
+                fence = new[-1][4]
+                block = block.next()
+                end += 1
+            for words, cjk, heading, astral, _ in self._lines[first:end]:
+                self._words -= words
+                self._cjk -= cjk
+                self._headings -= heading
+                self._astral -= astral
+            for words, cjk, heading, astral, _ in new:
+                self._words += words
+                self._cjk += cjk
+                self._headings += heading
+                self._astral += astral
+            self._lines[first:end] = new
+        self.changed.emit(self.stats())
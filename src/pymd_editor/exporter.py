@@ -5,7 +5,8 @@ from pathlib import Path
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.enum.style import WD_STYLE_TYPE
-import markdown2
+
+from .renderer import get_backend
 
 
 class WordExporter:
@@ -16,7 +17,7 @@ class WordExporter:
         doc = Document()
         
         # Parse markdown to get structure
-        html = markdown2.markdown(markdown_text or "", extras=["fenced-code-blocks", "tables"])
+        html = get_backend().render(markdown_text or "")
         
         # Simple approach: convert markdown to plain paragraphs
         # For MVP, we'll just write the markdown text directly
@@ -77,10 +78,7 @@ class PDFExporter:
             ) from e
         
         # Convert markdown to HTML
-        html_body = markdown2.markdown(
-            markdown_text or "",
-            extras=["fenced-code-blocks", "tables", "strike", "task_list"]
-        )
+        html_body = get_backend().render(markdown_text or "")
         
         css = DARK_PDF_CSS if dark else LIGHT_PDF_CSS
         
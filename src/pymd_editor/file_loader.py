@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import codecs
+import os
+from pathlib import Path
+from typing import Iterator
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+def iter_text_chunks(path: Path, chunk_bytes: int) -> Iterator[tuple[str, int]]:
+    """Yield ``(text, bytes_read)`` for a UTF-8 file, *chunk_bytes* at a time.
+
+    Multi-byte characters split across chunks are decoded whole, and line
+    endings are normalised to ``\\n`` as ``open()`` in text mode would.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending_cr = ""
+    done = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_bytes)
+            final = not data
+            done += len(data)
+            text = pending_cr + decoder.decode(data, final)
+            # A chunk ending in \r may be the first half of \r\n
+            pending_cr = "" if final or not text.endswith("\r") else "\r"
+            if pending_cr:
+                text = text[:-1]
+            if "\r" in text:
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            if text or final:
+                yield text, done
+            if final:
+                return
+
+
+class ChunkedFileReader(QThread):
+    """Read a large text file on a worker thread and hand it over in chunks.
+
+    The UI appends every ``chunk_read`` to the editor; between chunks the
+    event loop keeps running, so progress can be shown and the load
+    cancelled with :meth:`requestInterruption`.
+    """
+
+    chunk_read = pyqtSignal(str, int)  # text, bytes read so far
+    finished_reading = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, path: Path, chunk_bytes: int, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.total_bytes = os.path.getsize(path)
+
+    def run(self):
+        try:
+            for text, done in iter_text_chunks(self.path, self.chunk_bytes):
+                if self.isInterruptionRequested():
+                    return
+                if text:
+                    self.chunk_read.emit(text, done)
+        except (OSError, UnicodeDecodeError) as e:
+            self.failed.emit(str(e))
+            return
+        self.finished_reading.emit()
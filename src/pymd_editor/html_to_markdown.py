@@ -1,298 +1,532 @@
 ﻿"""
 HTML到Markdown转换器
 提供更准确的HTML内容转换为Markdown格式的功能
+
+输入只扫描一遍：一个预编译的正则按顺序切出标签，标签处理函数按标签名
+预先建好分发表；输出追加到列表缓冲区，最后 join 一次，避免反复拼接字符串。
+
+每种结构只有一种写法（见 markdown_normalize），渲染后再转换回来得到的
+文本不变，WYSIWYG 页面没有改动时不会产生编辑。
 """
 
 import re
-from html.parser import HTMLParser
-from typing import List, Dict, Optional
+from html import unescape
+from typing import Dict, List, Optional
+
+from .markdown_normalize import normalize_markdown
+from .renderer import math_spans
+
+# 注释、script/style 整段跳过；其余标签交给分发表，标签之间是文本
+_TOKEN_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<(script|style)\b[^>]*>.*?</\1\s*>'
+    r'|<(/?)([a-zA-Z][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>'
+    r'|<[!?][^>]*>',
+    re.DOTALL | re.IGNORECASE,
+)
+_ATTR_RE = re.compile(r'''([^\s/>"'=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+_SPACE_RE = re.compile(r'\s+')
+# 文本里会被当成标签或实体的 < 和 &
+_TAG_START_RE = re.compile(r'<(?=[A-Za-z/!?])')
+_ENTITY_LIKE_RE = re.compile(r'&(?=#?\w+;)')
+_LANGUAGE_RE = re.compile(r'\blanguage-([\w+#.-]+)')
+# 文本里的字面量 Markdown 符号加反斜杠，转换回来后仍是文本；
+# code-friendly 下 _ 不是强调，\[ 是公式定界符，所以这两个不转义
+_BACKSLASH_RE = re.compile(r'\\(?=[!-/:-@\[-`{-~]|$)')
+_INLINE_META_RE = re.compile(r'[*`]|\](?=\()')
+# 行首会被当成标题、引用、列表或分隔线的文本
+_LINE_START_RE = re.compile(r'^(?:[#>]|[-+](?=\s|$|-+\s*$)|(\d+)(?=\.(?:\s|$)))')
+
+_BR = '\x00'  # 行内缓冲区里的 <br>，生成块时换成硬换行
+# 行内缓冲区里文本的 $；生成块时只有会成为公式定界符的才写成 &#36;
+# （markdown2 不认 \$，反斜杠会留在 Word/PDF 里）
+_DOLLAR = '\x01'
+_ITEM_INDENT = '    '  # 列表项后续行的缩进
+_ALIGN_RULES = {'left': ':---', 'center': ':---:', 'right': '---:'}
+# 没有 Markdown 写法的行内标签，原样保留
+_RAW_INLINE_TAGS = frozenset({
+    'kbd', 'sup', 'sub', 'mark', 'u', 'ins', 'abbr', 'small', 'cite', 'q', 'dfn',
+    'var', 'samp', 'time',
+})
+
+
+def _escape_inline(text: str) -> str:
+    if '\\' in text:
+        text = _BACKSLASH_RE.sub(r'\\\\', text)
+    text = _INLINE_META_RE.sub(lambda m: '\\' + m.group(), text)
+    if '$' in text:
+        text = text.replace('$', _DOLLAR)
+    if '~~' in text:
+        # markdown2 不认 \~，用实体拆开删除线标记
+        text = text.replace('~~', '~&#126;')
+    return text
+
+
+def _resolve_dollars(text: str) -> str:
+    """文本里的 $ 还原；和别的 $ 组成公式的写成实体"""
+    # $$ 公式可以跨段落，文本里的 $$ 总是拆开
+    text = text.replace(_DOLLAR * 2, '&#36;' * 2)
+    while _DOLLAR in text:
+        probe = text.replace(_DOLLAR, '$').replace(_BR, '\n')
+        spans = [(start, end) for start, end in math_spans(probe) if _DOLLAR in text[start:end]]
+        if not spans:
+            break
+        # 实体替换后位置会变，从后往前改
+        for start, end in reversed(spans):
+            text = text[:start] + text[start:end].replace(_DOLLAR, '&#36;') + text[end:]
+    return text.replace(_DOLLAR, '$')
+
 
+def _escape_line_start(line: str) -> str:
+    m = _LINE_START_RE.match(line)
+    if m is None:
+        return line
+    if m.group(1):
+        return m.group(1) + '\\' + line[m.end():]
+    return '\\' + line
 
-class HTMLToMarkdownConverter(HTMLParser):
+
+def _parse_attrs(attrs: str) -> Dict[str, Optional[str]]:
+    """解析标签的属性串；只有用到属性的标签才会调用"""
+    result = {}
+    for m in _ATTR_RE.finditer(attrs):
+        name, double, single, bare = m.groups()
+        value = double if double is not None else single if single is not None else bare
+        if value and '&' in value:
+            value = unescape(value)
+        result.setdefault(name.lower(), value)
+    return result
+
+
+class HTMLToMarkdownConverter:
     """HTML到Markdown转换器"""
     
     def __init__(self):
-        super().__init__()
-        self.reset()
+        self._reset_state()
+        
+    def _reset_state(self):
         self.markdown_lines: List[str] = []
-        self.current_line = ""
-        self.tag_stack: List[Dict] = []
-        self.list_stack: List[Dict] = []
-        self.in_pre = False
-        self.in_code = False
-        self.table_data: List[List[str]] = []
-        self.current_row: List[str] = []
-        self.in_table = False
-        
-    def handle_starttag(self, tag: str, attrs: list):
-        """处理开始标签"""
-        attrs_dict = dict(attrs)
-        
-        if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            self._flush_line()
-            level = int(tag[1])
-            self.tag_stack.append({'tag': 'header', 'level': level})
-            
-        elif tag == 'p':
-            self._flush_line()
-            self.tag_stack.append({'tag': 'paragraph'})
-            
-        elif tag == 'br':
-            self.current_line += '  \n'  # Markdown换行
-            
-        elif tag in ['strong', 'b']:
-            self.tag_stack.append({'tag': 'bold'})
-            self.current_line += '**'
+        self.line_parts: List[str] = []  # 当前块的行内片段
+        self.tag_stack: List[list] = []  # 行内标签：[类型, 在 line_parts 中的位置, 附加信息]
+        self.containers: List[list] = []  # 引用和列表项：[首行前缀, 后续行前缀, 首行已输出, 类型]
+        self.list_stack: List[list] = []  # [是否有序, 计数]
+        self.need_blank = False  # 下一个块之前要空一行
+        self.table: Optional[List[List[str]]] = None
+        self.table_align: List[Optional[str]] = []
+        self.math_depth = 0
+        self.code_depth = 0
+        self.pre_parts: Optional[List[str]] = None  # <pre> 内原样保留的文本
+        self.pre_language = ''
+        
+    def handle_starttag(self, tag: str, attrs: str):
+        """处理开始标签（attrs 为未解析的属性串）"""
+        if self.math_depth:
+            if tag == 'span':
+                self.math_depth += 1
+            return
+        handler = self._START_HANDLERS.get(tag)
+        if handler is not None:
+            handler(self, tag, attrs)
             
-        elif tag in ['em', 'i']:
-            self.tag_stack.append({'tag': 'italic'})
-            self.current_line += '*'
+    def handle_endtag(self, tag: str):
+        """处理结束标签"""
+        if self.math_depth:
+            if tag == 'span':
+                self.math_depth -= 1
+            return
+        handler = self._END_HANDLERS.get(tag)
+        if handler is not None:
+            handler(self, tag)
             
-        elif tag == 'code':
-            if not self.in_pre:
-                self.tag_stack.append({'tag': 'inline_code'})
-                self.current_line += '`'
-                self.in_code = True
+    def handle_data(self, data: str):
+        """处理文本数据"""
+        if self.math_depth:
+            return
+        if '&' in data:
+            data = unescape(data)
+        if self.pre_parts is not None:
+            self.pre_parts.append(data)
+            return
+        # 清理多余的空白符，但保留单个空格（包括跨片段的）
+        data = _SPACE_RE.sub(' ', data)
+        if data[:1] == ' ' and self.line_parts and self.line_parts[-1][-1:] == ' ':
+            data = data[1:]
+        if not self.code_depth:
+            # 转换回来后仍是文本，而不是标签或实体
+            if '&' in data:
+                data = _ENTITY_LIKE_RE.sub('&amp;', data)
+            if '<' in data:
+                data = _TAG_START_RE.sub('&lt;', data)
+            data = _escape_inline(data)
+        self.line_parts.append(data)
+        
+    # ---- 输出 ----
+    
+    def _prefix(self) -> str:
+        """当前行的容器前缀；列表项只在第一行写标记"""
+        parts = []
+        for container in self.containers:
+            parts.append(container[1] if container[2] else container[0])
+            container[2] = True
+        return ''.join(parts)
+        
+    def _blank_line(self):
+        if self.need_blank and self.markdown_lines:
+            self.markdown_lines.append(''.join(c[1] for c in self.containers).rstrip())
+        self.need_blank = False
+        
+    def _emit(self, lines: List[str]):
+        """输出一个块，块与块之间空一行"""
+        self._blank_line()
+        for line in lines:
+            prefix = self._prefix()
+            self.markdown_lines.append(prefix + line if line else prefix.rstrip())
+        self.need_blank = True
+        
+    def _inline_text(self, resolve: bool = True) -> str:
+        """取出行内缓冲区的文本；<br> 变成硬换行
+
+        resolve=False 时文本的 $ 留给调用方（表格按整行处理）。
+        """
+        if not self.line_parts:
+            return ''
+        text = ''.join(self.line_parts)
+        self.line_parts = []
+        if _DOLLAR in text and resolve:
+            text = _resolve_dollars(text)
+        if _BR in text:
+            lines = [_escape_line_start(line.strip()) for line in text.split(_BR)]
+            return '  \n'.join(line for line in lines if line)
+        return _escape_line_start(text.strip())
+        
+    def _flush_line(self, paragraph: bool = False):
+        """把行内缓冲区作为一个段落输出
+
+        列表项里不在 <p> 中的文本是紧凑列表的一项，后面的子列表不空行。
+        """
+        text = self._inline_text()
+        if text:
+            self._emit(text.split('\n'))
+            if not paragraph and self.containers and self.containers[-1][3] == 'item':
+                self.need_blank = False
                 
-        elif tag == 'pre':
-            self._flush_line()
-            self.tag_stack.append({'tag': 'code_block'})
-            self.in_pre = True
-            self.markdown_lines.append('```')
-            
-        elif tag == 'blockquote':
-            self._flush_line()
-            self.tag_stack.append({'tag': 'blockquote'})
-            
-        elif tag == 'a':
-            href = attrs_dict.get('href', '')
-            self.tag_stack.append({'tag': 'link', 'href': href})
-            self.current_line += '['
+    def _open_container(self, first: str, rest: str, kind: str):
+        self._flush_line()
+        self._blank_line()
+        self.containers.append([first, rest, False, kind])
+        
+    def _close_container(self, kind: str):
+        self._flush_line()
+        if self.containers and self.containers[-1][3] == kind:
+            self.containers.pop()
             
-        elif tag in ['ul', 'ol']:
-            self._flush_line()
-            list_type = 'ordered' if tag == 'ol' else 'unordered'
-            self.list_stack.append({'type': list_type, 'counter': 0})
+    def _top_is(self, kind: str) -> bool:
+        return bool(self.tag_stack) and self.tag_stack[-1][0] == kind
+        
+    def _open_inline(self, kind: str, marker: str, extra=None):
+        self.tag_stack.append([kind, len(self.line_parts), extra])
+        self.line_parts.append(marker)
+        
+    def _close_emphasis(self, kind: str, marker: str):
+        """闭合强调标记；首尾空白移到标记外，空的强调直接去掉"""
+        if not self._top_is(kind):
+            return
+        start = self.tag_stack.pop()[1]
+        inner = ''.join(self.line_parts[start + 1:])
+        del self.line_parts[start:]
+        content = inner.strip()
+        if not content:
+            self.line_parts.append(inner)
+            return
+        if inner[0] == ' ' and not (self.line_parts and self.line_parts[-1][-1:] == ' '):
+            self.line_parts.append(' ')
+        self.line_parts.append(marker + content + marker)
+        if inner[-1] == ' ':
+            self.line_parts.append(' ')
             
-        elif tag == 'li':
-            self._flush_line()
-            if self.list_stack:
-                list_info = self.list_stack[-1]
-                if list_info['type'] == 'ordered':
-                    list_info['counter'] += 1
-                    prefix = f"{list_info['counter']}. "
-                else:
-                    prefix = "- "
-                
-                indent = "  " * (len(self.list_stack) - 1)
-                self.current_line = indent + prefix
-                
-        elif tag == 'table':
-            self._flush_line()
-            self.in_table = True
-            self.table_data = []
+    # ---- 开始标签 ----
+    
+    def _start_raw_inline(self, tag, attrs):
+        self.line_parts.append(f'<{tag}{attrs}>')
+        
+    def _start_span(self, tag, attrs):
+        attrs_dict = _parse_attrs(attrs)
+        if 'pymd-math' in (attrs_dict.get('class') or ''):
+            # 公式占位符：还原原始 TeX 源码，忽略 MathJax 生成的内容
+            self.line_parts.append(attrs_dict.get('data-src') or '')
+            self.math_depth = 1
             
-        elif tag == 'tr':
-            if self.in_table:
-                self.current_row = []
-                
-        elif tag == 'td' or tag == 'th':
-            if self.in_table:
-                # 开始新的单元格
-                pass
+    def _start_block(self, tag, attrs):
+        self._flush_line()
+        
+    def _start_br(self, tag, attrs):
+        self.line_parts.append(_BR)
+        
+    def _start_hr(self, tag, attrs):
+        self._flush_line()
+        self._emit(['---'])
+        
+    def _start_bold(self, tag, attrs):
+        self._open_inline('bold', '**')
+        
+    def _start_italic(self, tag, attrs):
+        self._open_inline('italic', '*')
+        
+    def _start_strike(self, tag, attrs):
+        self._open_inline('strike', '~~')
+        
+    def _start_code(self, tag, attrs):
+        if self.pre_parts is None:
+            self._open_inline('inline_code', '`')
+            self.code_depth += 1
+        else:
+            m = _LANGUAGE_RE.search(_parse_attrs(attrs).get('class') or '')
+            if m:
+                self.pre_language = m.group(1)
                 
-        elif tag == 'img':
-            src = attrs_dict.get('src', '')
-            alt = attrs_dict.get('alt', '')
-            title = attrs_dict.get('title', '')
-            
-            if title:
-                self.current_line += f'![{alt}]({src} "{title}")'
+    def _start_pre(self, tag, attrs):
+        self._flush_line()
+        self.pre_parts = []
+        self.pre_language = ''
+        
+    def _start_blockquote(self, tag, attrs):
+        self._open_container('> ', '> ', 'quote')
+        
+    def _start_link(self, tag, attrs):
+        attrs_dict = _parse_attrs(attrs)
+        href = attrs_dict.get('href')
+        title = attrs_dict.get('title')
+        if href and title:
+            href += ' "' + title.replace('"', '&quot;') + '"'
+        self._open_inline('link', '[' if href else '', href)
+        
+    def _start_list(self, tag, attrs):
+        self._flush_line()
+        self._blank_line()  # 列表项会清掉 need_blank，空行要先写出
+        count = 0
+        if tag == 'ol':
+            start = _parse_attrs(attrs).get('start') or ''
+            if start.isdigit():
+                count = int(start) - 1  # 保留起始编号
+        self.list_stack.append([tag == 'ol', count])
+        
+    def _start_list_item(self, tag, attrs):
+        self._flush_line()
+        self.need_blank = False  # 列表项之间不空行
+        if self.list_stack:
+            list_info = self.list_stack[-1]
+            if list_info[0]:
+                list_info[1] += 1
+                marker = f"{list_info[1]}. "
             else:
-                self.current_line += f'![{alt}]({src})'
-                
-    def handle_endtag(self, tag: str):
-        """处理结束标签"""
-        if tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'header':
-                level = self.tag_stack[-1]['level']
-                header_line = '#' * level + ' ' + self.current_line
-                self.markdown_lines.append(header_line)
-                self.current_line = ""
-                self.tag_stack.pop()
-                
-        elif tag == 'p':
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'paragraph':
-                self._flush_line()
-                self.tag_stack.pop()
-                
-        elif tag in ['strong', 'b']:
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'bold':
-                self.current_line += '**'
-                self.tag_stack.pop()
-                
-        elif tag in ['em', 'i']:
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'italic':
-                self.current_line += '*'
-                self.tag_stack.pop()
-                
-        elif tag == 'code':
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'inline_code':
-                self.current_line += '`'
-                self.tag_stack.pop()
-                self.in_code = False
-                
-        elif tag == 'pre':
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'code_block':
-                self.markdown_lines.append('```')
-                self.tag_stack.pop()
-                self.in_pre = False
-                
-        elif tag == 'blockquote':
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'blockquote':
-                # 处理引用内容
-                self._process_blockquote()
-                self.tag_stack.pop()
-                
-        elif tag == 'a':
-            if self.tag_stack and self.tag_stack[-1]['tag'] == 'link':
-                href = self.tag_stack[-1]['href']
-                self.current_line += f']({href})'
-                self.tag_stack.pop()
-                
-        elif tag in ['ul', 'ol']:
-            if self.list_stack:
-                self.list_stack.pop()
-                self._flush_line()
-                
-        elif tag == 'li':
-            self._flush_line()
-            
-        elif tag == 'table':
-            if self.in_table:
-                self._process_table()
-                self.in_table = False
-                
-        elif tag == 'tr':
-            if self.in_table and self.current_row:
-                self.table_data.append(self.current_row)
-                self.current_row = []
-                
-        elif tag in ['td', 'th']:
-            if self.in_table:
-                self.current_row.append(self.current_line)
-                self.current_line = ""
-                
-    def handle_data(self, data: str):
-        """处理文本数据"""
-        if self.in_pre:
-            self.markdown_lines.append(data)
+                marker = "- "
         else:
-            # 清理多余的空白符，但保留单个空格
-            cleaned_data = re.sub(r'\s+', ' ', data)
-            self.current_line += cleaned_data
-            
-    def _flush_line(self):
-        """将当前行刷新到结果中"""
-        if self.current_line.strip():
-            # 处理引用
-            if any(tag_info.get('tag') == 'blockquote' for tag_info in self.tag_stack):
-                self.current_line = '> ' + self.current_line.strip()
-                
-            self.markdown_lines.append(self.current_line.strip())
-            self.current_line = ""
-        elif self.markdown_lines and self.markdown_lines[-1] != "":
-            # 添加空行
-            self.markdown_lines.append("")
+            marker = "- "
+        self.containers.append([marker, _ITEM_INDENT, False, 'item'])
+        
+    def _start_checkbox(self, tag, attrs):
+        attrs_dict = _parse_attrs(attrs)
+        if (attrs_dict.get('type') or '').lower() == 'checkbox':
+            self.line_parts.append('[x]' if 'checked' in attrs_dict else '[ ]')
             
-    def _process_blockquote(self):
-        """处理引用块"""
-        # 引用内容已经在handle_data中处理，这里只需要添加空行
+    def _start_table(self, tag, attrs):
         self._flush_line()
+        self.table = []
+        self.table_align = []
         
-    def _process_table(self):
-        """处理表格"""
-        if not self.table_data:
-            return
+    def _start_row(self, tag, attrs):
+        if self.table is not None:
+            self.table.append([])
             
-        # 添加表格标题行
-        if self.table_data:
-            header_row = "| " + " | ".join(self.table_data[0]) + " |"
-            self.markdown_lines.append(header_row)
+    def _start_cell(self, tag, attrs):
+        self.line_parts = []
+        if self.table is not None and len(self.table) == 1:
+            self.table_align.append(_parse_attrs(attrs).get('align'))
             
-            # 添加分隔行
-            separator = "| " + " | ".join(["---"] * len(self.table_data[0])) + " |"
-            self.markdown_lines.append(separator)
+    def _start_image(self, tag, attrs):
+        attrs_dict = _parse_attrs(attrs)
+        src = _restore_local_src(attrs_dict.get('src') or '')
+        alt = attrs_dict.get('alt') or ''
+        title = attrs_dict.get('title') or ''
+        if title:
+            self.line_parts.append(f'![{alt}]({src} "{title}")')
+        else:
+            self.line_parts.append(f'![{alt}]({src})')
             
-            # 添加数据行
-            for row in self.table_data[1:]:
-                data_row = "| " + " | ".join(row) + " |"
-                self.markdown_lines.append(data_row)
-                
-        self.table_data = []
+    # ---- 结束标签 ----
+    
+    def _end_heading(self, tag):
+        text = self._inline_text().replace('  \n', ' ')
+        if text:
+            self._emit(['#' * int(tag[1]) + ' ' + text])
+            
+    def _end_paragraph(self, tag):
+        self._flush_line(paragraph=True)
         
-    def convert(self, html: str) -> str:
-        """将HTML转换为Markdown"""
-        self.reset()
-        self.markdown_lines = []
-        self.current_line = ""
-        self.tag_stack = []
-        self.list_stack = []
-        self.in_pre = False
-        self.in_code = False
-        self.table_data = []
-        self.current_row = []
-        self.in_table = False
-        
-        # 清理HTML
-        html = self._clean_html(html)
-        
-        # 解析HTML
-        self.feed(html)
+    def _end_bold(self, tag):
+        self._close_emphasis('bold', '**')
         
-        # 处理剩余内容
-        self._flush_line()
+    def _end_italic(self, tag):
+        self._close_emphasis('italic', '*')
         
-        # 清理结果
-        result = self._clean_markdown('\n'.join(self.markdown_lines))
-        return result
+    def _end_strike(self, tag):
+        self._close_emphasis('strike', '~~')
+        
+    def _end_raw_inline(self, tag):
+        self.line_parts.append(f'</{tag}>')
         
-    def _clean_html(self, html: str) -> str:
-        """清理HTML内容"""
-        # 移除HTML注释
-        html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
+    def _end_code(self, tag):
+        if self._top_is('inline_code'):
+            start = self.tag_stack.pop()[1]
+            code = ''.join(self.line_parts[start + 1:])
+            del self.line_parts[start:]
+            fence = '``' if '`' in code else '`'
+            self.line_parts.append(fence + code + fence if code else '')
+            self.code_depth -= 1
+            
+    def _end_pre(self, tag):
+        if self.pre_parts is None:
+            return
+        code = ''.join(self.pre_parts)
+        self.pre_parts = None
+        if code.endswith('\n'):
+            code = code[:-1]
+        fence = '```'
+        while fence in code:
+            fence += '`'
+        self._emit([fence + self.pre_language] + code.split('\n') + [fence])
         
-        # 移除script和style标签及其内容
-        html = re.sub(r'<(script|style)[^>]*>.*?</\1>', '', html, flags=re.DOTALL | re.IGNORECASE)
+    def _end_blockquote(self, tag):
+        self._close_container('quote')
+        self.need_blank = True
         
-        # 标准化空白符
-        html = re.sub(r'\r\n|\r', '\n', html)
+    def _end_link(self, tag):
+        if self._top_is('link'):
+            href = self.tag_stack.pop()[2]
+            if href:
+                self.line_parts.append(f']({href})')
+                
+    def _end_list(self, tag):
+        self._flush_line()
+        if self.list_stack:
+            self.list_stack.pop()
+        self.need_blank = True
         
-        return html
+    def _end_list_item(self, tag):
+        self._close_container('item')
+        self.need_blank = False
         
-    def _clean_markdown(self, markdown: str) -> str:
-        """清理Markdown内容"""
-        lines = markdown.split('\n')
-        cleaned_lines = []
+    def _end_table(self, tag):
+        if self.table is not None:
+            self._process_table()
+            self.table = None
+        self.line_parts = []
         
-        # 移除多余的空行
-        prev_empty = False
-        for line in lines:
-            if line.strip() == "":
-                if not prev_empty:
-                    cleaned_lines.append("")
-                    prev_empty = True
+    def _end_cell(self, tag):
+        if self.table:
+            # 单元格里的 | （包括代码中的）会被当成列分隔
+            cell = self._inline_text(resolve=False).replace('  \n', ' ').replace('|', '\\|')
+            self.table[-1].append(cell)
+            
+    _START_HANDLERS = {
+        'span': _start_span,
+        **dict.fromkeys(('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'div', 'section',
+                         'figure', 'details', 'dl'), _start_block),
+        'br': _start_br,
+        'hr': _start_hr,
+        'strong': _start_bold, 'b': _start_bold,
+        'em': _start_italic, 'i': _start_italic,
+        **dict.fromkeys(('del', 's', 'strike'), _start_strike),
+        **dict.fromkeys(_RAW_INLINE_TAGS, _start_raw_inline),
+        'code': _start_code,
+        'pre': _start_pre,
+        'blockquote': _start_blockquote,
+        'a': _start_link,
+        'ul': _start_list, 'ol': _start_list,
+        'li': _start_list_item,
+        'input': _start_checkbox,
+        'table': _start_table,
+        'tr': _start_row,
+        'td': _start_cell, 'th': _start_cell,
+        'img': _start_image,
+    }
+    _END_HANDLERS = {
+        **dict.fromkeys(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'), _end_heading),
+        **dict.fromkeys(('p', 'div', 'section', 'figure', 'details', 'dl'), _end_paragraph),
+        'strong': _end_bold, 'b': _end_bold,
+        'em': _end_italic, 'i': _end_italic,
+        **dict.fromkeys(('del', 's', 'strike'), _end_strike),
+        **dict.fromkeys(_RAW_INLINE_TAGS, _end_raw_inline),
+        'code': _end_code,
+        'pre': _end_pre,
+        'blockquote': _end_blockquote,
+        'a': _end_link,
+        'ul': _end_list, 'ol': _end_list,
+        'li': _end_list_item,
+        'table': _end_table,
+        'td': _end_cell, 'th': _end_cell,
+    }
+    
+    def _process_table(self):
+        """处理表格"""
+        rows = [row for row in self.table if row]
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        align = self.table_align + [None] * (width - len(self.table_align))
+        lines = []
+        for i, row in enumerate(rows):
+            cells = row + [''] * (width - len(row))
+            # 一行里的 $ 可以跨单元格组成公式
+            lines.append(_resolve_dollars("| " + " | ".join(cells) + " |"))
+            if i == 0:
+                # 表头之后的分隔行，保留对齐方式
+                rules = (_ALIGN_RULES.get((a or '').lower(), '---') for a in align)
+                lines.append("| " + " | ".join(rules) + " |")
+        self._emit(lines)
+        
+    def convert(self, html: str) -> str:
+        """将HTML转换为Markdown"""
+        self._reset_state()
+        
+        # 标准化换行符
+        if '\r' in html:
+            html = html.replace('\r\n', '\n').replace('\r', '\n')
+            
+        # 解析HTML：标签之间的文本按原顺序交给 handle_data
+        handle_starttag = self.handle_starttag
+        handle_endtag = self.handle_endtag
+        handle_data = self.handle_data
+        pos = 0
+        for m in _TOKEN_RE.finditer(html):
+            start = m.start()
+            if start > pos:
+                handle_data(html[pos:start])
+            pos = m.end()
+            closing, name, attrs = m.group(2, 3, 4)
+            if name is None:
+                continue  # 注释、script/style、doctype
+            if closing:
+                handle_endtag(name.lower())
             else:
-                cleaned_lines.append(line)
-                prev_empty = False
-                
-        # 移除开头和结尾的空行
-        while cleaned_lines and cleaned_lines[0] == "":
-            cleaned_lines.pop(0)
-        while cleaned_lines and cleaned_lines[-1] == "":
-            cleaned_lines.pop()
+                handle_starttag(name.lower(), attrs)
+        if pos < len(html):
+            handle_data(html[pos:])
             
-        return '\n'.join(cleaned_lines)
+        # 处理剩余内容
+        if self.pre_parts is not None:
+            self._end_pre('pre')
+        self._flush_line()
+        
+        # 清理结果
+        return normalize_markdown('\n'.join(self.markdown_lines))
+
+
+def _restore_local_src(src: str) -> str:
+    """将预览使用的 pymd://file/ 图片地址还原为 file:// URI"""
+    if src.startswith('pymd://file/'):
+        return 'file:///' + src[len('pymd://file/'):].lstrip('/')
+    return src
 
 
 def html_to_markdown(html: str) -> str:
@@ -302,58 +536,95 @@ def html_to_markdown(html: str) -> str:
 
 
 # 用于测试的简单转换函数（向后兼容）
+_SIMPLE_TAG_NAMES = 'h[1-6]|p|strong|b|em|i|a|code|pre|li|ul|ol|blockquote|br'
+# 只切出认识的标签；其余标签在它们之间的文本里直接删掉
+_SIMPLE_TOKEN_RE = re.compile(rf'<(/?)({_SIMPLE_TAG_NAMES})\b([^>]*)>', re.IGNORECASE)
+_SIMPLE_OTHER_TAG_RE = re.compile(r'<[^>]*>')
+_SIMPLE_HREF_RE = re.compile(r'href="([^"]*)"', re.IGNORECASE)
+_SIMPLE_ENTITY_RE = re.compile(r'&(?:nbsp|lt|gt|amp|quot|#39);')
+_SIMPLE_ENTITIES = {
+    '&nbsp;': ' ', '&lt;': '<', '&gt;': '>', '&amp;': '&', '&quot;': '"', '&#39;': "'",
+}
+_SIMPLE_BLANK_RE = re.compile(r'\n{3,}')
+
+
+def _simple_text(text: str) -> str:
+    if '<' in text:
+        text = _SIMPLE_OTHER_TAG_RE.sub('', text)
+    if '&' in text:
+        text = _SIMPLE_ENTITY_RE.sub(lambda m: _SIMPLE_ENTITIES[m.group()], text)
+    return text
+
+
+def _simple_heading(level: int):
+    return lambda inner, attrs, parent: '\n' + '#' * level + ' ' + inner.strip() + '\n'
+
+
+def _simple_link(inner: str, attrs: str, parent: Optional[str]) -> str:
+    m = _SIMPLE_HREF_RE.search(attrs)
+    return f'[{inner}]({_simple_text(m.group(1))})' if m else inner
+
+
+def _simple_blockquote(inner: str, attrs: str, parent: Optional[str]) -> str:
+    lines = (line.strip() for line in inner.strip().split('\n'))
+    return '\n'.join('> ' + line for line in lines if line) + '\n'
+
+
+# 闭合标签时按标签名取格式化函数：(内部文本, 属性, 父标签) -> Markdown
+_SIMPLE_FORMATS = {
+    **{f'h{n}': _simple_heading(n) for n in range(1, 7)},
+    'p': lambda inner, attrs, parent: inner + '\n\n',
+    'strong': lambda inner, attrs, parent: f'**{inner}**',
+    'b': lambda inner, attrs, parent: f'**{inner}**',
+    'em': lambda inner, attrs, parent: f'*{inner}*',
+    'i': lambda inner, attrs, parent: f'*{inner}*',
+    'a': _simple_link,
+    'code': lambda inner, attrs, parent: inner if parent == 'pre' else f'`{inner}`',
+    'pre': lambda inner, attrs, parent: f'```\n{inner}\n```',
+    'li': lambda inner, attrs, parent: f'- {inner}\n',
+    'ul': lambda inner, attrs, parent: inner + '\n',
+    'ol': lambda inner, attrs, parent: inner + '\n',
+    'blockquote': _simple_blockquote,
+}
+
+
 def simple_html_to_markdown(html: str) -> str:
-    """简单的HTML到Markdown转换（向后兼容）"""
-    text = html
-    
-    # 处理标题
-    text = re.sub(r'<h([1-6])[^>]*>(.*?)</h[1-6]>', 
-                  lambda m: '\n' + '#' * int(m.group(1)) + ' ' + m.group(2).strip() + '\n', 
-                  text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理段落
-    text = re.sub(r'<p[^>]*>(.*?)</p>', r'\1\n\n', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理粗体
-    text = re.sub(r'<(strong|b)[^>]*>(.*?)</\1>', r'**\2**', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理斜体
-    text = re.sub(r'<(em|i)[^>]*>(.*?)</\1>', r'*\2*', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理链接
-    text = re.sub(r'<a[^>]*href="([^"]*)"[^>]*>(.*?)</a>', r'[\2](\1)', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理内联代码
-    text = re.sub(r'<code[^>]*>(.*?)</code>', r'`\1`', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理代码块
-    text = re.sub(r'<pre[^>]*><code[^>]*>(.*?)</code></pre>', r'```\n\1\n```', text, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r'<pre[^>]*>(.*?)</pre>', r'```\n\1\n```', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理列表项
-    text = re.sub(r'<li[^>]*>(.*?)</li>', r'- \1\n', text, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r'<[uo]l[^>]*>(.*?)</[uo]l>', r'\1\n', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理引用
-    text = re.sub(r'<blockquote[^>]*>(.*?)</blockquote>', 
-                  lambda m: '\n'.join('> ' + line.strip() for line in m.group(1).strip().split('\n') if line.strip()) + '\n', 
-                  text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # 处理换行
-    text = re.sub(r'<br[^>]*>', '\n', text, flags=re.IGNORECASE)
-    
-    # 清理HTML标签
-    text = re.sub(r'<[^>]*>', '', text)
-    
-    # 清理HTML实体
-    text = text.replace('&nbsp;', ' ')
-    text = text.replace('&lt;', '<')
-    text = text.replace('&gt;', '>')
-    text = text.replace('&amp;', '&')
-    text = text.replace('&quot;', '"')
-    text = text.replace('&#39;', "'")
-    
-    # 清理多余的空行
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    
-    return text.strip()
\ No newline at end of file
+    """简单的HTML到Markdown转换（向后兼容）
+
+    只扫描一遍：认识的开始标签压栈，结束时把内部文本交给格式化函数，
+    结果追加到父标签的缓冲区。
+    """
+    # 栈中每项为 [标签, 属性, 片段列表]，栈底是整个文档
+    stack: list = [[None, '', []]]
+    parts = stack[0][2]
+    pos = 0
+    for m in _SIMPLE_TOKEN_RE.finditer(html):
+        start = m.start()
+        if start > pos:
+            parts.append(_simple_text(html[pos:start]))
+        pos = m.end()
+        closing, name, attrs = m.groups()
+        name = name.lower()
+        if name == 'br':
+            parts.append('\n')
+        elif not closing:
+            stack.append([name, attrs, []])
+            parts = stack[-1][2]
+        else:
+            for depth in range(len(stack) - 1, 0, -1):
+                if stack[depth][0] == name:
+                    break
+            else:
+                continue  # 没有对应的开始标签
+            # 未闭合的内部标签按纯文本并入
+            while len(stack) - 1 > depth:
+                stack[-2][2].extend(stack.pop()[2])
+            tag, attrs, inner = stack.pop()
+            parts = stack[-1][2]
+            parts.append(_SIMPLE_FORMATS[tag](''.join(inner), attrs, stack[-1][0]))
+    if pos < len(html):
+        parts.append(_simple_text(html[pos:]))
+    while len(stack) > 1:
+        stack[-2][2].extend(stack.pop()[2])
+    text = _SIMPLE_BLANK_RE.sub('\n\n', ''.join(stack[0][2]))
+    return text.strip()
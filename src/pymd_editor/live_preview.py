@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+import json
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, QUrl, pyqtSignal
+from PyQt6.QtGui import QPageLayout
+from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineSettings
+from PyQt6.QtWebEngineWidgets import QWebEngineView
+
+from .config import PREVIEW_VIRTUALIZE_BLOCKS
+from .renderer import BlockMap, MarkdownRenderer, diff_blocks
+
+
+# Installed once in the shell page.  Every block lives in its own
+# <div class="pymd-block" data-line="N"> so a patch can address blocks by
+# index; data-line is the block's first source line (0-based).
+PATCH_SCRIPT = """
+<script>
+// Formulas are typeset per block: lazily through pymdMath when the
+// renderer emits placeholders, otherwise by a MathJax scan of the block.
+window.pymdTypeset = function (blocks) {
+  if (window.pymdMath) {
+    blocks.forEach(pymdMath.scan);
+  } else if (window.MathJax && MathJax.typesetPromise) {
+    MathJax.typesetPromise(blocks);
+  }
+};
+window.pymdTypesetClear = function (blocks) {
+  if (window.pymdMath) {
+    blocks.forEach(pymdMath.forget);
+  } else if (window.MathJax && MathJax.typesetClear) {
+    MathJax.typesetClear(blocks);
+  }
+};
+window.pymdPatch = function (patch) {
+  var content = document.querySelector('.content');
+  if (!content) { return; }
+  var virtual = window.pymdVirtual;
+  var children = content.children;
+  var anchor = children[patch.start + patch.remove] || null;
+  var removed = [];
+  for (var i = 0; i < patch.remove; i++) {
+    var old = content.removeChild(children[patch.start]);
+    if (virtual) { virtual.forget(old); }
+    removed.push(old);
+  }
+  if (removed.length) { pymdTypesetClear(removed); }
+  var added = [];
+  patch.insert.forEach(function (html, k) {
+    var block = document.createElement('div');
+    block.className = 'pymd-block';
+    block.setAttribute('data-line', patch.lines[k]);
+    content.insertBefore(block, anchor);
+    if (virtual) {
+      virtual.add(block, html);  // mounted (and typeset) once near the viewport
+    } else {
+      block.innerHTML = html;
+      added.push(block);
+    }
+  });
+  if (patch.shift) {
+    // Lines were added or removed: renumber the blocks after the edit
+    var skipEnd = patch.start + patch.insert.length;
+    for (var j = patch.shiftFrom; j < children.length; j++) {
+      if (j >= patch.start && j < skipEnd) { continue; }
+      children[j].setAttribute('data-line', +children[j].getAttribute('data-line') + patch.shift);
+    }
+  }
+  if (added.length) { pymdTypeset(added); }
+};
+window.pymdScrollTo = function (index, fraction) {
+  var content = document.querySelector('.content');
+  var block = content && content.children[index];
+  if (!block) { return; }
+  var top = block.getBoundingClientRect().top + window.scrollY;
+  window.scrollTo(0, top + block.offsetHeight * fraction);
+};
+</script>
+"""
+
+# Added to the shell for long documents.  Blocks far from the viewport are
+# empty placeholders with their last measured (or an estimated) height;
+# an IntersectionObserver mounts them shortly before they scroll into view
+# and unmounts them again once they are well out of it.
+VIRTUAL_SCRIPT = """
+<script>
+window.pymdVirtual = (function () {
+  var sources = new WeakMap();
+  var measured = { total: 0, count: 0 };
+
+  function estimate() {
+    return measured.count ? Math.round(measured.total / measured.count) : 48;
+  }
+  function mount(block) {
+    if (block.pymdMounted) { return; }
+    block.pymdMounted = true;
+    block.style.height = '';
+    block.innerHTML = sources.get(block) || '';
+    pymdTypeset([block]);
+  }
+  function unmount(block) {
+    if (!block.pymdMounted) { return; }
+    var height = block.offsetHeight;
+    if (!block.pymdHeight) {
+      measured.total += height;
+      measured.count += 1;
+    }
+    block.pymdHeight = height;
+    pymdTypesetClear([block]);
+    block.pymdMounted = false;
+    block.style.height = height + 'px';
+    block.innerHTML = '';
+  }
+
+  var observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (entry.isIntersecting) { mount(entry.target); } else { unmount(entry.target); }
+    });
+  }, { rootMargin: '1500px 0px' });
+
+  // In-page links may point at a heading that is not mounted
+  document.addEventListener('click', function (ev) {
+    var link = ev.target.closest && ev.target.closest('a[href^="#"]');
+    if (!link) { return; }
+    var id = decodeURIComponent(link.getAttribute('href').slice(1));
+    if (!id || document.getElementById(id)) { return; }
+    var blocks = document.querySelectorAll('.content > .pymd-block');
+    for (var i = 0; i < blocks.length; i++) {
+      if ((sources.get(blocks[i]) || '').indexOf('id="' + id + '"') !== -1) {
+        ev.preventDefault();
+        mount(blocks[i]);
+        document.getElementById(id).scrollIntoView();
+        return;
+      }
+    }
+  });
+
+  return {
+    add: function (block, html) {
+      sources.set(block, html);
+      block.style.height = estimate() + 'px';
+      observer.observe(block);
+    },
+    forget: function (block) {
+      observer.unobserve(block);
+      sources.delete(block);
+    }
+  };
+})();
+</script>
+"""
+
+
+class LivePreview(QObject):
+    """Drive a preview ``QWebEngineView`` by patching its DOM.
+
+    The shell page (CSS, MathJax, patch helper) is loaded once per theme
+    and base URL; afterwards only the blocks that changed are pushed into
+    the existing page through ``runJavaScript``, so scroll position and
+    already typeset formulas survive an edit.
+
+    Documents with at least *virtualize_blocks* blocks are shown in
+    virtualized mode (see ``VIRTUAL_SCRIPT``): only blocks near the
+    viewport are in the DOM and typeset by MathJax.
+    """
+
+    def __init__(self, view: QWebEngineView, renderer: MarkdownRenderer, parent=None,
+                 virtualize_blocks: int = PREVIEW_VIRTUALIZE_BLOCKS):
+        super().__init__(parent)
+        self._view = view
+        self._renderer = renderer
+        self.virtualize_blocks = virtualize_blocks
+        self._map = BlockMap([], [], 0)
+        self._shell_key: tuple[bool, str, bool] | None = None
+        self._loading = False
+        self._pending: BlockMap | None = None
+
+        view.loadStarted.connect(self._on_load_started)
+        view.loadFinished.connect(self._on_load_finished)
+
+    def show_blocks(self, block_map: BlockMap, dark: bool, base_url: QUrl):
+        """Display *block_map*, reloading the shell only if theme or base changed."""
+        virtual = self._should_virtualize(len(block_map))
+        key = (dark, base_url.toString(), virtual)
+        if key != self._shell_key:
+            self._shell_key = key
+            self._map = BlockMap([], [], 0)
+            self._pending = block_map
+            self._loading = True
+            scripts = PATCH_SCRIPT + VIRTUAL_SCRIPT if virtual else PATCH_SCRIPT
+            self._view.setHtml(self._renderer.wrap_html("", dark, scripts=scripts), base_url)
+            return
+        if self._loading:
+            self._pending = block_map
+            return
+        self._apply(block_map)
+
+    def scroll_to_line(self, line: int):
+        """Scroll the preview to the block rendered from source *line*."""
+        if self._loading or not len(self._map):
+            return
+        index = self._map.block_at(line)
+        first, end = self._map.line_range(index)
+        fraction = min(1.0, max(0.0, (line - first) / max(1, end - first)))
+        self._view.page().runJavaScript(f"window.pymdScrollTo({index}, {fraction:.3f});")
+
+    @property
+    def virtualized(self) -> bool:
+        return bool(self._shell_key and self._shell_key[2])
+
+    def _should_virtualize(self, count: int) -> bool:
+        if self.virtualize_blocks <= 0:
+            return False
+        # Hysteresis: don't reload the shell when hovering around the limit
+        if self.virtualized:
+            return count >= self.virtualize_blocks // 2
+        return count >= self.virtualize_blocks
+
+    def reset(self):
+        """Force the next update to reload the shell page."""
+        self._shell_key = None
+
+    def _apply(self, block_map: BlockMap):
+        old = self._map
+        start, removed, inserted = diff_blocks(old.blocks, block_map.blocks)
+        # A single edit moves every block after it by the same number of
+        # lines; find the first one (it may be before *start* when only
+        # blank lines changed).
+        shift = block_map.line_count - old.line_count
+        shift_from = start + len(inserted)
+        if shift:
+            for i in range(start):
+                if block_map.starts[i] != old.starts[i]:
+                    shift_from = i
+                    break
+            if shift_from >= len(block_map):
+                shift = 0
+        if not removed and not inserted and not shift:
+            self._map = block_map
+            return
+        self._map = block_map
+        patch = {
+            "start": start, "remove": removed, "insert": inserted,
+            "lines": block_map.starts[start:start + len(inserted)],
+            "shift": shift, "shiftFrom": shift_from,
+        }
+        self._view.page().runJavaScript(f"window.pymdPatch({json.dumps(patch)});")
+
+    def _on_load_started(self):
+        # A navigation we did not start (e.g. a clicked link) replaces the
+        # shell, so the next update has to load it again.
+        if not self._loading:
+            self._shell_key = None
+
+    def _on_load_finished(self, ok: bool):
+        if not self._loading:
+            return
+        self._loading = False
+        if self._pending is not None:
+            block_map, self._pending = self._pending, None
+            self._apply(block_map)
+
+
+class PdfPrinter(QObject):
+    """Print a rendered body to PDF from an offscreen page.
+
+    The preview page cannot be printed as it is: in virtualized mode the
+    blocks away from the viewport are empty placeholders.  This page is
+    never virtualized and gets the whole body at once.
+    """
+
+    finished = pyqtSignal(str, bool)  # file path, success
+
+    READY_POLL_MS = 100
+    READY_TIMEOUT_MS = 30000  # print anyway if typesetting never settles
+
+    def __init__(self, renderer: MarkdownRenderer, parent=None):
+        super().__init__(parent)
+        self._renderer = renderer
+        self._ready_timer = QTimer(self)
+        self._ready_timer.setSingleShot(True)
+        self._ready_timer.setInterval(self.READY_POLL_MS)
+        self._ready_timer.timeout.connect(self._poll_ready)
+        self._ready_waited = 0
+        self._page = QWebEnginePage(self)
+        # Without a view the page counts as hidden and would not run its scripts' frames
+        self._page.setVisible(True)
+        settings = self._page.settings()
+        settings.setAttribute(QWebEngineSettings.WebAttribute.LocalContentCanAccessRemoteUrls, True)
+        settings.setAttribute(QWebEngineSettings.WebAttribute.LocalContentCanAccessFileUrls, True)
+        settings.setAttribute(QWebEngineSettings.WebAttribute.AllowRunningInsecureContent, True)
+        self._page.loadFinished.connect(self._on_load_finished)
+        self._page.pdfPrintingFinished.connect(self._on_pdf_finished)
+        self._job: tuple[str, str, QPageLayout] | None = None  # (body, path, layout)
+
+    @property
+    def busy(self) -> bool:
+        return self._job is not None
+
+    def print_pdf(self, html_body: str, dark: bool, base_url: QUrl, path: str, layout: QPageLayout):
+        """Load *html_body* and print it to *path*; emits :attr:`finished`."""
+        self._job = (html_body, path, layout)
+        # The body is inserted by script: setHtml() is limited to 2 MB
+        self._page.setHtml(self._renderer.wrap_html("", dark), base_url)
+
+    def _on_load_finished(self, ok: bool):
+        if self._job is None:
+            return
+        if not ok:
+            self._finish(False)
+            return
+        body = json.dumps(self._job[0])
+        # Lazy formulas are only typeset on screen, so typeset them all first
+        self._page.runJavaScript(
+            f"document.querySelector('.content').innerHTML = {body};"
+            "window.pymdPrintReady = false;"
+            "(window.pymdMath ? pymdMath.typesetAll() : Promise.resolve())"
+            ".catch(function () {})"
+            ".then(function () { window.pymdPrintReady = true; });",
+            self._on_body_set,
+        )
+
+    def _on_body_set(self, _result):
+        self._ready_waited = 0
+        self._ready_timer.start()
+
+    def _poll_ready(self):
+        if self._job is not None:
+            self._page.runJavaScript("window.pymdPrintReady === true", self._on_ready_polled)
+
+    def _on_ready_polled(self, ready):
+        if self._job is None:
+            return
+        self._ready_waited += self.READY_POLL_MS
+        if not ready and self._ready_waited < self.READY_TIMEOUT_MS:
+            self._ready_timer.start()
+            return
+        _, path, layout = self._job
+        self._page.printToPdf(path, layout)
+
+    def _on_pdf_finished(self, _path: str, ok: bool):
+        self._finish(ok)
+
+    def _finish(self, ok: bool):
+        job, self._job = self._job, None
+        if job is not None:
+            self.finished.emit(job[1], ok)
+
+
+class _RenderTask(QRunnable):
+    def __init__(self, owner: "BackgroundRenderer", generation: int, text: str,
+                 base_path: str | None, context):
+        super().__init__()
+        self._owner = owner
+        self._generation = generation
+        self._text = text
+        self._base_path = base_path
+        self._context = context
+
+    def run(self):
+        self._owner._run(self._generation, self._text, self._base_path, self._context)
+
+
+class BackgroundRenderer(QObject):
+    """Render markdown blocks on a worker thread.
+
+    Every submit() bumps a generation counter.  A task whose generation has
+    been superseded is skipped if it has not started yet, and its result is
+    dropped if it has, so the UI thread only ever applies the newest render.
+    """
+
+    rendered = pyqtSignal(object, object)  # BlockMap, context passed to submit()
+    failed = pyqtSignal(str)
+    profiled = pyqtSignal(dict)  # renderer.last_stats, only when profiling
+
+    _finished = pyqtSignal(int, object, object, dict)
+
+    def __init__(self, renderer: MarkdownRenderer, parent=None):
+        super().__init__(parent)
+        self._renderer = renderer
+        self._generation = 0
+        # One worker keeps renders ordered and the renderer's block cache
+        # single-threaded.
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._finished.connect(self._on_finished)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def submit(self, text: str, base_path: str | None = None, context=None) -> int:
+        """Queue a render of *text*; returns its generation number."""
+        self._generation += 1
+        self._pool.start(_RenderTask(self, self._generation, text, base_path, context))
+        return self._generation
+
+    def _run(self, generation: int, text: str, base_path: str | None, context):
+        # Worker thread
+        if generation != self._generation:
+            return
+        try:
+            block_map = self._renderer.render_block_map(text, base_path=base_path)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        # last_stats is per thread, so read it here on the worker
+        stats = self._renderer.last_stats if self._renderer.profile else {}
+        self._finished.emit(generation, block_map, context, stats)
+
+    def _on_finished(self, generation: int, block_map: BlockMap, context, stats: dict):
+        if generation == self._generation:
+            self.rendered.emit(block_map, context)
+            if stats:
+                self.profiled.emit(stats)
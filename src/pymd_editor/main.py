@@ -21,17 +21,24 @@ def main():
     from PyQt6.QtWidgets import QApplication
     try:
         from pymd_editor.app import MainWindow
+        from pymd_editor.url_scheme import register_pymd_scheme
     except ImportError:
         from .app import MainWindow
+        from .url_scheme import register_pymd_scheme
 
+    # Custom schemes must be registered before the QApplication exists
+    register_pymd_scheme()
     app = QApplication(sys.argv)
     win = MainWindow()
+    # Offer to restore work left unsaved by a crash
+    win.recover_autosave()
 
-    # If a file path is passed on the command line, open it automatically
+    # If a file path is passed on the command line, open it automatically;
+    # recovered text is unsaved, so the user confirms before it is replaced
     if len(sys.argv) > 1:
         file_path = Path(sys.argv[1])
         if file_path.exists() and file_path.suffix.lower() == ".md":
-            win.load_file(file_path)
+            win.open_path(file_path)
 
     win.show()
     sys.exit(app.exec())
@@ -0,0 +1,199 @@
+"""
+Markdown syntax highlighting for the source editor.
+
+QSyntaxHighlighter re-highlights a block whenever it changes and continues
+to the next block only while the stored block state differs from before.
+Multi-line constructs (fenced code, YAML front matter, ``$$`` math) are
+therefore carried in the block state, so an ordinary keystroke touches a
+single block and only opening or closing a fence re-highlights the rest of
+the document.
+"""
+from __future__ import annotations
+
+import re
+
+from PyQt6.QtGui import QColor, QFont, QSyntaxHighlighter, QTextCharFormat, QTextDocument
+
+# Block states; the low 3 bits are the kind, fences keep their marker above
+STATE_NORMAL = 0
+STATE_FRONT_MATTER = 1
+STATE_MATH = 2
+STATE_FENCE = 3
+_KIND_MASK = 0b111
+_TILDE_BIT = 0b1000
+_LENGTH_SHIFT = 4
+
+_FENCE_OPEN_RE = re.compile(r" {0,3}(`{3,}|~{3,})(.*)$")
+_FENCE_CLOSE_RE = re.compile(r" {0,3}(`{3,}|~{3,})\s*$")
+_HEADING_RE = re.compile(r" {0,3}#{1,6}(?:\s|$)")
+_HR_RE = re.compile(r" {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+_QUOTE_RE = re.compile(r" {0,3}(?:>\s?)+")
+_LIST_RE = re.compile(r"\s*(?:[-*+]|\d{1,9}[.)])(?=\s)(?:\s+\[[ xX]\](?=\s))?")
+_INLINE_RE = re.compile(
+    r"(?P<code>(`+).+?\2)"
+    r"|(?P<math>\$[^$\s](?:[^$]*[^$\s])?\$)"
+    r"|(?P<image>!\[[^\]]*\]\([^)]*\))"
+    r"|(?P<link>\[[^\]]*\]\([^)]*\)|<(?:https?|mailto):[^>\s]+>)"
+    r"|(?P<strong>\*\*[^*]+\*\*|__[^_]+__)"
+    r"|(?P<emphasis>\*[^*\s][^*]*\*|(?<!\w)_[^_\s][^_]*_(?!\w))"
+    r"|(?P<strike>~~[^~]+~~)"
+    r"|(?P<html></?[A-Za-z][^>]*>)"
+)
+
+_LIGHT = {
+    "heading": ("#1f4e8c", True, False),
+    "emphasis": (None, False, True),
+    "strong": (None, True, False),
+    "strike": ("#6a737d", False, False),
+    "code": ("#c7254e", False, False),
+    "fence": ("#6a737d", False, False),
+    "fence_body": ("#24292e", False, False),
+    "math": ("#6f42c1", False, False),
+    "link": ("#0366d6", False, False),
+    "image": ("#0366d6", False, True),
+    "html": ("#22863a", False, False),
+    "quote": ("#6a737d", False, True),
+    "list": ("#d73a49", True, False),
+    "hr": ("#6a737d", True, False),
+    "front_matter": ("#6a737d", False, False),
+}
+
+_DARK = {
+    "heading": ("#79b8ff", True, False),
+    "emphasis": (None, False, True),
+    "strong": (None, True, False),
+    "strike": ("#959da5", False, False),
+    "code": ("#f97583", False, False),
+    "fence": ("#959da5", False, False),
+    "fence_body": ("#e1e4e8", False, False),
+    "math": ("#b392f0", False, False),
+    "link": ("#79b8ff", False, False),
+    "image": ("#79b8ff", False, True),
+    "html": ("#85e89d", False, False),
+    "quote": ("#959da5", False, True),
+    "list": ("#f97583", True, False),
+    "hr": ("#959da5", True, False),
+    "front_matter": ("#959da5", False, False),
+}
+
+
+def _make_formats(palette: dict) -> dict[str, QTextCharFormat]:
+    formats = {}
+    for name, (color, bold, italic) in palette.items():
+        fmt = QTextCharFormat()
+        if color:
+            fmt.setForeground(QColor(color))
+        if bold:
+            fmt.setFontWeight(QFont.Weight.Bold)
+        if italic:
+            fmt.setFontItalic(True)
+        if name in ("code", "fence", "fence_body", "math", "front_matter"):
+            fmt.setFontFixedPitch(True)
+        formats[name] = fmt
+    return formats
+
+
+def _fence_state(marker: str) -> int:
+    tilde = _TILDE_BIT if marker[0] == "~" else 0
+    return STATE_FENCE | tilde | (len(marker) << _LENGTH_SHIFT)
+
+
+def _closes_fence(text: str, state: int) -> bool:
+    m = _FENCE_CLOSE_RE.match(text)
+    if not m:
+        return False
+    marker = m.group(1)
+    tilde = _TILDE_BIT if marker[0] == "~" else 0
+    return tilde == state & _TILDE_BIT and len(marker) >= state >> _LENGTH_SHIFT
+
+
+class MarkdownHighlighter(QSyntaxHighlighter):
+    """Highlight Markdown source with per-block state for multi-line constructs."""
+
+    def __init__(self, document: QTextDocument, dark: bool = False):
+        super().__init__(document)
+        self._dark = dark
+        self._formats = _make_formats(_DARK if dark else _LIGHT)
+
+    def set_dark_mode(self, dark: bool):
+        if dark == self._dark:
+            return
+        self._dark = dark
+        self._formats = _make_formats(_DARK if dark else _LIGHT)
+        self.rehighlight()
+
+    def highlightBlock(self, text: str):  # noqa: N802
+        previous = self.previousBlockState()
+        kind = previous & _KIND_MASK if previous > 0 else STATE_NORMAL
+        to_utf16 = _utf16_mapper(text)
+        length = to_utf16(len(text))
+
+        if kind == STATE_FENCE:
+            if _closes_fence(text, previous):
+                self.setFormat(0, length, self._formats["fence"])
+                self.setCurrentBlockState(STATE_NORMAL)
+            else:
+                self.setFormat(0, length, self._formats["fence_body"])
+                self.setCurrentBlockState(previous)
+            return
+
+        if kind == STATE_FRONT_MATTER:
+            self.setFormat(0, length, self._formats["front_matter"])
+            closed = text.rstrip() in ("---", "...")
+            self.setCurrentBlockState(STATE_NORMAL if closed else STATE_FRONT_MATTER)
+            return
+
+        if kind == STATE_MATH:
+            self.setFormat(0, length, self._formats["math"])
+            closed = text.rstrip().endswith("$$")
+            self.setCurrentBlockState(STATE_NORMAL if closed else STATE_MATH)
+            return
+
+        self.setCurrentBlockState(STATE_NORMAL)
+        if previous == -1 and text.rstrip() == "---" and self.currentBlock().blockNumber() == 0:
+            self.setFormat(0, length, self._formats["front_matter"])
+            self.setCurrentBlockState(STATE_FRONT_MATTER)
+            return
+
+        m = _FENCE_OPEN_RE.match(text)
+        if m and not (m.group(1)[0] == "`" and "`" in m.group(2)):
+            self.setFormat(0, length, self._formats["fence"])
+            self.setCurrentBlockState(_fence_state(m.group(1)))
+            return
+
+        stripped = text.strip()
+        if stripped.startswith("$$"):
+            self.setFormat(0, length, self._formats["math"])
+            if len(stripped) == 2 or not stripped.endswith("$$"):
+                self.setCurrentBlockState(STATE_MATH)
+            return
+
+        if _HEADING_RE.match(text):
+            self.setFormat(0, length, self._formats["heading"])
+            return
+        if _HR_RE.match(text):
+            self.setFormat(0, length, self._formats["hr"])
+            return
+
+        start = 0
+        m = _QUOTE_RE.match(text)
+        if m:
+            self.setFormat(0, length, self._formats["quote"])
+            start = m.end()
+        m = _LIST_RE.match(text, start)
+        if m:
+            self.setFormat(to_utf16(start), to_utf16(m.end()) - to_utf16(start), self._formats["list"])
+            start = m.end()
+        for m in _INLINE_RE.finditer(text, start):
+            begin = to_utf16(m.start())
+            self.setFormat(begin, to_utf16(m.end()) - begin, self._formats[m.lastgroup])
+
+
+def _utf16_mapper(text: str):
+    """Map Python string indices to the UTF-16 offsets Qt expects."""
+    if text.isascii() or max(text) <= "\uffff":
+        return lambda i: i
+    offsets = [0]
+    for ch in text:
+        offsets.append(offsets[-1] + (2 if ord(ch) > 0xFFFF else 1))
+    return offsets.__getitem__
@@ -0,0 +1,57 @@
+"""
+Canonical text form for Markdown produced from the WYSIWYG page.
+
+html_to_markdown emits one canonical spelling per construct (``-`` bullets,
+four-space continuation indent, fenced code, ``**``/``*``/``~~`` emphasis,
+padded table pipes, backslash escapes for literal metacharacters);
+:func:`normalize_markdown` fixes the whitespace around it:
+no trailing spaces except a hard break, one blank line between blocks, no
+blank lines at the ends, ``\\n`` line endings, code fences left untouched.
+Together they make ``html_to_markdown(render(md))`` a fixed point after a
+single pass, so converting an unchanged page never produces an edit
+(tools/roundtrip_markdown.py checks this).
+
+Normalising each block and joining the blocks with a blank line gives the
+same text as normalising the joined document, which is what lets the
+WYSIWYG editor convert only the blocks that changed.
+"""
+from __future__ import annotations
+
+import re
+
+# A fence line, possibly inside block quotes and list items
+_FENCE_RE = re.compile(r"[ \t>]*(`{3,}|~{3,})")
+_HARD_BREAK = "  "
+
+
+def normalize_markdown(text: str) -> str:
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = text.split("\n")
+    out: list[str] = []
+    fence = None  # marker of the open code fence
+    blank = False
+    for i, line in enumerate(lines):
+        m = _FENCE_RE.match(line)
+        if fence is not None:
+            out.append(line)
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) \
+                    and not line[m.end():].strip():
+                fence = None
+            continue
+        if m:
+            fence = m.group(1)
+        stripped = line.rstrip()
+        if not stripped.strip("> "):
+            # Blank, or blank inside a quote: keep the quote, drop runs
+            if not blank and out:
+                out.append(stripped)
+            blank = True
+            continue
+        blank = False
+        if line.endswith(_HARD_BREAK) and i + 1 < len(lines) and lines[i + 1].strip(" \t>"):
+            stripped += _HARD_BREAK
+        out.append(stripped)
+    while out and not out[-1].strip("> "):
+        out.pop()
+    return "\n".join(out)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+from PyQt6.QtCore import QObject, QTimer
+
+
+class DebouncePolicy:
+    """Pick a debounce interval from how long recent renders took.
+
+    Keeps an exponential moving average of render time per character, so
+    the predicted cost follows the document as it grows or shrinks.  The
+    interval is the predicted render time times *factor*, clamped to
+    ``[min_ms, max_ms]``; *initial_ms* is used until a render was measured.
+    """
+
+    def __init__(self, initial_ms: int = 150, min_ms: int = 30, max_ms: int = 1500,
+                 factor: float = 1.5, smoothing: float = 0.3):
+        self.initial_ms = initial_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.factor = factor
+        self.smoothing = smoothing
+        self._ms_per_char: float | None = None
+
+    def record(self, duration_ms: float, size: int) -> None:
+        rate = duration_ms / max(size, 1)
+        if self._ms_per_char is None:
+            self._ms_per_char = rate
+        else:
+            self._ms_per_char += self.smoothing * (rate - self._ms_per_char)
+
+    def interval(self, size: int) -> int:
+        if self._ms_per_char is None:
+            return self.initial_ms
+        predicted = self._ms_per_char * size * self.factor
+        return int(min(self.max_ms, max(self.min_ms, predicted)))
+
+
+class RenderScheduler(QObject):
+    """Debounce renders with an adaptive interval and at most one in flight.
+
+    Call :meth:`schedule` on every edit.  When the interval elapses the
+    *render* callback runs, and the owner reports completion with
+    :meth:`render_finished` (synchronously or from an async callback).
+    Edits arriving while a render is in flight only mark it dirty; the
+    final state is rendered as soon as the running render finishes.
+    """
+
+    # A render not reported finished after this long is assumed lost
+    STALL_SECONDS = 10.0
+
+    def __init__(self, render: Callable[[], None], parent=None,
+                 policy: DebouncePolicy | None = None):
+        super().__init__(parent)
+        self._render = render
+        self.policy = policy or DebouncePolicy()
+        self._size = 0
+        self._started: float | None = None
+        self._dirty = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    @property
+    def in_flight(self) -> bool:
+        return self._started is not None
+
+    def schedule(self, size: int) -> None:
+        """Request a render of a document of *size* characters."""
+        self._size = size
+        self._dirty = True
+        if self.in_flight and time.perf_counter() - self._started > self.STALL_SECONDS:
+            self._started = None
+        if not self.in_flight:
+            self._timer.start(self.policy.interval(size))
+
+    def render_finished(self) -> None:
+        """Report that the render started by the scheduler has completed."""
+        if self._started is None:
+            return
+        self.policy.record((time.perf_counter() - self._started) * 1000, self._size)
+        self._started = None
+        if self._dirty and not self._timer.isActive():
+            # Edits arrived meanwhile: render the final state right away
+            self._fire()
+
+    def flush(self) -> None:
+        """Run a pending render now instead of waiting for the interval."""
+        if self._dirty and not self.in_flight:
+            self._timer.stop()
+            self._fire()
+
+    def cancel(self) -> None:
+        self._timer.stop()
+        self._dirty = False
+
+    def _fire(self) -> None:
+        if self.in_flight:
+            return
+        self._dirty = False
+        self._started = time.perf_counter()
+        self._render()
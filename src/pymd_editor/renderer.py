@@ -1,38 +1,817 @@
 ﻿from __future__ import annotations
 
+import bisect
+import hashlib
 import markdown2
 import os
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from html import escape as html_escape
 from pathlib import Path
-from urllib.parse import urlparse
+from typing import Iterable, Iterator
+from urllib.parse import quote, urlparse
 
+from .config import APP_VERSION, RENDER_CACHE_MAX_BYTES
+
+MATHJAX_CDN_URL = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"
+
+
+_FENCE_OPEN_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM_RE = re.compile(r"^ {0,3}(?:[*+-]|\d+[.)])\s")
+# Reference-style links and footnotes resolve across the whole document,
+# so they cannot be rendered one block at a time.
+_DOC_SCOPED_RE = re.compile(r"^ {0,3}\[[^\]]+\]:\s|\[\^[^\]]+\]", re.M)
+# Raw HTML blocks run to their matching close tag, blank lines included
+# (markdown2's block tags; other parsers end them at a blank line, which
+# renders the same whether or not the block is split there).
+_HTML_BLOCK_RE = re.compile(
+    r"<(blockquote|body|dd|del|div|dl|dt|fieldset|form|h[1-6]|head|html|iframe|ins|li|math"
+    r"|noscript|ol|p|pre|script|style|table|tfoot|ul|address|article|aside|canvas"
+    r"|figcaption|figure|footer|header|main|nav|section|video|details)\b",
+    re.I,
+)
+_HEADER_ID_RE = re.compile(r'(<h[1-6] id=")([^"]+)(")')
+_HEADER_ID_COUNT_RE = re.compile(r"(.*)-([0-9]+)$")
+# Pattern to match markdown images: ![alt](src)
+_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+# Inline code spans are matched first so the math inside them is left alone,
+# and so is text that ends up in attributes: image alt text, link
+# destinations and titles, reference definitions, autolinks and HTML tags
+_MATH_RE = re.compile(
+    r"(?P<code>(`+).*?(?<!`)\2(?!`))"
+    r"|(?P<verbatim>!\[[^\]\n]*\](?:\([^)\n]*\))?"
+    r"|\]\([^)\n]*\)"
+    r"|^[ ]{0,3}\[[^\]\n]+\]:[^\n]*"
+    r"|<[A-Za-z][A-Za-z0-9+.-]{1,31}:[^\s<>]*>"
+    r"|</?[A-Za-z][A-Za-z0-9-]*"
+    r"(?:\s+[A-Za-z_:][\w.:-]*(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'=<>`]+))?)*\s*/?>)"
+    r"|(?P<escaped>\\\$)"
+    r"|(?<!\\)\$\$.+?(?<!\\)\$\$"
+    r"|\\\[.+?\\\]"
+    r"|\\\(.+?\\\)"
+    r"|(?<![\\$\w])\$(?=\S)[^$\n]*?(?<=[^\s\\])\$(?![\w$])",
+    re.S | re.M,
+)
+_MATH_TOKEN_RE = re.compile(r"PYMDMATH(\d+)X")
+_MATH_ID_TOKEN_RE = re.compile(r"pymdmath(\d+)x")
+
+
+def split_blocks(text: str) -> list[str]:
+    """Split markdown source into top-level blocks.
+
+    Blocks are separated by blank lines, except that fenced code, ``$$``
+    math, raw HTML blocks, indented continuations and consecutive list
+    items stay together so each block renders the same on its own as
+    inside the full document.
+    """
+    return [block for _, block in split_blocks_with_lines(text)]
+
+
+def split_blocks_with_lines(text: str) -> list[tuple[int, str]]:
+    """Like :func:`split_blocks`, paired with each block's 0-based first line."""
+    if not text:
+        return []
+    if _DOC_SCOPED_RE.search(text):
+        return [(0, text)]
+
+    blocks: list[tuple[int, str]] = []
+    current: list[str] = []
+    start = 0
+    fence: str | None = None
+    in_math = False
+    html_tag: str | None = None  # open raw HTML block
+    html_depth = 0
+    after_blank = False
+    in_list = False
+    quote_code = False  # indented code after a blank line inside a blockquote block
+
+    def flush():
+        while current and not current[-1].strip():
+            current.pop()
+        if current:
+            blocks.append((start, "\n".join(current)))
+        current.clear()
+
+    for lineno, line in enumerate(text.split("\n")):
+        if fence:
+            current.append(line)
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            continue
+        if in_math:
+            current.append(line)
+            if line.rstrip().endswith("$$"):
+                in_math = False
+            continue
+        if html_tag:
+            current.append(line)
+            html_depth += _html_tag_depth(line, html_tag)
+            if html_depth <= 0:
+                html_tag = None
+            continue
+
+        if not line.strip():
+            if current:
+                current.append(line)
+                after_blank = True
+            continue
+
+        follows_blank = after_blank
+        if after_blank:
+            indented = line[:1] in (" ", "\t")
+            if quote_code and not indented:
+                # markdown2 replaces indented code before it finds
+                # blockquotes and drops the blank lines after the code, so
+                # the quote also takes the next run of lines
+                quote_code = False
+            elif not (indented or (in_list and _LIST_ITEM_RE.match(line))):
+                flush()
+            elif line.startswith(("    ", "\t")) and current[0].lstrip().startswith(">"):
+                quote_code = True
+            after_blank = False
+
+        if line[:1] not in (" ", "\t"):
+            # A plain line right after a list line is a lazy continuation
+            # of the item and keeps the list open
+            in_list = bool(_LIST_ITEM_RE.match(line)) or (in_list and not follows_blank)
+        if not current:
+            start = lineno
+        current.append(line)
+        match = _FENCE_OPEN_RE.match(line)
+        html = _HTML_BLOCK_RE.match(line) if match is None else None
+        if match:
+            fence = match.group(1)
+        elif html and _html_tag_depth(line, html.group(1)) > 0:
+            html_tag = html.group(1)
+            html_depth = _html_tag_depth(line, html_tag)
+        elif line.lstrip().startswith("$$") and not (
+            len(line.strip()) > 2 and line.rstrip().endswith("$$")
+        ):
+            in_math = True
+
+    flush()
+    return blocks
+
+
+def _html_tag_depth(line: str, tag: str) -> int:
+    """Opening minus closing *tag* tags on *line*."""
+    tag = re.escape(tag)
+    opened = len(re.findall(rf"<{tag}\b", line, re.I))
+    return opened - len(re.findall(rf"</{tag}\s*>", line, re.I))
+
+
+class BlockMap:
+    """Rendered blocks plus a compact source line index.
+
+    ``starts[i]`` is the first source line (0-based) of block ``i``; the
+    block spans up to the next block's start (or ``line_count``), blank
+    separator lines included.  Lookups are a bisect, O(log n).
+    """
+
+    __slots__ = ("blocks", "starts", "line_count")
+
+    def __init__(self, blocks: list[str], starts: list[int], line_count: int):
+        self.blocks = blocks
+        self.starts = starts
+        self.line_count = line_count
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def block_at(self, line: int) -> int:
+        """Index of the block containing *line* (the nearest one before it)."""
+        if not self.starts:
+            return -1
+        return max(0, bisect.bisect_right(self.starts, line) - 1)
+
+    def line_range(self, index: int) -> tuple[int, int]:
+        """``(first, end)`` source lines of block *index*, end exclusive."""
+        end = self.starts[index + 1] if index + 1 < len(self.starts) else self.line_count
+        return self.starts[index], end
+
+
+# Extras enabled for markdown2 everywhere Markdown is rendered
+DEFAULT_EXTRAS = [
+    "fenced-code-blocks",
+    "tables",
+    "strike",
+    "task_list",
+    "code-friendly",
+    "toc",
+]
+
+
+class CodeHighlighter:
+    """Pygments highlighting for fenced code, cached per (lexer, code).
+
+    The markup uses CSS classes under ``.codehilite`` rather than inline
+    colours, so one cached entry serves both themes; the colours come from
+    the theme stylesheet (see :func:`highlight_css`).  Unchanged code
+    blocks are therefore never lexed twice, whatever the theme.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, bytes], str] = OrderedDict()
+        self._lexers: dict[str, object] = {}
+        self._formatter = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pygments  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def lexer(self, lang: str):
+        """Pygments lexer for *lang*, or None if unknown or Pygments is missing."""
+        lang = (lang or "").strip().lower()
+        if not lang:
+            return None
+        try:
+            return self._lexers[lang]
+        except KeyError:
+            pass
+        try:
+            from pygments import lexers
+            from pygments.util import ClassNotFound
+        except ImportError:
+            lexer = None
+        else:
+            try:
+                lexer = lexers.get_lexer_by_name(lang)
+            except ClassNotFound:
+                lexer = None
+        self._lexers[lang] = lexer
+        return lexer
+
+    def highlight(self, code: str, lang: str) -> str | None:
+        """Highlighted HTML for *code*, or None if *lang* has no lexer."""
+        lexer = self.lexer(lang)
+        if lexer is None:
+            return None
+        return self.highlight_with(code, lexer)
+
+    def highlight_with(self, code: str, lexer) -> str:
+        key = (lexer.name, hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        import pygments
+        html = pygments.highlight(code, lexer, self._get_formatter())
+        if lexer.aliases:
+            # Name the language like unhighlighted fences do, so converting
+            # the page back to Markdown keeps it
+            html = html.replace("<code>", f'<code class="language-{lexer.aliases[0]}">', 1)
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def _get_formatter(self):
+        if self._formatter is None:
+            from pygments.formatters import HtmlFormatter
+
+            class _CodeFormatter(HtmlFormatter):
+                # <div class="codehilite"><pre><code>...</code></pre></div>,
+                # the same markup markdown2 produces
+                def wrap(self, source, outfile=None):
+                    source = self._wrap_pre(self._wrap_code(source))
+                    if outfile is None:  # pygments >= 2.12 adds the div itself
+                        return source
+                    return self._wrap_div(source)
+
+                def _wrap_code(self, inner):
+                    yield 0, "<code>"
+                    yield from inner
+                    yield 0, "</code>"
+
+            self._formatter = _CodeFormatter(cssclass="codehilite")
+        return self._formatter
+
+
+_code_highlighter = CodeHighlighter()
+
+
+def get_code_highlighter() -> CodeHighlighter:
+    """The highlighter shared by every backend in the process."""
+    return _code_highlighter
+
+
+def highlight_css(style: str) -> str:
+    """Pygments colour rules for *style*, scoped to ``.codehilite``."""
+    try:
+        from pygments.formatters import HtmlFormatter
+        from pygments.util import ClassNotFound
+    except ImportError:
+        return ""
+    try:
+        defs = HtmlFormatter(style=style).get_style_defs(".codehilite")
+    except ClassNotFound:
+        return ""
+    # Keep the theme's own code background
+    return "\n".join(
+        line for line in defs.splitlines()
+        if not line.startswith(".codehilite { background")
+    )
+
+
+class MarkdownBackend:
+    """A Markdown parser that turns source text into an HTML fragment."""
+
+    name = ""
+
+    def render(self, text: str) -> str:
+        raise NotImplementedError
+
+    def options_key(self) -> tuple:
+        """Settings that change the output, used in cache keys."""
+        return (self.name,)
+
+
+class _Markdown2(markdown2.Markdown):
+    """markdown2 with fenced code highlighted through the shared cache."""
+
+    def _get_pygments_lexer(self, lexer_name: str):
+        return _code_highlighter.lexer(lexer_name)
+
+    def _color_with_pygments(self, codeblock: str, lexer, **formatter_opts) -> str:
+        return _code_highlighter.highlight_with(codeblock, lexer)
+
+
+class Markdown2Backend(MarkdownBackend):
+    name = "markdown2"
+
+    def __init__(self, extras: list[str] | None = None):
+        self.extras = list(DEFAULT_EXTRAS if extras is None else extras)
+        if "fenced-code-blocks" in self.extras and not CodeHighlighter.available():
+            # No Pygments: at least tag code with its language for CSS/JS
+            self.extras.append("highlightjs-lang")
+
+    def render(self, text: str) -> str:
+        return _Markdown2(extras=self.extras).convert(text)
+
+    def options_key(self) -> tuple:
+        return (self.name,) + tuple(self.extras)
+
+
+class MarkdownItBackend(MarkdownBackend):
+    """markdown-it-py (CommonMark) with tables, strikethrough and task lists."""
+
+    name = "markdown-it"
+
+    def __init__(self):
+        try:
+            from markdown_it import MarkdownIt
+        except ImportError as e:
+            raise ImportError("markdown-it-py not installed. Install with: pip install markdown-it-py mdit-py-plugins") from e
+        self._md = MarkdownIt("commonmark", {"html": True}).enable(["table", "strikethrough"])
+        self._md.add_render_rule("fence", self._fence)
+        try:
+            from mdit_py_plugins.anchors import anchors_plugin
+            from mdit_py_plugins.tasklists import tasklists_plugin
+        except ImportError:
+            pass
+        else:
+            self._md.use(tasklists_plugin).use(anchors_plugin, max_level=6)
+
+    def render(self, text: str) -> str:
+        return self._md.render(text)
+
+    @staticmethod
+    def _fence(renderer, tokens, idx, options, env) -> str:
+        token = tokens[idx]
+        lang = token.info.split(None, 1)[0] if token.info else ""
+        html = _code_highlighter.highlight(token.content, lang) if lang else None
+        return html or type(renderer).fence(renderer, tokens, idx, options, env)
+
+
+class MistuneBackend(MarkdownBackend):
+    """mistune with tables, strikethrough and task lists."""
+
+    name = "mistune"
 
-class MarkdownRenderer:
     def __init__(self):
-        # Enable common extras for better Markdown support
-        self._extras = [
-            "fenced-code-blocks",
-            "tables",
-            "strike",
-            "task_list",
-            "code-friendly",
-            "toc",
-        ]
+        try:
+            import mistune
+        except ImportError as e:
+            raise ImportError("mistune not installed. Install with: pip install mistune") from e
+        class _Renderer(mistune.HTMLRenderer):
+            def block_code(self, code, info=None):
+                lang = info.split(None, 1)[0] if info else ""
+                html = _code_highlighter.highlight(code, lang) if lang else None
+                return html or super().block_code(code, info)
+
+        self._md = mistune.create_markdown(
+            escape=False, renderer=_Renderer(escape=False),
+            plugins=["strikethrough", "table", "task_lists"],
+        )
+
+    def render(self, text: str) -> str:
+        return self._md(text)
+
+
+BACKENDS: dict[str, type[MarkdownBackend]] = {
+    Markdown2Backend.name: Markdown2Backend,
+    MarkdownItBackend.name: MarkdownItBackend,
+    MistuneBackend.name: MistuneBackend,
+}
+
+
+def available_backends() -> list[str]:
+    """Names of the backends whose parser package is installed."""
+    names = []
+    for name, backend_cls in BACKENDS.items():
+        try:
+            backend_cls()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(name: str | None = None) -> MarkdownBackend:
+    """Create a backend by name; defaults to $PYMD_MARKDOWN_BACKEND or markdown2."""
+    name = name or os.getenv("PYMD_MARKDOWN_BACKEND") or Markdown2Backend.name
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown markdown backend: {name!r} (choose from {', '.join(BACKENDS)})")
+    return backend_cls()
+
+
+class RenderCache:
+    """Bounded, thread-safe LRU cache of rendered output.
+
+    Entries are keyed by ``(content hash, dark, base_path, options)`` and
+    evicted least-recently-used first once their estimated size exceeds
+    ``max_bytes``.  One instance is shared by every renderer in the process
+    (see :func:`get_render_cache`), so the desktop app and the web server
+    both reuse renders of identical content.
+    """
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, dark: bool | None, base_path: str | None, options: tuple) -> tuple:
+        digest = hashlib.blake2b((text or "").encode("utf-8"), digest_size=20).hexdigest()
+        return (digest, dark, base_path, options)
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, value) -> None:
+        size = _estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        """Change the memory budget, evicting entries if necessary."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, base_path: str | None = None) -> int:
+        """Drop all entries, or only those rendered against *base_path*.
+
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            if base_path is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self.current_bytes = 0
+                return removed
+            stale = [key for key in self._entries if key[2] == base_path]
+            for key in stale:
+                self.current_bytes -= self._entries.pop(key)[1]
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+
+
+def _estimate_size(value) -> int:
+    if isinstance(value, BlockMap):
+        return _estimate_size(value.blocks) + _estimate_size(value.starts)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+_shared_cache: RenderCache | None = None
+
+
+def get_render_cache() -> RenderCache:
+    """Return the process-wide render cache."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RenderCache()
+    return _shared_cache
+
+
+class MarkdownRenderer:
+    def __init__(self, incremental: bool = False, cache: RenderCache | None = None,
+                 asset_base: str | None = None, backend: str | MarkdownBackend | None = None,
+                 profile: bool = False, lazy_math: bool = False):
+        # Parser backend (markdown2 with common extras unless configured)
+        if backend is None or isinstance(backend, str):
+            backend = get_backend(backend)
+        self.backend = backend
+        # In incremental mode to_html() goes through render_blocks() and
+        # only re-renders blocks whose fingerprint changed.
+        self.incremental = incremental
+        self._block_cache: dict[bytes, str] = {}
+        self.cache = cache if cache is not None else get_render_cache()
+        # e.g. "pymd://": load CSS, MathJax and local images through the
+        # desktop URL scheme handler instead of inlining / file:// URLs
+        self.asset_base = asset_base
+        # (base_path, src) -> (resolved src, mtime of the directory probed)
+        self._image_paths: dict[tuple[str | None, str], tuple[str, int | None]] = {}
+        self._base_dirs: dict[str, Path] = {}
+        # Emit formulas as placeholders typeset on demand by LAZY_MATH_SCRIPT
+        self.lazy_math = lazy_math
+        # Opt-in per-stage timings, see last_stats
+        self.profile = profile
+        self._local = threading.local()
+
+    @property
+    def last_stats(self) -> dict:
+        """Timings and counters of the last profiled render on this thread.
+
+        Durations are in milliseconds: ``images`` (image path rewriting),
+        ``markdown`` (parser), ``template`` (document shell) and ``total``.
+        Counters: ``chars``, ``lines``, ``blocks`` (top-level blocks seen),
+        ``rendered`` (fragments actually parsed) and ``cached`` (served from
+        the render cache).  Empty unless ``profile`` is enabled.
+        """
+        return getattr(self._local, "last", None) or {}
+
+    @contextmanager
+    def _profiled(self, text: str):
+        # Only the outermost public call records; nested calls add to it
+        if not self.profile or getattr(self._local, "stats", None) is not None:
+            yield None
+            return
+        text = text or ""
+        stats = {
+            "images": 0.0, "markdown": 0.0, "template": 0.0, "total": 0.0,
+            "chars": len(text), "lines": text.count("\n") + 1 if text else 0,
+            "blocks": 0, "rendered": 0, "cached": False,
+        }
+        self._local.stats = stats
+        t0 = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats["total"] = (time.perf_counter() - t0) * 1000
+            self._local.stats = None
+            self._local.last = stats
+
+    def _stats(self) -> dict | None:
+        return getattr(self._local, "stats", None) if self.profile else None
+
+    def options_key(self) -> tuple:
+        """Options that affect the rendered output, used in cache keys."""
+        return self.backend.options_key() + (self.asset_base, self.lazy_math)
 
     def to_html(self, text: str, dark: bool = False, base_path: str = None) -> str:
-        # Process images to handle local paths
-        processed_text = self._process_images(text or "", base_path)
-        
-        html_body = markdown2.markdown(processed_text, extras=self._extras)
-        css = DARK_CSS if dark else LIGHT_CSS
+        with self._profiled(text) as stats:
+            key = self.html_cache_key(text, dark, base_path)
+            html = self.cache.get(key)
+            if html is None:
+                html = self.wrap_html(self._render_body(text, base_path), dark)
+                self.cache.put(key, html)
+            elif stats is not None:
+                stats["cached"] = True
+        return html
+
+    def html_cache_key(self, text: str, dark: bool = False, base_path: str = None) -> tuple:
+        """Render cache key under which :meth:`to_html` stores its result."""
+        return self.cache.make_key(text, dark, base_path, ("html",) + self.options_key())
+
+    def render_body(self, text: str, base_path: str = None) -> str:
+        """Render markdown to the HTML fragment placed inside ``.content``."""
+        with self._profiled(text) as stats:
+            key = self.cache.make_key(text, None, base_path, ("body",) + self.options_key())
+            body = self.cache.get(key)
+            if body is None:
+                body = self._render_body(text, base_path)
+                self.cache.put(key, body)
+            elif stats is not None:
+                stats["cached"] = True
+        return body
+
+    def render_blocks(self, text: str, base_path: str = None) -> list[str]:
+        """Render markdown as a list of per-block HTML fragments.
+
+        Each top-level block is fingerprinted; blocks seen in the previous
+        call are served from the cache, so an edit only pays for the blocks
+        it touched.  Callers can diff the returned list to patch a view.
+        """
+        return self.render_block_map(text, base_path).blocks
+
+    def render_block_map(self, text: str, base_path: str = None) -> BlockMap:
+        """:meth:`render_blocks` plus the source line of every block."""
+        with self._profiled(text) as stats:
+            key = self.cache.make_key(text, None, base_path, ("blocks",) + self.options_key())
+            block_map = self.cache.get(key)
+            if block_map is None:
+                block_map = self._render_block_map(text, base_path)
+                self.cache.put(key, block_map)
+            elif stats is not None:
+                stats["cached"] = True
+        return block_map
+
+    def iter_blocks(self, text: str, base_path: str = None) -> Iterator[str]:
+        """Yield per-block HTML fragments as they are rendered.
+
+        Unlike :meth:`render_blocks` nothing is cached or collected, so the
+        first block is available as soon as it is rendered regardless of
+        document size.
+        """
+        return _iter_dedupe_header_ids(
+            self._render_fragment(block, base_path) for block in split_blocks(text or "")
+        )
+
+    def refresh_images(self, base_path: str = None) -> None:
+        """Forget resolved image paths and renders that embed them.
+
+        Directory mtimes catch most changes on their own; call this when
+        images change in a way that does not touch the directory (e.g. a
+        file replaced in place on a network share).
+        """
+        if base_path is None:
+            self._image_paths.clear()
+            self._base_dirs.clear()
+        else:
+            for key in [k for k in self._image_paths if k[0] == base_path]:
+                del self._image_paths[key]
+            self._base_dirs.pop(base_path, None)
+        self._block_cache = {}
+        self.cache.invalidate(base_path)
+
+    def _render_body(self, text: str, base_path: str = None) -> str:
+        if self.incremental:
+            return "\n".join(self._render_block_map(text, base_path).blocks)
+        stats = self._stats()
+        if stats is not None:
+            stats["blocks"] = 1
+        return self._render_fragment(text or "", base_path)
+
+    def _render_fragment(self, text: str, base_path: str = None) -> str:
+        return self._parse_profiled(self._rewrite_images(text, base_path))
+
+    def _rewrite_images(self, text: str, base_path: str = None, mtimes: dict = None) -> str:
+        # Image sources are rewritten only for the text being rendered (a
+        # single block in incremental mode), and skipped when it has none.
+        if "![" not in text:
+            return text
+        stats = self._stats()
+        if stats is None:
+            return self._process_images(text, base_path, mtimes)
+        t0 = time.perf_counter()
+        text = self._process_images(text, base_path, mtimes)
+        stats["images"] += (time.perf_counter() - t0) * 1000
+        return text
+
+    def _parse_profiled(self, text: str) -> str:
+        stats = self._stats()
+        if stats is None:
+            return self._parse(text)
+        t0 = time.perf_counter()
+        html = self._parse(text)
+        stats["markdown"] += (time.perf_counter() - t0) * 1000
+        stats["rendered"] += 1
+        return html
+
+    def _parse(self, text: str) -> str:
+        if self.lazy_math and ("$" in text or "\\(" in text or "\\[" in text):
+            text, formulas = _extract_math(text)
+            html = self.backend.render(text)
+            if formulas:
+                html = _MATH_TOKEN_RE.sub(lambda m: _math_placeholder(formulas[int(m.group(1))]), html)
+                if "pymdmath" in html:  # tokens slugified into heading ids
+                    html = _MATH_ID_TOKEN_RE.sub(
+                        lambda m: re.sub(r"[^\w-]", "", formulas[int(m.group(1))]).lower(), html
+                    )
+            return html
+        return self.backend.render(text)
+
+    def _render_block_map(self, text: str, base_path: str = None) -> BlockMap:
+        previous = self._block_cache
+        cache: dict[bytes, str] = {}
+        salt = (base_path or "").encode("utf-8") + b"\0"
+        html_blocks = []
+        starts = []
+        mtimes: dict[str, int | None] = {}
+        for start, block in split_blocks_with_lines(text or ""):
+            starts.append(start)
+            # Keyed on the block with image sources resolved, so a block is
+            # rendered again when an image it references appears or moves
+            block = self._rewrite_images(block, base_path, mtimes)
+            key = hashlib.blake2b(salt + block.encode("utf-8"), digest_size=16).digest()
+            html = cache.get(key) or previous.get(key)
+            if html is None:
+                html = self._parse_profiled(block)
+            cache[key] = html
+            html_blocks.append(html)
+        stats = self._stats()
+        if stats is not None:
+            stats["blocks"] = len(html_blocks)
+        # Swap rather than mutate so concurrent readers never see a half-built dict
+        self._block_cache = cache
+        line_count = text.count("\n") + 1 if text else 0
+        return BlockMap(_dedupe_header_ids(html_blocks), starts, line_count)
+
+    def wrap_html(self, html_body: str, dark: bool = False, scripts: str = "") -> str:
+        """Wrap a rendered body fragment in the full preview document.
+
+        *scripts* is extra markup appended to ``<head>`` (e.g. the live
+        preview patch helper).
+        """
+        stats = self._stats()
+        if stats is None:
+            return self.html_prefix(dark, scripts) + html_body + self.html_suffix()
+        t0 = time.perf_counter()
+        html = self.html_prefix(dark, scripts) + html_body + self.html_suffix()
+        stats["template"] += (time.perf_counter() - t0) * 1000
+        return html
+
+    def html_prefix(self, dark: bool = False, scripts: str = "") -> str:
+        """Document shell up to and including the opening ``.content`` div."""
+        if self.asset_base:
+            theme = "dark" if dark else "light"
+            style = f'<link rel="stylesheet" href="{self.asset_base}assets/{theme}.css?v={APP_VERSION}" />'
+            mathjax_src = f"{self.asset_base}mathjax/tex-mml-chtml.js"
+        else:
+            style = f"<style>\n{DARK_CSS if dark else LIGHT_CSS}\n</style>"
+            mathjax_src = MATHJAX_CDN_URL
+        if self.lazy_math:
+            # Placeholders are typeset by LAZY_MATH_SCRIPT, not by a page scan
+            startup = """,
+  startup: {
+    typeset: false,
+    ready: function () {
+      MathJax.startup.defaultReady();
+      if (window.pymdMath) { pymdMath.ready(); }
+    }
+  }"""
+            scripts = LAZY_MATH_SCRIPT + scripts
+        else:
+            startup = ""
         return f"""
 <!DOCTYPE html>
 <html>
 <head>
 <meta charset=\"utf-8\" />
-<style>
-{css}
-</style>
+{style}
 <!-- MathJax for LaTeX math rendering -->
 <script>
 window.MathJax = {{
@@ -44,67 +823,367 @@ window.MathJax = {{
   }},
   options: {{
     skipHtmlTags: ['script', 'noscript', 'style', 'textarea', 'pre']
-  }}
+  }}{startup}
 }};
 </script>
-<script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js" async></script>
+<script src="{mathjax_src}" async></script>
+{scripts}
 </head>
 <body>
-<div class=\"content\">{html_body}</div>
+<div class=\"content\">"""
+
+    def html_suffix(self) -> str:
+        """Closing markup matching :meth:`html_prefix`."""
+        return """</div>
 </body>
 </html>
 """
 
-    def _process_images(self, text: str, base_path: str = None) -> str:
+    def _process_images(self, text: str, base_path: str = None, mtimes: dict = None) -> str:
         """Process image paths to handle local files and relative paths"""
         if not text:
             return text
-            
-        # Pattern to match markdown images: ![alt](src)
-        image_pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
+
+        # Directory mtimes are stat'ed at most once per call (or per *mtimes*)
+        if mtimes is None:
+            mtimes = {}
         
         def replace_image(match):
             alt_text = match.group(1)
             src = match.group(2)
             
             # Handle different types of image sources
-            processed_src = self._resolve_image_path(src, base_path)
+            processed_src = self._resolve_image_path(src, base_path, mtimes)
             
             return f'![{alt_text}]({processed_src})'
         
-        return re.sub(image_pattern, replace_image, text)
+        return _IMAGE_RE.sub(replace_image, text)
     
-    def _resolve_image_path(self, src: str, base_path: str = None) -> str:
-        """Resolve image path for different scenarios"""
+    def _resolve_image_path(self, src: str, base_path: str = None, mtimes: dict = None) -> str:
+        """Resolve image path for different scenarios, memoized per (base_path, src).
+
+        A cached result stays valid while the mtime of the directory that
+        would contain the image is unchanged, so an unchanged note costs one
+        ``stat`` per image directory instead of several per image.
+        """
         # If it's already a URL, keep it as is
         parsed = urlparse(src)
         if parsed.scheme in ('http', 'https', 'data'):
             return src
-        
+
+        key = (base_path, src)
+        probe_dir = self._image_probe_dir(src, base_path)
+        if probe_dir is None:
+            mtime = None
+        elif mtimes is not None and probe_dir in mtimes:
+            mtime = mtimes[probe_dir]
+        else:
+            mtime = _dir_mtime(probe_dir)
+            if mtimes is not None:
+                mtimes[probe_dir] = mtime
+
+        cached = self._image_paths.get(key)
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
+        resolved = self._resolve_image_path_uncached(src, base_path)
+        self._image_paths[key] = (resolved, mtime)
+        return resolved
+
+    def _image_probe_dir(self, src: str, base_path: str = None) -> str | None:
+        """Directory whose contents decide how *src* resolves."""
+        src = src.replace('\\', '/')
+        if os.path.isabs(src):
+            return os.path.dirname(src)
+        if not base_path:
+            return None
+        base_dir = self._base_dirs.get(base_path)
+        if base_dir is None:
+            base_dir = Path(base_path).parent if os.path.isfile(base_path) else Path(base_path)
+            self._base_dirs[base_path] = base_dir
+        return os.path.dirname(os.path.join(base_dir, src))
+
+    def _resolve_image_path_uncached(self, src: str, base_path: str = None) -> str:
         # Convert Windows path separators
         src = src.replace('\\', '/')
         
         # If it's an absolute path, convert to file:// URL
         if os.path.isabs(src):
             # Convert to file:// URL for local files
-            return Path(src).resolve().as_uri()
+            return self._local_url(Path(src).resolve())
         
         # If we have a base path, resolve relative to it
         if base_path:
-            base_dir = Path(base_path).parent if os.path.isfile(base_path) else Path(base_path)
+            base_dir = self._base_dirs.get(base_path)
+            if base_dir is None:
+                base_dir = Path(base_path).parent if os.path.isfile(base_path) else Path(base_path)
             full_path = base_dir / src
             if full_path.exists():
-                return full_path.resolve().as_uri()
+                return self._local_url(full_path.resolve())
         
         # Return as-is for relative paths or if file doesn't exist
         return src
 
+    def _local_url(self, path: Path) -> str:
+        if not self.asset_base:
+            return path.as_uri()
+        posix = path.as_posix()
+        if not posix.startswith("/"):
+            posix = "/" + posix  # Windows drive paths: /C:/...
+        return f"{self.asset_base}file{quote(posix, safe='/:')}"
+
+
+def _extract_math(text: str) -> tuple[str, list[str]]:
+    """Replace formulas outside code with ``PYMDMATH<n>X`` tokens.
+
+    Returns the new text and the formula sources (delimiters included) in
+    token order.  Fenced and indented code blocks, inline code spans and
+    text that renders into an attribute (link destinations, image alt
+    text, HTML tags) are skipped.
+    """
+    formulas: list[str] = []
+
+    def replace(match):
+        if match.group("code") or match.group("verbatim"):
+            return match.group(0)
+        if match.group("escaped"):
+            return "&#36;"  # MathJax's processEscapes did this before
+        formulas.append(match.group(0))
+        return f"PYMDMATH{len(formulas) - 1}X"
+
+    out: list[str] = []
+    prose: list[str] = []
+    fence: str | None = None
+    after_blank = True
+    in_code = False  # indented code block
+    in_list = False
+    for line in text.splitlines(keepends=True):
+        if fence is None:
+            if not line.strip():
+                after_blank = True
+                (out if in_code else prose).append(line)
+                continue
+            indented = line.startswith(("    ", "\t"))
+            # Indented code needs a blank line (or more code) before it;
+            # inside a list the indent is a continuation instead
+            in_code = indented and not in_list and (after_blank or in_code)
+            after_blank = False
+            if not indented:
+                in_list = bool(_LIST_ITEM_RE.match(line))
+            m = None if in_code else _FENCE_OPEN_RE.match(line)
+            if m is None and not in_code:
+                prose.append(line)
+                continue
+            out.append(_MATH_RE.sub(replace, "".join(prose)))
+            prose = []
+            if m is not None:
+                fence = m.group(1)
+        elif line.strip().startswith(fence) and not line.strip().strip(fence[0]):
+            fence = None
+            after_blank = False
+        out.append(line)
+    out.append(_MATH_RE.sub(replace, "".join(prose)))
+    return "".join(out), formulas
+
+
+def math_spans(text: str) -> Iterator[tuple[int, int]]:
+    """``(start, end)`` of every formula :func:`_extract_math` finds in prose *text*."""
+    for match in _MATH_RE.finditer(text):
+        if not (match.group("code") or match.group("verbatim") or match.group("escaped")):
+            yield match.span()
+
+
+def _math_placeholder(source: str) -> str:
+    display = source.startswith(("$$", "\\["))
+    cls = "pymd-math pymd-math-display" if display else "pymd-math"
+    src = html_escape(source)
+    # tex2jax_ignore keeps MathJax's own typesetting calls away from it
+    return (f'<span class="{cls} tex2jax_ignore" contenteditable="false" '
+            f'data-src="{src}">{src}</span>')
+
+
+def format_render_stats(stats: dict) -> str:
+    """One-line summary of :attr:`MarkdownRenderer.last_stats`."""
+    if not stats:
+        return ""
+    if stats["cached"]:
+        return f"cache hit · {stats['total']:.1f} ms · {stats['chars']} chars"
+    return (
+        f"images {stats['images']:.1f} · markdown {stats['markdown']:.1f} · "
+        f"template {stats['template']:.1f} · total {stats['total']:.1f} ms · "
+        f"{stats['chars']} chars / {stats['lines']} lines / "
+        f"{stats['rendered']}/{stats['blocks']} blocks"
+    )
+
+
+def _dir_mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def diff_blocks(old: list[str], new: list[str]) -> tuple[int, int, list[str]]:
+    """Return ``(start, removed, inserted)`` turning *old* into *new*.
+
+    Only the common prefix and suffix are matched, which is exact for the
+    single contiguous change a keystroke produces.
+    """
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    return start, end_old - start, new[start:end_new]
+
+
+def _dedupe_header_ids(html_blocks: list[str]) -> list[str]:
+    """Make heading ids unique across separately rendered blocks.
+
+    markdown2 only de-duplicates ids within a single call, so two blocks
+    with the same heading would otherwise both get ``id="intro"``.
+    """
+    return list(_iter_dedupe_header_ids(html_blocks))
+
+
+def _iter_dedupe_header_ids(html_blocks: Iterable[str]) -> Iterator[str]:
+    """Lazy form of :func:`_dedupe_header_ids`.
+
+    markdown2 numbers a repeated slug ``slug-2``, ``slug-3`` within one
+    call (and an empty slug always, from ``-1``); those ids are mapped back
+    to their slug and renumbered the same way across all blocks.
+    """
+    seen: dict[str, int] = {}
+    in_block: dict[str, int] = {}
+
+    def rename(match):
+        anchor = match.group(2)
+        slug = anchor
+        numbered = _HEADER_ID_COUNT_RE.match(anchor)
+        if numbered and in_block.get(numbered.group(1), 0) == int(numbered.group(2)) - 1 \
+                and (numbered.group(1) == "" or numbered.group(2) != "1"):
+            slug = numbered.group(1)
+        in_block[slug] = in_block.get(slug, 0) + 1
+        count = seen.get(slug, 0) + 1
+        seen[slug] = count
+        new = f"{slug}-{count}" if count > 1 or not slug else slug
+        if new == anchor:
+            return match.group(0)
+        return f"{match.group(1)}{new}{match.group(3)}"
+
+    for html in html_blocks:
+        if '<h' in html:
+            in_block.clear()
+            html = _HEADER_ID_RE.sub(rename, html)
+        yield html
+
+
+# Loaded before the preview helpers when MarkdownRenderer.lazy_math is on.
+# Formula placeholders are typeset with tex2chtml once they come within
+# 600px of the viewport; the result is cached per formula source, so a
+# re-rendered block reuses the typeset nodes of unchanged formulas.
+LAZY_MATH_SCRIPT = """
+<script>
+window.pymdMath = (function () {
+  var cache = new Map();
+  var queue = [];
+  var ready = false;
+  var markReady;
+  var readyPromise = new Promise(function (resolve) { markReady = resolve; });
+  var stylesDirty = false;
+  var MAX_CACHED = 2000;
+
+  function tex(src) {
+    var n = src.startsWith('$$') ? 2 : (src.charAt(0) === '$' ? 1 : 2);
+    return src.slice(n, src.length - n);
+  }
+  function place(el, node) {
+    el.textContent = '';
+    el.appendChild(node);
+    el.setAttribute('data-typeset', '');
+  }
+  function updateStyles() {
+    stylesDirty = false;
+    MathJax.startup.document.clear();
+    MathJax.startup.document.updateDocument();
+  }
+  function typeset(el) {
+    var src = el.getAttribute('data-src');
+    var display = el.classList.contains('pymd-math-display');
+    var key = (display ? 'D' : 'I') + src;
+    var hit = cache.get(key);
+    if (hit) {
+      place(el, hit.cloneNode(true));
+      return Promise.resolve();
+    }
+    if (!ready) {
+      queue.push(el);
+      return Promise.resolve();
+    }
+    return MathJax.tex2chtmlPromise(tex(src), { display: display }).then(function (node) {
+      cache.set(key, node.cloneNode(true));
+      if (cache.size > MAX_CACHED) { cache.delete(cache.keys().next().value); }
+      place(el, node);
+      if (!stylesDirty) {
+        stylesDirty = true;
+        requestAnimationFrame(updateStyles);
+      }
+    }).catch(function () {});
+  }
+
+  var observer = new IntersectionObserver(function (entries) {
+    entries.forEach(function (entry) {
+      if (entry.isIntersecting) {
+        observer.unobserve(entry.target);
+        typeset(entry.target);
+      }
+    });
+  }, { rootMargin: '600px 0px' });
+
+  function scan(root) {
+    root.querySelectorAll('.pymd-math:not([data-typeset])').forEach(function (el) {
+      observer.observe(el);
+    });
+  }
+  document.addEventListener('DOMContentLoaded', function () { scan(document.body); });
+
+  return {
+    scan: scan,
+    forget: function (root) {
+      root.querySelectorAll('.pymd-math').forEach(function (el) { observer.unobserve(el); });
+    },
+    ready: function () {
+      ready = true;
+      queue.splice(0).forEach(typeset);
+      markReady();
+    },
+    // Typeset every remaining placeholder now, e.g. before printing
+    typesetAll: function () {
+      return readyPromise.then(function () {
+        var pending = [];
+        document.querySelectorAll('.pymd-math:not([data-typeset])').forEach(function (el) {
+          observer.unobserve(el);
+          pending.push(typeset(el));
+        });
+        return Promise.all(pending);
+      }).then(function () {
+        updateStyles();
+        return document.fonts.ready;
+      });
+    }
+  };
+})();
+</script>
+"""
 
 LIGHT_CSS = """
 body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, 'Noto Sans', 'PingFang SC', 'Hiragino Sans GB', 'Microsoft YaHei', sans-serif; margin: 0; padding: 0; }
 .content { padding: 16px 24px; max-width: 1000px; margin: 0 auto; }
 pre, code { background: #f5f5f7; border-radius: 6px; }
 pre { padding: 12px; overflow-x: auto; }
+.pymd-math-display { display: block; text-align: center; margin: 1em 0; }
 blockquote { border-left: 4px solid #e0e0e0; margin: 0; padding: 8px 16px; color: #555; background: #fafafa; }
 table { border-collapse: collapse; }
 th, td { border: 1px solid #ddd; padding: 6px 10px; }
@@ -147,6 +1226,7 @@ body { background: #0f1115; color: #e2e8f0; font-family: -apple-system, BlinkMac
 .content { padding: 16px 24px; max-width: 1000px; margin: 0 auto; }
 pre, code { background: #1a1f2b; color: #e2e8f0; border-radius: 6px; }
 pre { padding: 12px; overflow-x: auto; }
+.pymd-math-display { display: block; text-align: center; margin: 1em 0; }
 blockquote { border-left: 4px solid #334155; margin: 0; padding: 8px 16px; color: #94a3b8; background: #0b0e14; }
 th, td { border: 1px solid #243247; padding: 6px 10px; }
 a { color: #7aa2f7; }
@@ -182,3 +1262,7 @@ img {
     }
 }
 """
+
+# Code highlighting colours, generated once per theme
+LIGHT_CSS += highlight_css("default")
+DARK_CSS += highlight_css("monokai")
@@ -8,15 +8,20 @@ from __future__ import annotations
 
 import io
 import json
+import multiprocessing
 import os
 import tempfile
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, UploadFile, File, Form, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
 # ---------------------------------------------------------------------------
@@ -27,7 +32,7 @@ _src = Path(__file__).parent.parent.parent
 if str(_src) not in sys.path:
     sys.path.insert(0, str(_src))
 
-from pymd_editor.renderer import MarkdownRenderer
+from pymd_editor.renderer import MarkdownRenderer, RenderCache, get_render_cache
 from pymd_editor.exporter import WordExporter
 from pymd_editor.config import APP_VERSION
 
@@ -35,7 +40,13 @@ from pymd_editor.config import APP_VERSION
 # App
 # ---------------------------------------------------------------------------
 
-app = FastAPI(title="PyMD Editor", version=APP_VERSION, docs_url="/api/docs")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    _render_service.shutdown()
+
+
+app = FastAPI(title="PyMD Editor", version=APP_VERSION, docs_url="/api/docs", lifespan=_lifespan)
 
 def _cors_origins() -> list[str]:
     defaults = [
@@ -57,9 +68,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-_renderer = MarkdownRenderer()
+# PYMD_RENDER_TIMING=1 adds per-stage Server-Timing headers to /api/render
+_renderer = MarkdownRenderer(profile=os.getenv("PYMD_RENDER_TIMING", "") not in ("", "0"))
 _word_exporter = WordExporter()
 
+if os.getenv("PYMD_RENDER_CACHE_MB"):
+    get_render_cache().resize(int(os.getenv("PYMD_RENDER_CACHE_MB")) * 1024 * 1024)
+
 # Base directory for ALL file operations — overridden by serve.py at startup
 BASE_DIR: Path = Path.home()
 DEPLOYMENT_MODE = os.getenv("PYMD_DEPLOYMENT_MODE", "local")
@@ -69,6 +84,9 @@ PUBLIC_BASE_URL = os.getenv("PYMD_PUBLIC_BASE_URL", "").strip()
 def _feature_flags() -> dict[str, bool]:
     return {
         "markdown_render": True,
+        "render_cache": True,
+        "render_stream": True,
+        "render_pool": _render_service.workers > 0,
         "markdown_export_word": True,
         "folder_browse": True,
         "pdf_info": True,
@@ -369,8 +387,140 @@ def workspace_sync_diff(req: WorkspaceDiffRequest):
 # Routes — Render
 # ---------------------------------------------------------------------------
 
+# ---------------------------------------------------------------------------
+# Render service — large documents are rendered in a process pool
+# ---------------------------------------------------------------------------
+
+_worker_renderer: MarkdownRenderer | None = None
+
+
+def _render_in_worker(markdown: str, dark: bool, base_path: Optional[str],
+                      backend: str, profile: bool) -> tuple[str, dict]:
+    """Pool worker entry point; must stay a picklable module-level function."""
+    global _worker_renderer
+    if _worker_renderer is None:
+        # The parent caches results, so workers keep no cache of their own
+        _worker_renderer = MarkdownRenderer(cache=RenderCache(max_bytes=0),
+                                            backend=backend, profile=profile)
+    html = _worker_renderer.to_html(markdown, dark=dark, base_path=base_path)
+    return html, _worker_renderer.last_stats
+
+
+class RenderService:
+    """Render documents inline or, above a size threshold, in worker processes.
+
+    Rendering is CPU bound, so threads serialize on the GIL and one huge
+    document would stall every other preview.  Documents of at least
+    ``inline_chars`` characters are sent to a ``ProcessPoolExecutor``
+    (created on first use).  At most ``max_pending`` pool renders may be
+    queued or running; beyond that requests fail fast with 503, and a
+    request waiting longer than ``timeout`` seconds fails with 504.  A
+    running render cannot be cancelled, so on a timeout the pool is
+    replaced and its workers are terminated; that frees the slot, and
+    other renders still running in the old pool fail with 503.
+    """
+
+    def __init__(self, renderer: MarkdownRenderer, workers: int, inline_chars: int,
+                 max_pending: int, timeout: float):
+        self.renderer = renderer
+        self.workers = workers
+        self.inline_chars = inline_chars
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def render(self, markdown: str, dark: bool = False, base_path: Optional[str] = None) -> tuple[str, dict]:
+        """Return ``(html, stats)``; stats are empty unless profiling is on."""
+        if self.workers <= 0 or len(markdown) < self.inline_chars:
+            html = self.renderer.to_html(markdown, dark=dark, base_path=base_path)
+            return html, self.renderer.last_stats if self.renderer.profile else {}
+
+        cache = self.renderer.cache
+        key = self.renderer.html_cache_key(markdown, dark, base_path)
+        html = cache.get(key)
+        if html is not None:
+            return html, {}
+
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(status_code=503, detail="Render queue is full, try again later")
+        try:
+            pool = self._get_pool()
+            future = pool.submit(
+                _render_in_worker, markdown, dark, base_path,
+                self.renderer.backend.name, self.renderer.profile,
+            )
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the worker is done, even if we stop waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            html, stats = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Already running: stop the worker instead of letting it hold the slot
+                self._reset_pool(pool, terminate=True)
+            raise HTTPException(status_code=504, detail="Render timed out")
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise HTTPException(status_code=503, detail="Render worker crashed")
+        cache.put(key, html)
+        return html, stats
+
+    def shutdown(self) -> None:
+        self._reset_pool()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a threaded server process is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor | None = None, terminate: bool = False) -> None:
+        """Drop the current pool, or *pool* if it has not been replaced yet."""
+        with self._lock:
+            if pool is not None and pool is not self._pool:
+                return
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        # shutdown() forgets the worker processes, so collect them first
+        processes = list((pool._processes or {}).values()) if terminate else []
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+
+# PYMD_RENDER_WORKERS=0 renders everything in-process
+_render_service = RenderService(
+    _renderer,
+    workers=int(os.getenv("PYMD_RENDER_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    inline_chars=int(os.getenv("PYMD_RENDER_INLINE_CHARS", "200000")),
+    max_pending=int(os.getenv("PYMD_RENDER_MAX_PENDING", "16")),
+    timeout=float(os.getenv("PYMD_RENDER_TIMEOUT", "30")),
+)
+
+
+def _server_timing(stats: dict) -> str:
+    parts = [
+        f"{stage};dur={stats[stage]:.2f}"
+        for stage in ("images", "markdown", "template", "total")
+    ]
+    parts.append(f'cache;desc="{"hit" if stats["cached"] else "miss"}"')
+    parts.append(
+        f'doc;desc="{stats["chars"]} chars, {stats["lines"]} lines, '
+        f'{stats["rendered"]}/{stats["blocks"]} blocks"'
+    )
+    return ", ".join(parts)
+
+
 @app.post("/api/render")
-def render(req: RenderRequest):
+def render(req: RenderRequest, response: Response):
     """Convert markdown text to full HTML (with CSS + MathJax)."""
     base_path: Optional[str] = None
     if req.base_path:
@@ -381,10 +531,63 @@ def render(req: RenderRequest):
         except HTTPException:
             pass
 
-    html = _renderer.to_html(req.markdown, dark=req.dark, base_path=base_path)
+    html, stats = _render_service.render(req.markdown, dark=req.dark, base_path=base_path)
+    if stats:
+        response.headers["Server-Timing"] = _server_timing(stats)
     return {"html": html}
 
 
+# Blocks are batched into chunks of about this size; the first block is
+# always sent on its own so the browser can start painting immediately.
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+@app.post("/api/render/stream")
+def render_stream(req: RenderRequest):
+    """Stream the full HTML document block by block (text/html, chunked)."""
+    base_path: Optional[str] = None
+    if req.base_path:
+        try:
+            base_path = str(_safe_path(req.base_path))
+        except HTTPException:
+            pass
+
+    def chunks():
+        yield _renderer.html_prefix(req.dark)
+        buf: list[str] = []
+        size = 0
+        first = True
+        for html in _renderer.iter_blocks(req.markdown, base_path=base_path):
+            if not first:
+                html = "\n" + html
+            buf.append(html)
+            size += len(html)
+            if first or size >= _STREAM_CHUNK_BYTES:
+                yield "".join(buf)
+                buf, size, first = [], 0, False
+        if buf:
+            yield "".join(buf)
+        yield _renderer.html_suffix()
+
+    return StreamingResponse(chunks(), media_type="text/html; charset=utf-8")
+
+
+@app.get("/api/render/cache")
+def render_cache_stats():
+    """Hit/miss counters and memory use of the shared render cache."""
+    return get_render_cache().stats()
+
+
+@app.delete("/api/render/cache")
+def render_cache_invalidate(base_path: Optional[str] = Query(default=None)):
+    """Drop cached renders, optionally only those for one base path."""
+    bp: Optional[str] = None
+    if base_path:
+        bp = str(_safe_path(base_path))
+    removed = get_render_cache().invalidate(bp)
+    return {"ok": True, "removed": removed}
+
+
 # ---------------------------------------------------------------------------
 # Routes — File operations
 # ---------------------------------------------------------------------------
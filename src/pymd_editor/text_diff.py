@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from itertools import accumulate
+
+# Slices compared per step before falling back to single characters; the
+# comparison itself runs in C, so long equal runs cost little Python time.
+_STEP = 4096
+
+
+def utf16_length(text: str) -> int:
+    """Length of *text* in UTF-16 code units, the unit of QTextDocument positions."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    i = 0
+    while i + _STEP <= limit and a[i:i + _STEP] == b[i:i + _STEP]:
+        i += _STEP
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of *a* and *b*, at most *limit*."""
+    la, lb = len(a), len(b)
+    n = 0
+    while n + _STEP <= limit and a[la - n - _STEP:la - n] == b[lb - n - _STEP:lb - n]:
+        n += _STEP
+    while n < limit and a[la - n - 1] == b[lb - n - 1]:
+        n += 1
+    return n
+
+
+def diff_range(old: str, new: str) -> tuple[int, int, int]:
+    """The single edit turning *old* into *new*: ``(start, old_end, new_end)``.
+
+    ``new == old[:start] + new[start:new_end] + old[old_end:]``.  The range is
+    found from the common prefix and suffix, so one contiguous edit (a
+    keystroke, a paste, a replaced selection) comes out minimal.
+    """
+    start = common_prefix_length(old, new)
+    suffix = common_suffix_length(old, new, min(len(old), len(new)) - start)
+    return start, len(old) - suffix, len(new) - suffix
+
+
+def changed_blocks(blocks: list[str], new: str) -> tuple[int, int, str | None] | None:
+    """The run of *blocks* that differs in *new*: ``(first, end, replacement)``.
+
+    The old text is *blocks* joined by blank lines, the way the WYSIWYG page
+    joins its blocks.  ``blocks[:first]`` and ``blocks[end:]`` open and close
+    *new* unchanged; ``blocks[first:end]`` became *replacement*, or were
+    deleted if it is None.  ``first == end`` is an insertion.  None if *new*
+    is the old text.
+    """
+    old = "\n\n".join(blocks)
+    if old == new:
+        return None
+    starts = list(accumulate((len(block) + 2 for block in blocks[:-1]), initial=0))
+    prefix = common_prefix_length(old, new)
+    suffix = common_suffix_length(old, new, min(len(old), len(new)))
+    first = head = 0  # head: end of the unchanged blocks that open new
+    while first < len(blocks):
+        end = starts[first] + len(blocks[first])
+        if end > prefix or not (end == len(new) or new.startswith("\n\n", end)):
+            break
+        first += 1
+        head = end
+    last, tail = len(blocks), len(new)  # tail: start of the unchanged blocks that close new
+    while last > first:
+        kept = len(old) - starts[last - 1]
+        start = len(new) - kept
+        if kept > suffix or start < head or not (
+                start == 0 or (start >= 2 and new.startswith("\n\n", start - 2))):
+            break
+        last -= 1
+        tail = start
+    # Between the kept blocks: the blank lines around them and the new blocks
+    middle = new[head:tail]
+    lead = 2 if first else 0
+    trail = 2 if last < len(blocks) else 0
+    if len(middle) <= lead + trail:
+        return first, last, None
+    return first, last, middle[lead:len(middle) - trail]
+
+
+def block_edit(text: str, blocks: list[tuple[int, int, str]], new: str) -> tuple[int, int, str] | None:
+    """The edit to *text* after which its blocks read *new*: ``(start, end, replacement)``.
+
+    *blocks* are ``(first_line, end_line, form)`` for the blocks of *text* in
+    order (*end_line* exclusive), *new* an edited version of their forms
+    joined by blank lines.  Only the source lines of blocks whose form
+    changed are rewritten, and of those only the span that differs, so
+    blocks spelled differently from their form survive edits elsewhere.
+    None if nothing changed.
+    """
+    changed = changed_blocks([form for _, _, form in blocks], new)
+    if changed is None:
+        return None
+    first, last, replacement = changed
+    if replacement is None and first == last:
+        return None
+    line_starts = [0, *accumulate(len(line) + 1 for line in text.split("\n"))]
+    if replacement is None:
+        # Deleted blocks go with the blank lines after them, or before the last ones
+        if last < len(blocks):
+            start, end = line_starts[blocks[first][0]], line_starts[blocks[last][0]]
+        else:
+            start = line_starts[blocks[first - 1][1]] - 1 if first else line_starts[blocks[0][0]]
+            end = line_starts[blocks[-1][1]] - 1
+        replacement = ""
+    elif first < last:
+        start, end = line_starts[blocks[first][0]], line_starts[blocks[last - 1][1]] - 1
+    elif first < len(blocks):
+        start = end = line_starts[blocks[first][0]]
+        replacement += "\n\n"
+    elif text.strip():
+        start = end = line_starts[blocks[-1][1]] - 1 if blocks else len(text)
+        replacement = "\n\n" + replacement
+    else:
+        start, end = 0, len(text)
+    offset, old_end, new_end = diff_range(text[start:end], replacement)
+    if offset == old_end == new_end:
+        return None
+    return start + offset, start + old_end, replacement[offset:new_end]
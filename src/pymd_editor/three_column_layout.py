@@ -3,6 +3,8 @@
 支持左栏编辑器、中栏预览、右栏AI助手的响应式布局
 """
 
+from dataclasses import asdict
+
 from PyQt6.QtCore import Qt, pyqtSignal, QSettings, QDateTime
 from PyQt6.QtWidgets import (
     QWidget, QSplitter, QVBoxLayout, QHBoxLayout,
@@ -351,6 +353,7 @@ class AIAssistantPanel(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.current_response = ""
+        self._document_stats = None
         self.ai_manager = get_ai_manager()
         self.ai_manager.current_provider_changed.connect(self._on_provider_changed)
         self._setup_ui()
@@ -483,6 +486,10 @@ class AIAssistantPanel(QWidget):
     def set_status(self, status: str):
         """设置状态文本"""
         self.status_personality_label.setText(status or "Ready")
+
+    def set_document_stats(self, stats):
+        """记录主编辑器的文档统计（TextStats），随 AI 请求一并发送"""
+        self._document_stats = stats
         
     def get_improve_button(self) -> QPushButton:
         return None
@@ -515,6 +522,8 @@ class AIAssistantPanel(QWidget):
             "timestamp": QDateTime.currentDateTime().toString(),
             "content_length": len(content)
         }
+        if self._document_stats is not None:
+            context["document_stats"] = asdict(self._document_stats)
         
         # 保存上下文用于响应处理
         self._last_context = context
@@ -579,6 +588,8 @@ class AIAssistantPanel(QWidget):
             "content_length": len(message),
             "is_chat": True
         }
+        if self._document_stats is not None:
+            context["document_stats"] = asdict(self._document_stats)
         
         # 保存上下文用于响应处理
         self._last_context = context
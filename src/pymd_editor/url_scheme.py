@@ -0,0 +1,170 @@
+"""
+pymd:// URL scheme for the embedded QWebEngine views.
+
+Serves the preview stylesheets, a vendored MathJax copy and workspace
+images from memory so page loads are small, cacheable and work offline:
+
+    pymd://assets/light.css      LIGHT_CSS / DARK_CSS from the renderer
+    pymd://mathjax/<path>        files under assets/mathjax (CDN fallback)
+    pymd://file/<abs path>       local images, cached by mtime and size
+
+The scheme must be registered before the QApplication is created, see
+:func:`register_pymd_scheme`.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice, QUrl
+from PyQt6.QtWebEngineCore import (
+    QWebEngineProfile,
+    QWebEngineUrlRequestJob,
+    QWebEngineUrlScheme,
+    QWebEngineUrlSchemeHandler,
+)
+
+from .renderer import DARK_CSS, LIGHT_CSS
+
+SCHEME = b"pymd"
+MATHJAX_DIR = Path(__file__).parent / "assets" / "mathjax"
+MATHJAX_CDN = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/"
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".svg", ".webp"}
+
+_IMMUTABLE = b"public, max-age=31536000, immutable"
+_REVALIDATE = b"no-cache"
+
+_handler: "PyMDSchemeHandler | None" = None
+
+
+def register_pymd_scheme() -> None:
+    """Register the pymd:// scheme; call once before QApplication()."""
+    if is_pymd_scheme_registered():
+        return
+    scheme = QWebEngineUrlScheme(SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    scheme.setFlags(
+        QWebEngineUrlScheme.Flag.SecureScheme
+        | QWebEngineUrlScheme.Flag.LocalScheme
+        | QWebEngineUrlScheme.Flag.LocalAccessAllowed
+        | QWebEngineUrlScheme.Flag.CorsEnabled
+    )
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def is_pymd_scheme_registered() -> bool:
+    return bool(QWebEngineUrlScheme.schemeByName(QByteArray(SCHEME)).name())
+
+
+def pymd_asset_base() -> str | None:
+    """Asset base for MarkdownRenderer, or None if the scheme is unavailable."""
+    return "pymd://" if install_pymd_scheme_handler() else None
+
+
+def install_pymd_scheme_handler(profile: QWebEngineProfile | None = None) -> bool:
+    """Install the handler on *profile* (default profile if omitted).
+
+    Returns False when the scheme was not registered at startup, in which
+    case callers should keep using inline CSS and file:// URLs.
+    """
+    global _handler
+    if not is_pymd_scheme_registered():
+        return False
+    profile = profile or QWebEngineProfile.defaultProfile()
+    if profile.urlSchemeHandler(QByteArray(SCHEME)) is None:
+        if _handler is None:
+            _handler = PyMDSchemeHandler()
+        profile.installUrlSchemeHandler(QByteArray(SCHEME), _handler)
+    return True
+
+
+class _FileCache:
+    """Byte-bounded LRU of file contents, validated by mtime and size."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._entries: OrderedDict[str, tuple[int, int, bytes]] = OrderedDict()
+
+    def read(self, path: str) -> bytes:
+        st = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            self._entries.move_to_end(path)
+            return entry[2]
+        with open(path, "rb") as f:
+            data = f.read()
+        if entry is not None:
+            self._bytes -= len(entry[2])
+            del self._entries[path]
+        if len(data) <= self.max_bytes:
+            self._entries[path] = (st.st_mtime_ns, st.st_size, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (_, _, old) = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+        return data
+
+
+class PyMDSchemeHandler(QWebEngineUrlSchemeHandler):
+    """Answer pymd:// requests from memory."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._assets = {
+            "/light.css": LIGHT_CSS.encode("utf-8"),
+            "/dark.css": DARK_CSS.encode("utf-8"),
+        }
+        self._files = _FileCache()
+
+    def requestStarted(self, job: QWebEngineUrlRequestJob):  # noqa: N802
+        url = job.requestUrl()
+        host = url.host()
+        path = url.path(QUrl.ComponentFormattingOption.FullyDecoded)
+        try:
+            if host == "assets":
+                data = self._assets.get(path)
+                if data is None:
+                    return job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+                return self._reply(job, b"text/css", data, _IMMUTABLE)
+            if host == "mathjax":
+                return self._serve_mathjax(job, path)
+            if host == "file":
+                return self._serve_file(job, path)
+        except OSError:
+            return job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+        job.fail(QWebEngineUrlRequestJob.Error.UrlInvalid)
+
+    def _serve_mathjax(self, job: QWebEngineUrlRequestJob, path: str):
+        rel = path.lstrip("/")
+        target = (MATHJAX_DIR / rel).resolve()
+        if MATHJAX_DIR.resolve() not in target.parents:
+            return job.fail(QWebEngineUrlRequestJob.Error.RequestDenied)
+        if not target.is_file():
+            # No vendored copy shipped: fall back to the CDN
+            return job.redirect(QUrl(MATHJAX_CDN + rel))
+        self._reply(job, _mime_type(target), self._files.read(str(target)), _IMMUTABLE)
+
+    def _serve_file(self, job: QWebEngineUrlRequestJob, path: str):
+        if len(path) > 2 and path[2] == ":":
+            path = path[1:]  # /C:/... -> C:/...
+        if Path(path).suffix.lower() not in IMAGE_EXTS:
+            return job.fail(QWebEngineUrlRequestJob.Error.RequestDenied)
+        self._reply(job, _mime_type(Path(path)), self._files.read(path), _REVALIDATE)
+
+    def _reply(self, job: QWebEngineUrlRequestJob, mime: bytes, data: bytes, cache_control: bytes):
+        if hasattr(job, "setAdditionalResponseHeaders"):  # Qt >= 6.6
+            job.setAdditionalResponseHeaders({
+                QByteArray(b"Cache-Control"): QByteArray(cache_control),
+            })
+        buf = QBuffer(job)
+        buf.setData(data)
+        buf.open(QIODevice.OpenModeFlag.ReadOnly)
+        job.reply(mime, buf)
+
+
+def _mime_type(path: Path) -> bytes:
+    mime, _ = mimetypes.guess_type(path.name)
+    return (mime or "application/octet-stream").encode("ascii")
@@ -1,15 +1,248 @@
 ﻿from __future__ import annotations
 
+import json
 from pathlib import Path
 
-from PyQt6.QtCore import QUrl, pyqtSignal, QTimer
+from PyQt6.QtCore import QFile, QIODevice, QObject, QUrl, pyqtSignal, pyqtSlot
+from PyQt6.QtWebChannel import QWebChannel
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtWebEngineCore import QWebEngineProfile, QWebEnginePage
+from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineScript
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton
-from PyQt6.QtCore import Qt
 
-from .renderer import MarkdownRenderer
+from .renderer import MarkdownRenderer, split_blocks_with_lines
+from .render_scheduler import DebouncePolicy, RenderScheduler
 from .html_to_markdown import html_to_markdown
+from .url_scheme import pymd_asset_base
+
+
+# 页面加载完成（DocumentReady）时自动注入：开启编辑，并通过 QWebChannel
+# 把编辑事件推给 Python。MutationObserver 记录哪些顶层块被修改，事件里
+# 只带这些块的 HTML；块编号保存在 WeakMap 中，不改动 DOM。
+EDITOR_SCRIPT = """
+(function () {
+  var content = document.querySelector('.content');
+  if (!content || window.pymdEditor) { return; }
+  var BLOCK_TAGS = %(block_tags)s;
+  var ids = new WeakMap();
+  var nextId = 1;
+  var dirty = new Set();
+  var structure = true;
+  var bridge = null;
+  var pushQueued = false;
+
+  function idOf(node) {
+    var id = ids.get(node);
+    if (!id) { id = nextId++; ids.set(node, id); }
+    return id;
+  }
+  function relevant(node) {
+    return node.nodeType === 1 || (node.nodeType === 3 && node.textContent.trim() !== '');
+  }
+  function topLevel(node) {
+    while (node && node.parentNode !== content) { node = node.parentNode; }
+    return node;
+  }
+  function inMath(node) {
+    var el = node.nodeType === 1 ? node : node.parentElement;
+    return !!(el && el.closest && el.closest('.pymd-math'));
+  }
+  function serialize(node) {
+    if (node.nodeType === 1) {
+      return {tag: node.tagName.toLowerCase(), html: node.outerHTML};
+    }
+    var box = document.createElement('div');
+    box.textContent = node.textContent;
+    return {tag: '#text', html: box.innerHTML};
+  }
+  function markAll() {
+    structure = true;
+    content.childNodes.forEach(function (node) { dirty.add(node); });
+  }
+  function selection() {
+    var sel = window.getSelection();
+    if (!sel || !sel.rangeCount || !content.contains(sel.anchorNode)) { return null; }
+    var top = topLevel(sel.anchorNode);
+    return top ? {block: idOf(top), offset: sel.anchorOffset} : null;
+  }
+
+  // {order: [id...] (only if blocks were added/removed/moved),
+  //  changed: {id: {tag, html}}, selection} or {full: html, selection}
+  function take() {
+    var out = {changed: {}};
+    if (structure) {
+      out.order = Array.prototype.filter.call(content.childNodes, relevant).map(idOf);
+    }
+    var inline = false;
+    dirty.forEach(function (node) {
+      if (node.parentNode === content && relevant(node)) {
+        var block = serialize(node);
+        inline = inline || BLOCK_TAGS.indexOf(block.tag) < 0;
+        out.changed[idOf(node)] = block;
+      }
+    });
+    dirty.clear();
+    structure = false;
+    if (inline) {
+      // Text or inline elements directly under .content: convert the whole document
+      out = {full: content.innerHTML};
+      markAll();
+    }
+    out.selection = selection();
+    return out;
+  }
+  function push() {
+    pushQueued = false;
+    if (bridge && (structure || dirty.size)) {
+      bridge.push(JSON.stringify(take()));
+    }
+  }
+  function queuePush() {
+    if (!pushQueued) {
+      pushQueued = true;
+      requestAnimationFrame(push);
+    }
+  }
+
+  new MutationObserver(function (records) {
+    records.forEach(function (r) {
+      if (inMath(r.target)) { return; }  // MathJax typesetting, not an edit
+      if (r.target === content) {
+        if (r.type !== 'childList') { return; }
+        structure = true;
+        r.addedNodes.forEach(function (node) { dirty.add(node); });
+      } else {
+        var top = topLevel(r.target);
+        if (top) { dirty.add(top); }
+      }
+    });
+    queuePush();
+  }).observe(content, {childList: true, subtree: true, characterData: true, attributes: true});
+
+  var style = document.createElement('style');
+  style.textContent = `
+    .content[contenteditable="true"] {
+      outline: none;
+      border: 2px dashed #ccc;
+      min-height: 400px;
+      padding: 16px 24px;
+      cursor: text;
+    }
+    .content[contenteditable="true"]:focus {
+      border-color: #007acc !important;
+    }
+    .content[contenteditable="true"] *:hover {
+      background-color: rgba(0, 122, 204, 0.1);
+    }
+  `;
+  document.head.appendChild(style);
+
+  window.pymdEditor = {
+    enable: function () { content.contentEditable = true; },
+    disable: function () { content.contentEditable = false; },
+    // Hand over the edits not pushed yet (null if none), bypassing the frame wait
+    take: function () {
+      pushQueued = false;
+      return (structure || dirty.size) ? JSON.stringify(take()) : null;
+    }
+  };
+  window.pymdEditor.enable();
+  markAll();
+
+  new QWebChannel(qt.webChannelTransport, function (channel) {
+    bridge = channel.objects.pymdBridge;
+    // Python lost track of the blocks: send all of them again
+    bridge.resync.connect(function () { markAll(); queuePush(); });
+  });
+})();
+"""
+
+# 可以单独转换的顶层块；顶层出现文本或行内元素时退回整篇转换
+_BLOCK_TAGS = frozenset({
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'pre', 'blockquote',
+    'table', 'div', 'hr', 'dl', 'figure', 'details', 'section',
+})
+
+
+class MarkdownBlockCache:
+    """按顶层块缓存的 Markdown，只重新转换变化的块"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._order: list[int] | None = None  # None：还没收到页面的块列表
+        self._blocks: dict[int, str] = {}
+        self._full: str | None = None
+
+    def update(self, changes: dict) -> bool:
+        """合并一次编辑事件；缓存与页面对不上时返回 False（需要重新同步）"""
+        if 'full' in changes:
+            self.clear()
+            self._full = html_to_markdown(changes['full'])
+            return True
+        if 'order' in changes:
+            self._order = changes['order']
+            keep = set(self._order)
+            self._blocks = {k: v for k, v in self._blocks.items() if k in keep}
+            self._full = None
+        for key, block in changes['changed'].items():
+            self._blocks[int(key)] = html_to_markdown(block['html'])
+        if self._full is None and (
+                self._order is None or any(i not in self._blocks for i in self._order)):
+            self.clear()
+            return False
+        return True
+
+    def markdown(self) -> str | None:
+        if self._full is not None:
+            return self._full
+        if self._order is None:
+            return None
+        return "\n\n".join(part for part in (self._blocks[i] for i in self._order) if part)
+
+    def line_of(self, block_id: int) -> int | None:
+        """块在拼接后的 Markdown 中的起始行号"""
+        if self._order is None or block_id not in self._blocks:
+            return None
+        line = 0
+        for i in self._order:
+            if i == block_id:
+                return line
+            if self._blocks[i]:
+                line += self._blocks[i].count("\n") + 2
+        return None
+
+
+class WYSIWYGBridge(QObject):
+    """通过 QWebChannel 暴露给页面的对象（pymdBridge）"""
+
+    changed = pyqtSignal(dict)  # 页面推送的编辑事件
+    resync = pyqtSignal()       # 请页面重新发送全部块
+
+    @pyqtSlot(str)
+    def push(self, payload: str):
+        self.changed.emit(json.loads(payload))
+
+
+def _qwebchannel_script() -> QWebEngineScript:
+    """Qt 自带的 qwebchannel.js，在页面脚本之前注入"""
+    source = QFile(":/qtwebchannel/qwebchannel.js")
+    source.open(QIODevice.OpenModeFlag.ReadOnly)
+    script = QWebEngineScript()
+    script.setName("qwebchannel")
+    script.setSourceCode(bytes(source.readAll()).decode("utf-8"))
+    script.setInjectionPoint(QWebEngineScript.InjectionPoint.DocumentCreation)
+    script.setWorldId(QWebEngineScript.ScriptWorldId.MainWorld)
+    return script
+
+
+def _editor_script() -> QWebEngineScript:
+    script = QWebEngineScript()
+    script.setName("pymd-editor")
+    script.setSourceCode(EDITOR_SCRIPT % {"block_tags": json.dumps(sorted(_BLOCK_TAGS))})
+    script.setInjectionPoint(QWebEngineScript.InjectionPoint.DocumentReady)
+    script.setWorldId(QWebEngineScript.ScriptWorldId.MainWorld)
+    return script
 
 
 class WYSIWYGEditor(QWidget):
@@ -19,8 +252,14 @@ class WYSIWYGEditor(QWidget):
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.renderer = MarkdownRenderer()
+        self.renderer = MarkdownRenderer(asset_base=pymd_asset_base(), lazy_math=True)
         self._markdown_content = ""
+        # 加载时渲染的正文及其转换结果（规范形式，首次需要时才转换）
+        self._loaded_body: str | None = None
+        self._loaded_markdown: str | None = None
+        self._block_cache = MarkdownBlockCache()
+        self._canonical_cache: dict[str, str] = {}  # 源码块 -> 规范写法，保留到下一次调用
+        self._selection: dict | None = None  # {block, offset}，来自最近一次编辑事件
         self._dark_mode = False
         self._edit_mode = True  # 始终处于编辑模式
         self._base_path: Path | None = None
@@ -28,11 +267,10 @@ class WYSIWYGEditor(QWidget):
         self._setup_ui()
         self._setup_web_view()
         
-        # 防抖定时器
-        self._update_timer = QTimer()
-        self._update_timer.setSingleShot(True)
-        self._update_timer.setInterval(300)
-        self._update_timer.timeout.connect(self._extract_content)
+        # 合并连续的编辑事件，间隔随最近几次通知的耗时自适应
+        self._update_scheduler = RenderScheduler(
+            self._extract_content, self, DebouncePolicy(initial_ms=300)
+        )
         
     def _setup_ui(self):
         """设置UI布局"""
@@ -69,12 +307,12 @@ class WYSIWYGEditor(QWidget):
         
     def _setup_web_view(self):
         """设置Web视图"""
-        # 创建自定义页面以处理内容编辑
+        # 自定义页面：每次加载都会注入编辑脚本，并通过 QWebChannel 推送编辑事件
         self.web_page = WYSIWYGWebPage(self.web_view)
         self.web_view.setPage(self.web_page)
         
         # 连接信号
-        self.web_page.contentChanged.connect(self._on_content_changed)
+        self.web_page.bridge.changed.connect(self._on_edit_event)
         
     def _ensure_edit_mode(self):
         """确保处于编辑模式"""
@@ -84,115 +322,91 @@ class WYSIWYGEditor(QWidget):
             
     def _enable_editing(self):
         """启用编辑功能"""
-        # 注入JavaScript使内容可编辑
-        js_code = """
-        // 使内容可编辑
-        var contentDiv = document.querySelector('.content');
-        if (contentDiv) {
-            contentDiv.contentEditable = true;
-            contentDiv.style.outline = 'none';
-            contentDiv.style.border = '2px dashed #ccc';
-            contentDiv.style.minHeight = '400px';
-            contentDiv.style.padding = '16px 24px';
-        }
-        
-        // 添加编辑样式
-        var style = document.createElement('style');
-        style.setAttribute('data-wysiwyg', 'true');
-        style.textContent = `
-            .content[contenteditable="true"]:focus {
-                border-color: #007acc !important;
-            }
-            .content[contenteditable="true"] {
-                cursor: text;
-            }
-            .content *:hover {
-                background-color: rgba(0, 122, 204, 0.1);
-            }
-        `;
-        document.head.appendChild(style);
-        
-        // 监听内容变化
-        if (typeof window.changeTimer === 'undefined') {
-            window.changeTimer = null;
-        }
-        function notifyChange() {
-            clearTimeout(window.changeTimer);
-            window.changeTimer = setTimeout(() => {
-                console.log('content_changed');
-            }, 300);
-        }
-        
-        if (contentDiv) {
-            contentDiv.addEventListener('input', notifyChange);
-            contentDiv.addEventListener('paste', notifyChange);
-            contentDiv.addEventListener('keyup', notifyChange);
-            contentDiv.addEventListener('focus', function() {
-                console.log('editor_focused');
-            });
-        }
-        """
-        
-        self.web_view.page().runJavaScript(js_code)
+        # 页面加载时编辑脚本已自动开启编辑，这里只用于重新开启
+        self.web_view.page().runJavaScript("window.pymdEditor && pymdEditor.enable();")
         
     def _disable_editing(self):
         """禁用编辑功能"""
-        js_code = """
-        var contentDiv = document.querySelector('.content');
-        if (contentDiv) {
-            contentDiv.contentEditable = false;
-            contentDiv.style.border = 'none';
-            contentDiv.style.boxShadow = 'none';
-            contentDiv.style.cursor = 'default';
-        }
-        
-        // 移除编辑样式
-        var styles = document.querySelectorAll('style[data-wysiwyg]');
-        styles.forEach(style => style.remove());
-        """
-        self.web_view.page().runJavaScript(js_code)
+        self.web_view.page().runJavaScript("window.pymdEditor && pymdEditor.disable();")
         
-    def _on_content_changed(self):
-        """内容改变时的处理"""
-        if self._edit_mode:
-            self._update_timer.start()
-            
-    def _extract_content(self):
-        """从HTML中提取Markdown内容"""
+    def _on_edit_event(self, changes: dict):
+        """页面推送的编辑事件：转换变化的块，稍后再通知外部"""
         if not self._edit_mode:
             return
+        self._selection = changes.get('selection')
+        if not self._block_cache.update(changes):
+            # 缓存与页面对不上（例如刚加载），请页面重新发送全部块
+            self.web_page.bridge.resync.emit()
+            return
+        self._update_scheduler.schedule(len(self._markdown_content))
             
-        js_code = """
-        var content = document.querySelector('.content');
-        if (content) {
-            content.innerHTML;
-        } else {
-            '';
-        }
+    def _extract_content(self):
+        """把缓存的块拼成 Markdown 并发出 textChanged"""
+        try:
+            markdown_content = self._block_cache.markdown()
+            if self._edit_mode and markdown_content is not None:
+                self._set_extracted(markdown_content)
+        finally:
+            self._update_scheduler.render_finished()
+
+    def _set_extracted(self, markdown_content: str):
+        if markdown_content == self._markdown_content:
+            return
+        if self._loaded_body is not None:
+            # 与刚加载的页面转换结果相同：页面没有实质改动，不算编辑
+            if self._loaded_markdown is None:
+                self._loaded_markdown = html_to_markdown(self._loaded_body)
+            if markdown_content == self._loaded_markdown:
+                return
+            self._loaded_body = self._loaded_markdown = None
+        self._markdown_content = markdown_content
+        self.textChanged.emit(markdown_content)
+        
+    def flush(self, callback):
+        """立即取回页面上尚未推送的编辑并发出 textChanged，完成后调用 callback"""
+        def on_taken(payload):
+            if payload:
+                self._on_edit_event(json.loads(payload))
+            self._update_scheduler.flush()
+            callback()
+
+        self.web_page.runJavaScript("window.pymdEditor ? pymdEditor.take() : null", on_taken)
+
+    def set_markdown(self, text: str, html_body: str | None = None):
+        """设置Markdown内容
+
+        html_body 为调用方已渲染好的正文时直接复用，避免重复渲染。
         """
-        
-        def handle_result(html_content):
-            """处理JavaScript执行结果"""
-            if html_content:
-                # 使用Python的HTML到Markdown转换器
-                markdown_content = html_to_markdown(html_content)
-                if markdown_content != self._markdown_content:
-                    self._markdown_content = markdown_content
-                    self.textChanged.emit(markdown_content)
-                
-        self.web_view.page().runJavaScript(js_code, handle_result)
-        
-    def set_markdown(self, text: str):
-        """设置Markdown内容"""
         self._markdown_content = text
-        self._render_content()
+        self._render_content(html_body)
         
     def get_markdown(self) -> str:
         """获取当前Markdown内容"""
         return self._markdown_content
         
+    def canonical_blocks(self, text: str) -> list[tuple[int, int, str]]:
+        """源码的顶层块：(首行, 末行之后一行, 规范写法)
+
+        规范写法即页面上这一块转换回来的 Markdown；为空的块（如 HTML 注释）不列出。
+        """
+        base_dir = str(self._base_path or Path.cwd())
+        previous, cache = self._canonical_cache, {}
+        blocks = []
+        for start, block in split_blocks_with_lines(text):
+            canonical = cache.get(block)
+            if canonical is None:
+                canonical = previous.get(block)
+            if canonical is None:
+                canonical = html_to_markdown(self.renderer.render_body(block, base_path=base_dir))
+            cache[block] = canonical
+            if canonical:
+                blocks.append((start, start + block.count("\n") + 1, canonical))
+        self._canonical_cache = cache
+        return blocks
+
     def set_base_path(self, base_path: str | Path | None, *, re_render: bool = True):
         """设置渲染时使用的基础路径，确保图片和资源可以正确解析"""
+        self._canonical_cache = {}  # 图片路径按基础路径解析
         if base_path is None:
             self._base_path = Path.cwd()
             if re_render:
@@ -211,51 +425,53 @@ class WYSIWYGEditor(QWidget):
         if re_render:
             self._render_content()
 
-    def _render_content(self):
+    def _render_content(self, html_body: str | None = None):
         """渲染Markdown内容为HTML"""
         base_dir = self._base_path or Path.cwd()
-        html = self.renderer.to_html(
-            self._markdown_content,
-            dark=self._dark_mode,
-            base_path=str(base_dir)
-        )
+        if html_body is None:
+            html_body = self.renderer.render_body(self._markdown_content, base_path=str(base_dir))
+        html = self.renderer.wrap_html(html_body, dark=self._dark_mode)
 
         resolved_dir = base_dir.resolve(strict=False)
         base_url = QUrl.fromLocalFile(str(resolved_dir))
         if not base_url.path().endswith('/'):
             base_url.setPath(base_url.path() + '/')
 
+        self._block_cache.clear()
+        self._selection = None
+        self._loaded_body = html_body
+        self._loaded_markdown = None
         self.web_view.setHtml(html, base_url)
-        
-        # 总是启用编辑模式
-        def enable_edit():
-            self._enable_editing()
-        QTimer.singleShot(100, enable_edit)
             
-    def set_dark_mode(self, dark: bool):
+    def set_dark_mode(self, dark: bool, *, re_render: bool = True):
         """设置暗色模式"""
         self._dark_mode = dark
-        self._render_content()
+        if re_render:
+            self._render_content()
         
     def is_edit_mode(self) -> bool:
         """返回是否处于编辑模式"""
         return self._edit_mode
 
+    def selection_line(self) -> int | None:
+        """光标所在块在 Markdown 中的起始行号（未知时为 None）"""
+        if not self._selection:
+            return None
+        return self._block_cache.line_of(self._selection['block'])
+
 
 class WYSIWYGWebPage(QWebEnginePage):
-    """自定义Web页面类，用于处理编辑事件"""
-    
-    contentChanged = pyqtSignal()
+    """自定义Web页面类：注入编辑脚本，并通过 QWebChannel 暴露 pymdBridge"""
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        
-    def javaScriptConsoleMessage(self, level, message, lineNumber, sourceId):
-        """处理JavaScript控制台消息"""
-        if message == "content_changed":
-            self.contentChanged.emit()
-        # 调用父类方法以保持默认行为
-        super().javaScriptConsoleMessage(level, message, lineNumber, sourceId)
+        self.bridge = WYSIWYGBridge(self)
+        self._channel = QWebChannel(self)
+        self._channel.registerObject("pymdBridge", self.bridge)
+        self.setWebChannel(self._channel)
+        # 注入脚本对之后的每次 setHtml 都有效
+        self.scripts().insert(_qwebchannel_script())
+        self.scripts().insert(_editor_script())
 
 
 class EnhancedWYSIWYGEditor(WYSIWYGEditor):
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Check that the source editor highlighter does bounded work per keystroke.
+
+Usage:
+  QT_QPA_PLATFORM=offscreen python tools/bench_highlighter.py [--lines 50000] [--keystrokes 2000]
+
+A document of --lines lines is built from tools/corpus/markdown (headings,
+lists, tables, fenced code, math) and highlighted once. Then single
+characters are typed and deleted at random positions, and the blocks
+re-highlighted and the time per keystroke are recorded. Typing ordinary
+text must only re-highlight the edited block; the exit status is 1 if
+any keystroke highlights more than --max-blocks blocks or the 99th
+percentile exceeds --budget-ms.
+
+For comparison, the cost of opening and closing a code fence at the top
+of the document (which legitimately re-highlights everything after it)
+is reported as well.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from PyQt6.QtGui import QTextCursor, QTextDocument  # noqa: E402
+from PyQt6.QtWidgets import QApplication, QPlainTextDocumentLayout  # noqa: E402
+
+from pymd_editor.markdown_highlighter import MarkdownHighlighter  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+
+
+class CountingHighlighter(MarkdownHighlighter):
+    blocks = 0
+
+    def highlightBlock(self, text: str):  # noqa: N802
+        self.blocks += 1
+        super().highlightBlock(text)
+
+
+def build_document(corpus: Path, lines: int) -> str:
+    source = []
+    for path in sorted(corpus.glob("*.md")):
+        source.extend(path.read_text(encoding="utf-8").splitlines())
+        source.append("")
+    out = []
+    while len(out) < lines:
+        out.extend(source)
+    return "\n".join(out[:lines])
+
+
+def ordinary_position(doc: QTextDocument, rng: random.Random) -> int:
+    """A position where typing or deleting a letter keeps the block structure.
+
+    Skips the markers at the start of a line and the lines that open or
+    close fences, math or front matter, where a keystroke legitimately
+    changes the state of every following block.
+    """
+    while True:
+        block = doc.findBlockByNumber(rng.randrange(doc.blockCount()))
+        text = block.text()
+        stripped = text.strip()
+        if len(text) < 6 or stripped.startswith(("```", "~~~", "$$", "---")) or stripped.endswith("$$"):
+            continue
+        offset = rng.randrange(4, len(text) - 1)
+        if text[offset].isalnum():
+            return block.position() + offset
+
+
+def type_at(doc: QTextDocument, position: int, text: str) -> None:
+    cursor = QTextCursor(doc)
+    cursor.setPosition(position)
+    cursor.insertText(text)
+
+
+def delete_at(doc: QTextDocument, position: int, count: int = 1) -> None:
+    cursor = QTextCursor(doc)
+    cursor.setPosition(position)
+    cursor.setPosition(position + count, QTextCursor.MoveMode.KeepAnchor)
+    cursor.removeSelectedText()
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Per-keystroke cost of the Markdown highlighter")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--lines", type=int, default=50_000, help="document size in lines")
+    p.add_argument("--keystrokes", type=int, default=2000, help="random edits to time")
+    p.add_argument("--max-blocks", type=int, default=1, help="blocks a keystroke may re-highlight")
+    p.add_argument("--budget-ms", type=float, default=2.0, help="p99 time budget per keystroke")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    # Same document layout as the source editor (QPlainTextEdit)
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    doc.setPlainText(build_document(args.corpus, args.lines))
+
+    # The first pass is queued; edits are ignored until it has run
+    t0 = time.perf_counter()
+    highlighter = CountingHighlighter(doc)
+    app.processEvents()
+    initial = time.perf_counter() - t0
+    print(f"Document: {doc.blockCount()} lines, {doc.characterCount() - 1} chars")
+    print(f"Initial highlight: {initial * 1000:.0f} ms ({highlighter.blocks} blocks)")
+
+    rng = random.Random(args.seed)
+    timings, worst_blocks = [], 0
+    for i in range(args.keystrokes):
+        position = ordinary_position(doc, rng)
+        highlighter.blocks = 0
+        t0 = time.perf_counter()
+        if i % 2:
+            type_at(doc, position, rng.choice("abcxyz"))
+        else:
+            delete_at(doc, position)
+        timings.append(time.perf_counter() - t0)
+        worst_blocks = max(worst_blocks, highlighter.blocks)
+
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    print(f"Keystrokes: {len(timings)}  p50 {p50:.3f} ms  p99 {p99:.3f} ms  "
+          f"max {timings[-1] * 1000:.3f} ms  max blocks {worst_blocks}")
+
+    highlighter.blocks = 0
+    t0 = time.perf_counter()
+    type_at(doc, 0, "```\n")
+    opened = time.perf_counter() - t0
+    delete_at(doc, 0, 4)
+    print(f"Opening a fence at the top: {opened * 1000:.1f} ms ({highlighter.blocks} blocks incl. closing it)")
+
+    failed = worst_blocks > args.max_blocks or p99 > args.budget_ms
+    if failed:
+        print(f"FAIL: limit is {args.max_blocks} block(s) and {args.budget_ms} ms p99 per keystroke")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
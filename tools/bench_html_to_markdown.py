@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Check the HTML -> Markdown converters against golden output and time them.
+
+Usage:
+  python tools/bench_html_to_markdown.py [--corpus DIR] [--size-mb 1] [--repeat 5] [--min-mb-s 0]
+  python tools/bench_html_to_markdown.py --update   # rewrite the golden files
+
+Golden output: every *.html file in the corpus (default tools/corpus/html:
+tables, nested lists, blockquotes, code blocks including Pygments output,
+inline markup, math placeholders and the rendered tools/corpus/markdown
+files) is converted with html_to_markdown and simple_html_to_markdown and
+compared with NAME.md and NAME.simple.md next to it. The exit status is 1
+if any output differs.
+
+Throughput: the corpus is repeated to --size-mb of HTML and converted
+--repeat times; the best run is reported in MB/s. With --min-mb-s the exit
+status is also 1 if html_to_markdown is slower than that.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymd_editor.html_to_markdown import html_to_markdown, simple_html_to_markdown  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "html"
+
+CONVERTERS = {
+    "": html_to_markdown,
+    ".simple": simple_html_to_markdown,
+}
+
+
+def check_golden(corpus: Path, update: bool) -> int:
+    failures = 0
+    for path in sorted(corpus.glob("*.html")):
+        html = path.read_text(encoding="utf-8")
+        for suffix, convert in CONVERTERS.items():
+            golden = path.with_name(f"{path.stem}{suffix}.md")
+            actual = convert(html) + "\n"
+            if update:
+                golden.write_text(actual, encoding="utf-8", newline="\n")
+                continue
+            expected = golden.read_text(encoding="utf-8") if golden.exists() else ""
+            if actual != expected:
+                failures += 1
+                print(f"MISMATCH {golden.name}")
+                sys.stdout.writelines(difflib.unified_diff(
+                    expected.splitlines(keepends=True), actual.splitlines(keepends=True),
+                    fromfile=f"{golden.name} (golden)", tofile=f"{golden.name} (actual)",
+                ))
+    if update:
+        print(f"Golden files rewritten in {corpus}")
+    elif not failures:
+        print(f"Golden output: all files in {corpus} match")
+    return failures
+
+
+def build_document(corpus: Path, size_mb: float) -> str:
+    source = "\n".join(p.read_text(encoding="utf-8") for p in sorted(corpus.glob("*.html")))
+    target = int(size_mb * 1024 * 1024)
+    return source * (target // len(source.encode("utf-8")) + 1)
+
+
+def throughput(convert, html: str, repeat: int) -> tuple[float, float]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        convert(html)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(html.encode("utf-8")) / 1e6 / best
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Golden output and throughput of the HTML -> Markdown converters")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.html files")
+    p.add_argument("--update", action="store_true", help="rewrite the golden *.md files and exit")
+    p.add_argument("--size-mb", type=float, default=1.0, help="size of the throughput document")
+    p.add_argument("--repeat", type=int, default=5, help="conversions per converter; the best is reported")
+    p.add_argument("--min-mb-s", type=float, default=0.0, help="fail if html_to_markdown is slower")
+    args = p.parse_args()
+
+    failures = check_golden(args.corpus, args.update)
+    if args.update:
+        return 0
+
+    html = build_document(args.corpus, args.size_mb)
+    print(f"Throughput on {len(html.encode('utf-8')) / 1e6:.2f} MB of HTML (best of {args.repeat}):")
+    slow = False
+    for convert in CONVERTERS.values():
+        seconds, mb_s = throughput(convert, html, args.repeat)
+        print(f"  {convert.__name__:<24} {seconds * 1000:8.0f} ms  {mb_s:6.2f} MB/s")
+        if convert is html_to_markdown and mb_s < args.min_mb_s:
+            slow = True
+    if slow:
+        print(f"FAIL: html_to_markdown is below {args.min_mb_s} MB/s")
+    return 1 if failures or slow else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Compare the Markdown parser backends for output parity and speed.
+
+Usage:
+  python tools/bench_markdown_backends.py [--corpus DIR] [--repeat 3] [--large-mb 10]
+                                         [--large-repeat 1] [--markdown2-max-mb MB]
+
+Parity: every *.md file in the corpus (default tools/corpus/markdown) is
+rendered with each installed backend and compared against markdown2 after
+normalising the HTML (attributes other than href/src/alt, whitespace
+around tags, void-tag spelling, <del>/<s>, tight vs. loose list items
+and mistune keeping the backslash of \\| in code inside table cells are
+ignored). The exit status is 1 if any file differs.
+
+Speed: small (one corpus file), medium (the whole corpus repeated to
+~200 KB) and large (~10 MB) documents are rendered and throughput is
+reported in MB/s; the large document is rendered --large-repeat times.
+markdown2 slows down quadratically with document size (its raw HTML
+block pass rescans the text: about 14 s for 1 MB, some 17 minutes for
+10 MB), so the default run takes about half an hour. For a quick run, pass
+--markdown2-max-mb to skip it above that size, or a smaller --large-mb.
+The app itself renders block by block and does not hit this.
+"""
+from __future__ import annotations
+
+import argparse
+import html
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymd_editor.renderer import BACKENDS, available_backends, get_backend  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z0-9]+)([^>]*?)\s*/?>")
+_ATTR_RE = re.compile(r'\b(href|src|alt)="([^"]*)"')
+_TAG_SPACE_RE = re.compile(r"\s*(<[^>]*>)\s*")
+_LI_PARA_RE = re.compile(r"<li><p>(.*?)</p>")
+_CODE_RE = re.compile(r"<code>[^<]*</code>")
+# Spellings that mean the same thing
+_EQUIVALENT_TAGS = {"del": "s", "strike": "s", "b": "strong", "i": "em"}
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(fragment: str) -> str:
+    """Reduce an HTML fragment to a form comparable across backends."""
+    def tag(m: re.Match) -> str:
+        closing, name, attrs = m.groups()
+        name = _EQUIVALENT_TAGS.get(name.lower(), name.lower())
+        if name == "input":  # task list checkboxes differ in every parser
+            return ""
+        kept = " ".join(f'{k}="{html.unescape(v)}"' for k, v in _ATTR_RE.findall(attrs))
+        return f"<{closing}{name}{' ' + kept if kept else ''}>"
+
+    out = _TAG_RE.sub(tag, fragment)
+    out = html.unescape(out)
+    out = _TAG_SPACE_RE.sub(r"\1", out)
+    # Tight vs. loose list items are parser specific
+    out = _LI_PARA_RE.sub(r"<li>\1", out)
+    # GFM unescapes \| in table cells before parsing code spans, mistune does not
+    out = _CODE_RE.sub(lambda m: m.group().replace("\\|", "|"), out)
+    return _SPACE_RE.sub(" ", out).strip()
+
+
+def check_parity(corpus: Path, names: list[str]) -> int:
+    reference = get_backend("markdown2")
+    files = sorted(corpus.glob("*.md"))
+    mismatches = 0
+    print(f"Parity against markdown2 ({len(files)} files)")
+    for name in names:
+        if name == "markdown2":
+            continue
+        backend = get_backend(name)
+        failed = []
+        for path in files:
+            text = path.read_text(encoding="utf-8")
+            if normalize(backend.render(text)) != normalize(reference.render(text)):
+                failed.append(path.name)
+        mismatches += len(failed)
+        status = "ok" if not failed else "differs: " + ", ".join(failed)
+        print(f"  {name:<12} {len(files) - len(failed)}/{len(files)} {status}")
+    return mismatches
+
+
+def bench(text: str, names: list[str], repeat: int, markdown2_max_bytes: float) -> dict[str, float]:
+    """Best render time per backend; markdown2 is left out above *markdown2_max_bytes*."""
+    results = {}
+    for name in names:
+        if name == "markdown2" and len(text.encode("utf-8")) > markdown2_max_bytes:
+            continue
+        backend = get_backend(name)
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            backend.render(text)
+            best = min(best, time.perf_counter() - t0)
+        results[name] = best
+    return results
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Markdown backend parity and throughput")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--repeat", type=int, default=3, help="runs per size, best is reported")
+    p.add_argument("--large-mb", type=float, default=10.0, help="size of the large document")
+    p.add_argument("--large-repeat", type=int, default=1, help="runs on the large document")
+    p.add_argument("--markdown2-max-mb", type=float, default=float("inf"),
+                   help="skip markdown2 on documents larger than this (default: never)")
+    p.add_argument("--verbose", action="store_true", help="print normalised HTML for mismatches")
+    args = p.parse_args()
+
+    names = available_backends()
+    missing = [n for n in BACKENDS if n not in names]
+    print(f"Backends: {', '.join(names)}" + (f" (not installed: {', '.join(missing)})" if missing else ""))
+
+    mismatches = check_parity(args.corpus, names)
+    if args.verbose and mismatches:
+        reference = get_backend("markdown2")
+        for name in names[1:]:
+            backend = get_backend(name)
+            for path in sorted(args.corpus.glob("*.md")):
+                text = path.read_text(encoding="utf-8")
+                a, b = normalize(reference.render(text)), normalize(backend.render(text))
+                if a != b:
+                    print(f"\n[{name}] {path.name}\n  markdown2: {a}\n  {name}: {b}")
+
+    docs = [path.read_text(encoding="utf-8") for path in sorted(args.corpus.glob("*.md"))]
+    if not docs:
+        print("Corpus is empty")
+        return 1
+    joined = "\n\n".join(docs)
+    sizes = {
+        "small": docs[0],
+        "medium": joined * max(1, 200_000 // len(joined.encode("utf-8"))),
+        "large": joined * max(1, int(args.large_mb * 1024 * 1024) // len(joined.encode("utf-8"))),
+    }
+
+    print(f"\nThroughput (best of {args.repeat}, large: best of {args.large_repeat})")
+    print(f"  {'size':<8}{'bytes':>12}  " + "".join(f"{n:>16}" for n in names))
+    for label, text in sizes.items():
+        nbytes = len(text.encode("utf-8"))
+        repeat = args.large_repeat if label == "large" else args.repeat
+        timings = bench(text, names, repeat, args.markdown2_max_mb * 1024 * 1024)
+        cells = "".join(f"{nbytes / timings[n] / 1e6:>11.2f} MB/s" if n in timings
+                        else f"{'skipped':>16}" for n in names)
+        print(f"  {label:<8}{nbytes:>12}  {cells}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Check that the autosave journal replays to the editor's text.
+
+Usage:
+  QT_QPA_PLATFORM=offscreen python tools/check_autosave_journal.py [--edits 2000] [--seed 0]
+
+The Autosaver journals the document's contentsChange notifications as
+edits in UTF-16 units. This check opens a document built from
+tools/corpus/markdown in a QPlainTextEdit with the Markdown highlighter
+attached, applies --edits random edits (typed text with emoji, deleted
+ranges, pasted lines, edit blocks touching several places, undo/redo,
+select-all replacements and wholesale replacements while paused), flushes
+the journal every few edits and checks that replaying it gives the
+editor's text. A small compaction threshold makes the writer ask for
+snapshots along the way. The exit status is 1 on any difference.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from PyQt6.QtGui import QTextCursor  # noqa: E402
+from PyQt6.QtWidgets import QApplication, QPlainTextEdit  # noqa: E402
+
+from pymd_editor.autosave import Autosaver, replay_journal  # noqa: E402
+from pymd_editor.markdown_highlighter import MarkdownHighlighter  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+_SNIPPETS = ("# Heading", "```", "text 中文 😀", "- item", "$x$", "", "a b")
+
+
+def _position(doc, pos: int) -> int:
+    # Never between the halves of a surrogate pair, as a real cursor
+    return pos - 1 if 0xDC00 <= ord(doc.characterAt(pos) or " ") <= 0xDFFF else pos
+
+
+def random_edit(rng: random.Random, editor: QPlainTextEdit, autosaver: Autosaver) -> None:
+    doc = editor.document()
+    length = doc.characterCount() - 1
+    cursor = QTextCursor(doc)
+    cursor.setPosition(_position(doc, rng.randint(0, length)))
+    kind = rng.randrange(9)
+    if kind <= 2:
+        cursor.insertText(rng.choice(("a", " ", "\n", "中", "😀", "#")))
+    elif kind == 3:
+        end = _position(doc, min(length, cursor.position() + rng.randint(1, 40)))
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+    elif kind == 4:
+        cursor.movePosition(QTextCursor.MoveOperation.StartOfBlock)
+        cursor.insertText("\n".join(rng.choice(_SNIPPETS) for _ in range(rng.randint(1, 3))) + "\n")
+    elif kind == 5:
+        # One notification for changes at several places
+        cursor.beginEditBlock()
+        for _ in range(rng.randint(2, 4)):
+            cursor.setPosition(_position(doc, rng.randint(0, doc.characterCount() - 1)))
+            cursor.insertText(rng.choice(_SNIPPETS))
+        cursor.endEditBlock()
+    elif kind == 6:
+        (editor.undo if rng.random() < 0.7 else editor.redo)()
+    elif kind == 7 and rng.random() < 0.1:
+        editor.selectAll()
+        editor.insertPlainText(rng.choice(_SNIPPETS) + "\nreplaced 😀\n")
+    elif kind == 8 and rng.random() < 0.1:
+        autosaver.set_paused(True)
+        editor.setPlainText(editor.toPlainText() + "\nappended while paused\n")
+        autosaver.set_paused(False)
+
+
+def wait_for_writer(autosaver: Autosaver) -> None:
+    autosaver._executor.submit(lambda: None).result()
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Autosave journal replay against the editor's text")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--edits", type=int, default=2000, help="random edits to apply")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)  # noqa: F841
+    text = "\n\n".join(path.read_text(encoding="utf-8") for path in sorted(args.corpus.glob("*.md")))
+    rng = random.Random(args.seed)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        doc_path = Path(tmp) / "note.md"
+        doc_path.write_text(text, encoding="utf-8")
+        editor = QPlainTextEdit()
+        highlighter = MarkdownHighlighter(editor.document())  # noqa: F841
+        editor.setPlainText(text)
+        autosaver = Autosaver(editor.document(), Path(tmp) / "autosave", interval_ms=3_600_000)
+        autosaver.failed.connect(lambda msg: print(f"FAILED {msg}"))
+        autosaver.start(doc_path, text)
+        # Compact often: the edits outgrow 2% of the document
+        autosaver._journal.compact_ratio = 0.02
+        autosaver._journal.min_compact_bytes = 0
+        snapshots = 0
+        for i in range(args.edits):
+            random_edit(rng, editor, autosaver)
+            if rng.random() < 0.2 or i == args.edits - 1:
+                snapshots += autosaver._resync or autosaver._journal.wants_snapshot
+                autosaver.flush()
+                wait_for_writer(autosaver)
+                recovered = replay_journal(autosaver.journal_path)
+                expected = editor.toPlainText()
+                if recovered is None and expected == text:
+                    continue  # nothing journaled yet
+                if recovered is None or recovered.text != expected:
+                    failures += 1
+                    print(f"edit {i}: the journal replays to different text")
+                    break
+        autosaver.shutdown(discard=True)
+
+        # Journals written before edit offsets were UTF-16 units still replay
+        legacy = Path(tmp) / "legacy.journal"
+        legacy.write_text('{"v": 1, "path": null, "base": "inline", "text": "a😀b"}\n'
+                          '{"at": 2, "del": 1, "ins": "c"}\n', encoding="utf-8")
+        if replay_journal(legacy).text != "a😀c":
+            failures += 1
+            print("a version 1 journal replays to different text")
+    print(f"{args.edits} random edits checked ({snapshots} snapshots), {failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
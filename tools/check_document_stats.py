@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Check that incremental document statistics match a full recount.
+
+Usage:
+  QT_QPA_PLATFORM=offscreen python tools/check_document_stats.py [--edits 2000] [--seed 0]
+
+DocumentStats updates its counts from QTextDocument.contentsChange. This
+check first counts a few fixed cases (``#`` comments inside fenced code
+are not headings, emoji count once), then applies --edits random edits to
+a document built from tools/corpus/markdown: typed text, deleted ranges,
+pasted lines and code fences opened and closed. After every edit the
+incremental counts must equal the counts of a fresh DocumentStats over
+the same text. The exit status is 1 on any difference.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from PyQt6.QtGui import QTextCursor, QTextDocument  # noqa: E402
+from PyQt6.QtWidgets import QApplication, QPlainTextDocumentLayout  # noqa: E402
+
+from pymd_editor.document_stats import DocumentStats  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+
+# (text, expected headings, expected characters)
+CASES = [
+    ("```bash\n# install deps\npip install x\n```\n# Title", 1, None),
+    ("~~~\n# not a heading\n```\n# still code\n~~~\n## Heading", 1, None),
+    ("> ```\n> # quoted code\n> ```\n# Title", 1, None),
+    ("````\n```\n# code\n````\n# Title", 1, None),
+    ("# One\n## Two\n#hashtag\n    # indented code", 2, None),
+    ("emoji 😀 once", 0, 12),
+]
+_SNIPPETS = ("# Heading", "```", "```python", "~~~", "# comment", "text 中文 😀", "- item", "")
+
+
+def new_document(text: str) -> QTextDocument:
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    doc.setPlainText(text)
+    return doc
+
+
+def check_cases() -> int:
+    failures = 0
+    for text, headings, chars in CASES:
+        stats = DocumentStats(new_document(text)).stats()
+        if stats.headings != headings or (chars is not None and stats.chars != chars):
+            failures += 1
+            print(f"MISMATCH {text!r}: {stats}")
+    return failures
+
+
+def random_edit(rng: random.Random, cursor: QTextCursor, length: int) -> None:
+    pos = rng.randint(0, length)
+    cursor.setPosition(pos)
+    kind = rng.randrange(4)
+    if kind == 0:
+        cursor.insertText(rng.choice("ab #`~\n中"))
+    elif kind == 1:
+        cursor.setPosition(min(length, pos + rng.randint(1, 40)), QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+    elif kind == 2:
+        cursor.movePosition(QTextCursor.MoveOperation.StartOfBlock)
+        cursor.insertText("\n".join(rng.choice(_SNIPPETS) for _ in range(rng.randint(1, 3))) + "\n")
+    else:
+        # Open or close a fence far away from the end of the document
+        cursor.movePosition(QTextCursor.MoveOperation.StartOfBlock)
+        cursor.insertText(rng.choice(("```\n", "~~~\n")))
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Incremental document statistics against a full recount")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--edits", type=int, default=2000, help="random edits to apply")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)  # noqa: F841
+    failures = check_cases()
+
+    text = "\n\n".join(path.read_text(encoding="utf-8") for path in sorted(args.corpus.glob("*.md")))
+    doc = new_document(text)
+    stats = DocumentStats(doc)
+    cursor = QTextCursor(doc)
+    rng = random.Random(args.seed)
+    for i in range(args.edits):
+        random_edit(rng, cursor, doc.characterCount() - 1)
+        expected = DocumentStats(new_document(doc.toPlainText())).stats()
+        if stats.stats() != expected:
+            failures += 1
+            print(f"edit {i}: incremental {stats.stats()} != full {expected}")
+            stats = DocumentStats(doc)  # report each divergence once
+    print(f"{len(CASES)} cases and {args.edits} random edits checked, {failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Check that incremental (block-by-block) rendering matches a full render.
+
+Usage:
+  python tools/check_incremental_render.py [--corpus DIR] [--fuzz 800] [--seed 0] [-v]
+
+The live preview splits the source into top-level blocks
+(split_blocks_with_lines) and renders each block on its own, so only
+edited blocks are re-rendered; heading ids are then numbered across the
+blocks. That is only correct if every block renders the same on its own
+as inside the whole document.
+
+Documents are the *.md files of the corpus (default tools/corpus/markdown)
+plus --fuzz random documents built around block boundaries: tight, loose
+and nested lists with lazy continuation lines, repeated headings,
+blockquotes, fenced and indented code, $$ math, raw HTML blocks with blank
+lines, tables and runs of blank lines. Each is rendered with an
+incremental and a non-incremental MarkdownRenderer (lazy math on, as in
+the app); the exit status is 1 if any output differs.
+
+markdown2 itself emits invalid HTML for a few constructs in a whole
+document (e.g. ``<p><hr /></p>`` or ``<p></blockquote></p>``, or a list
+wrapped in ``<p>``), depending on unrelated earlier blocks. Where the full render nests a block element inside ``<p>`` the
+document is reported as skipped rather than failed: block-by-block
+rendering gives the well-formed output there.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import random
+import re
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymd_editor.renderer import MarkdownRenderer, RenderCache  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+
+# <p> whose content opens or closes a block element before the paragraph closes
+_BLOCK_IN_PARAGRAPH_RE = re.compile(
+    r"<p>(?:(?!</p>).)*?(?:<|</(?!p>))(?:p|hr|ul|ol|li|pre|blockquote|div|table|h[1-6])\b", re.S)
+_WORDS = ("alpha", "beta", "gamma", "delta", "note", "中文", "段落")
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def _list(rng: random.Random, depth: int = 0) -> list[str]:
+    ordered = rng.random() < 0.3
+    lines = []
+    for i in range(rng.randint(1, 4)):
+        marker = f"{i + 1}." if ordered else rng.choice("-*")
+        lines.append("    " * depth + f"{marker} {_words(rng, 2)}")
+        roll = rng.random()
+        if roll < 0.2:
+            lines.append(_words(rng, 2))  # lazy continuation
+        elif roll < 0.3:
+            lines.append("    " * (depth + 1) + _words(rng, 2))
+        elif roll < 0.4:
+            lines.extend(["", "    " * (depth + 1) + _words(rng, 3)])  # second paragraph
+        if depth < 2 and rng.random() < 0.2:
+            lines.extend(_list(rng, depth + 1))
+        if rng.random() < 0.2:
+            lines.append("")  # loose list
+    return lines
+
+
+def fuzz_document(rng: random.Random) -> str:
+    blocks = []
+    for _ in range(rng.randint(3, 14)):
+        kind = rng.randrange(11)
+        if kind == 0:
+            # A small vocabulary so headings repeat, within and across blocks
+            heading = "#" * rng.randint(1, 3) + " " + rng.choice(("A", "B", "A 2", "", "中文"))
+            blocks.append(heading + ("\n" + heading if rng.random() < 0.3 else ""))
+        elif kind == 1:
+            blocks.append(_words(rng, 5) + ("\n" + _words(rng, 3) if rng.random() < 0.5 else ""))
+        elif kind in (2, 3):
+            blocks.append("\n".join(_list(rng)))
+        elif kind == 4:
+            lines = ["> " + _words(rng, 3)]
+            if rng.random() < 0.5:
+                lines.append(_words(rng, 2))  # lazy quote continuation
+            blocks.append("\n".join(lines))
+        elif kind == 5:
+            blocks.append(f"```\n{_words(rng, 2)}\n\n# {_words(rng, 1)}\n```")
+        elif kind == 6:
+            blocks.append(f"    {_words(rng, 2)}\n\n    {_words(rng, 2)}")
+        elif kind == 7:
+            blocks.append(f"$$\nx_{rng.randrange(9)}\n\n+ y\n$$")
+        elif kind == 8:
+            blocks.append(f"<div>\n{_words(rng, 2)}\n\n{_words(rng, 2)}\n</div>")
+        elif kind == 9:
+            blocks.append(f"| a | b |\n| --- | --- |\n| {_words(rng, 1)} | ${rng.randrange(9)}$ |")
+        else:
+            blocks.append("---")
+    return ("\n" * rng.choice((2, 2, 3))).join(blocks) + "\n"
+
+
+def check(name: str, text: str, verbose: bool) -> bool | None:
+    """True if both renders match, False if not, None if the full render is invalid."""
+    # Fresh caches: a shared cache would hand one renderer the other's result
+    incremental = MarkdownRenderer(incremental=True, cache=RenderCache(), lazy_math=True)
+    full = MarkdownRenderer(incremental=False, cache=RenderCache(), lazy_math=True)
+    by_block = incremental.render_body(text)
+    whole = full.render_body(text)
+    # Blocks are joined with a newline; whitespace between tags is not significant
+    same = by_block.split() == whole.split()
+    if not same and _BLOCK_IN_PARAGRAPH_RE.search(whole):
+        if verbose:
+            print(f"SKIPPED {name}: the full render nests a block element in <p>")
+        return None
+    if not same:
+        print(f"DIFFERS {name}")
+        if verbose:
+            print(text)
+            sys.stdout.writelines(difflib.unified_diff(
+                whole.splitlines(keepends=True), by_block.splitlines(keepends=True),
+                fromfile="full", tofile="incremental"))
+    return same
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Incremental against full Markdown rendering")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--fuzz", type=int, default=800, help="random documents to generate")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("-v", "--verbose", action="store_true", help="show the differing documents")
+    args = p.parse_args()
+
+    documents = [(path.name, path.read_text(encoding="utf-8")) for path in sorted(args.corpus.glob("*.md"))]
+    rng = random.Random(args.seed)
+    documents += [(f"fuzz-{i}", fuzz_document(rng)) for i in range(args.fuzz)]
+    results = {name: check(name, text, args.verbose) for name, text in documents}
+    failed = [name for name, ok in results.items() if ok is False]
+    skipped = sum(ok is None for ok in results.values())
+    print(f"{len(documents) - len(failed) - skipped}/{len(documents)} documents render the same "
+          f"block by block, {skipped} skipped (invalid full render)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Check that WYSIWYG edits are written back to the source block by block.
+
+Usage:
+  python tools/check_wysiwyg_writeback.py [--corpus DIR] [--fuzz 300] [--seed 0]
+
+The WYSIWYG page emits canonical Markdown (``-`` bullets, fenced code, ATX
+headings, ...) while the source may be spelled differently. The app
+compares the canonical form of each source block with the page's text
+(text_diff.block_edit) and rewrites only the blocks that changed. Sources
+are the *.md files of the corpus (default tools/corpus/markdown) plus
+--fuzz random documents written in non-canonical spellings: ``*`` and
+``+`` bullets, setext headings, closing ``#``, ``***`` rules, indented
+code, unpadded tables, renumbered lists, extra blank lines and trailing
+spaces.
+
+For each source, the unchanged page must give no edit. Then each block of
+the page is in turn replaced, deleted, split in two, or has a block
+inserted before it, and a block is appended at the end. After applying
+the edit, every other source block must be untouched (byte for byte) and
+the source must convert to the edited page. Edits whose page does not
+convert to itself (deleting the block between two lists joins them) are
+not tried; a block appended after a blockquote that ends in indented code
+is taken into the quote by markdown2 and reported as skipped. The exit
+status is 1 on any failure.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymd_editor.html_to_markdown import html_to_markdown  # noqa: E402
+from pymd_editor.renderer import MarkdownRenderer, split_blocks_with_lines  # noqa: E402
+from pymd_editor.text_diff import block_edit  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+_WORDS = ("alpha", "beta", "gamma", "note", "中文", "段落")
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def fuzz_document(rng: random.Random) -> str:
+    blocks = []
+    for _ in range(rng.randint(2, 10)):
+        kind = rng.randrange(10)
+        if kind == 0:
+            blocks.append(f"{_words(rng, 2)}\n{rng.choice('=-') * rng.randint(3, 8)}")
+        elif kind == 1:
+            blocks.append(f"## {_words(rng, 2)} ##")
+        elif kind == 2:
+            marker = rng.choice("*+")
+            blocks.append("\n".join(f"{marker} {_words(rng, 2)}" for _ in range(rng.randint(1, 3))))
+        elif kind == 3:
+            blocks.append("\n".join(f"{n}. {_words(rng, 2)}" for n in rng.sample(range(1, 9), 3)))
+        elif kind == 4:
+            blocks.append(f"    {_words(rng, 2)}\n    {_words(rng, 1)}")
+        elif kind == 5:
+            blocks.append(rng.choice(("***", "* * *", "___")))
+        elif kind == 6:
+            blocks.append(f"|a|b|\n|-|-|\n|{_words(rng, 1)}|{rng.randrange(9)}|")
+        elif kind == 7:
+            blocks.append(f">{_words(rng, 3)}\n{_words(rng, 2)}")
+        else:
+            blocks.append(f"{_words(rng, 4)}   \n{_words(rng, 3)} ")
+    return ("\n" * rng.choice((2, 3, 4))).join(blocks) + "\n"
+
+
+class Canonical:
+    """Per-block canonical forms, as WYSIWYGEditor.canonical_blocks computes them."""
+
+    def __init__(self):
+        self.renderer = MarkdownRenderer(lazy_math=True)
+        self.cache: dict[str, str] = {}
+
+    def blocks(self, text: str) -> list[tuple[int, int, str]]:
+        result = []
+        for start, block in split_blocks_with_lines(text):
+            if block not in self.cache:
+                self.cache[block] = html_to_markdown(self.renderer.render_body(block))
+            if self.cache[block]:
+                result.append((start, start + block.count("\n") + 1, self.cache[block]))
+        return result
+
+
+def check(name: str, text: str, canonical: Canonical, rng: random.Random) -> tuple[int, int]:
+    blocks = canonical.blocks(text)
+    forms = [form for _, _, form in blocks]
+    if block_edit(text, blocks, "\n\n".join(forms)) is not None:
+        print(f"{name}: the unchanged page edits the source")
+        return 1, 0
+    line_starts = [0]
+    for line in text.split("\n"):
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    failures = skipped = 0
+    for i in range(len(forms) + 1):
+        kind = rng.randrange(4) if i < len(forms) else 3
+        new = f"Edited {_words(rng, 2)}."
+        if kind == 0:
+            edited = forms[:i] + [new] + forms[i + 1:]
+        elif kind == 1:
+            edited = forms[:i] + forms[i + 1:]
+        elif kind == 2:
+            edited = forms[:i] + [new, new] + forms[i + 1:]
+        else:
+            edited = forms[:i] + [new] + forms[i:]
+        page = "\n\n".join(edited)
+        if "\n\n".join(form for _, _, form in canonical.blocks(page)) != page:
+            continue  # the edit joins its neighbours (two lists): the page reads differently itself
+        edit = block_edit(text, blocks, page)
+        if edit is None:
+            print(f"{name}: edit {kind} of block {i} gives no source edit")
+            failures += 1
+            continue
+        start, end, replacement = edit
+        # The edit must stay between the neighbouring blocks; deleting one
+        # of several equal blocks may take any of them
+        before, after = i, (i + 1 if kind < 3 else i)
+        while kind == 1 and before and forms[before - 1].endswith(forms[i]):
+            before -= 1
+        while kind == 1 and after < len(forms) and forms[after].startswith(forms[i]):
+            after += 1
+        low = line_starts[blocks[before - 1][1]] - 1 if before else 0
+        high = line_starts[blocks[after][0]] if after < len(blocks) else len(text)
+        result = text[:start] + replacement + text[end:]
+        result_blocks = canonical.blocks(result)
+        if not low <= start <= end <= high:
+            print(f"{name}: edit {kind} of block {i} rewrote unchanged blocks")
+            failures += 1
+        elif "\n\n".join(form for _, _, form in result_blocks) == page:
+            pass
+        elif len(result_blocks) != len(canonical.blocks(page)):
+            skipped += 1  # markdown2 takes the new block into a quote ending in indented code
+        else:
+            print(f"{name}: edit {kind} of block {i}: the source no longer converts to the page")
+            failures += 1
+    return failures, skipped
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="WYSIWYG write-back against non-canonical sources")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--fuzz", type=int, default=300, help="random documents to generate")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    documents = [(path.name, path.read_text(encoding="utf-8")) for path in sorted(args.corpus.glob("*.md"))]
+    rng = random.Random(args.seed)
+    documents += [(f"fuzz-{i}", fuzz_document(rng)) for i in range(args.fuzz)]
+    canonical = Canonical()
+    results = [check(name, text, canonical, rng) for name, text in documents]
+    failures = sum(failed for failed, _ in results)
+    skipped = sum(skipped for _, skipped in results)
+    print(f"{len(documents)} documents checked, {failures} failures, "
+          f"{skipped} edits skipped (markdown2 takes the new block into a quote)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Vendor MathJax into the desktop app so the preview works offline.
+
+Usage:
+  python tools/fetch_mathjax.py [--version 3.2.2]
+
+Downloads the MathJax npm package and extracts its `es5/` build (and its
+LICENSE) into `src/pymd_editor/assets/mathjax/`, where the pymd:// scheme
+handler serves it. Without a vendored copy the handler redirects to the
+jsDelivr CDN.
+
+The directory is not checked in: build_exe.spec and PyMDEditor.spec run
+this script when it is missing, and pyproject.toml packages it as data, so
+run it before building a wheel.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import shutil
+import tarfile
+import urllib.request
+from pathlib import Path
+
+DEST = Path(__file__).resolve().parent.parent / "src" / "pymd_editor" / "assets" / "mathjax"
+TARBALL_URL = "https://registry.npmjs.org/mathjax/-/mathjax-{version}.tgz"
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Vendor MathJax for the pymd:// scheme")
+    p.add_argument("--version", default="3.2.2", help="MathJax version (default: 3.2.2)")
+    args = p.parse_args()
+
+    url = TARBALL_URL.format(version=args.version)
+    print(f"  Downloading {url}")
+    with urllib.request.urlopen(url) as resp:
+        data = resp.read()
+
+    if DEST.exists():
+        shutil.rmtree(DEST)
+    DEST.mkdir(parents=True)
+
+    prefix = "package/es5/"
+    count = 0
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        for member in tar.getmembers():
+            if member.name == "package/LICENSE":
+                rel = Path("LICENSE")
+            elif member.isfile() and member.name.startswith(prefix):
+                rel = Path(member.name[len(prefix):])
+            else:
+                continue
+            if ".." in rel.parts:
+                continue
+            target = DEST / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(tar.extractfile(member).read())
+            count += 1
+
+    print(f"  Extracted {count} files → {DEST}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Measure how Markdown -> HTML -> Markdown round trips converge.
+
+Usage:
+  python tools/roundtrip_markdown.py [--corpus DIR] [--fuzz 200] [--seed 0] [--max-passes 4] [-v]
+
+The WYSIWYG tab renders the source with MarkdownRenderer and converts the
+edited page back with html_to_markdown. Every pass of that round trip that
+still changes the text would show up as an edit nobody made, so the first
+pass must land on a fixed point: converting the result again has to give
+the same text.
+
+A fixed point alone does not catch a lossy conversion (a dropped link
+title converges just as well), so the first pass must also render to the
+same HTML as the original, up to whitespace, character references and
+paragraphs directly inside list items.
+
+Documents are the *.md files of the corpus (default tools/corpus/markdown)
+plus --fuzz random documents built from headings, paragraphs with inline
+markup, strike-through, titled links, inline HTML, escaped metacharacters,
+nested, loose and renumbered lists, task lists, blockquotes, fenced code,
+tables (with pipes in code spans), math (also inside link destinations,
+image alt text and HTML attributes), images and CJK text. For every
+document the harness reports how many passes it takes to converge and the
+render and convert time of the first pass. It also checks that converting
+the page block by block (as the WYSIWYG editor does after an edit) gives
+the same text as converting it whole.
+
+The exit status is 1 if any document is not a fixed point after one pass,
+renders differently after it, or the block-wise conversion differs.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymd_editor.html_to_markdown import html_to_markdown  # noqa: E402
+from pymd_editor.renderer import MarkdownRenderer  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "markdown"
+
+_WORDS = ("alpha", "beta", "gamma", "delta", "render", "preview", "editor", "block",
+          "中文", "测试", "段落", "公式")
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*?(/?)>")
+_VOID = {"br", "hr", "img", "input", "meta", "link", "wbr", "col", "source"}
+_BETWEEN_TAGS_RE = re.compile(r">\s+<")
+_SPACE_RE = re.compile(r"\s+")
+_CHAR_REF_RE = re.compile(r"&#(x[0-9a-fA-F]+|[0-9]+);")
+# markdown2 wraps some items of a tight list in <p>; html_to_markdown writes
+# every list tight, so item paragraphs are not compared
+_ITEM_PARAGRAPH_RE = re.compile(r"(<li>)<p>|</p>(</li>|<ul>|<ol>)")
+_KEEP_ESCAPED = {"<": "&lt;", ">": "&gt;", "&": "&amp;", '"': "&quot;"}
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+
+def _inline(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(2, 6)):
+        kind = rng.randrange(13)
+        w = _words(rng, rng.randint(1, 3))
+        if kind == 0:
+            parts.append(f"**{w}**")
+        elif kind == 1:
+            parts.append(f"*{w}*")
+        elif kind == 2:
+            parts.append(f"`{w}`")
+        elif kind == 3:
+            # Math delimiters in a destination stay part of the URL
+            query = rng.choice(("", "?q=$x$"))
+            parts.append(f"[{w}](https://example.com/{rng.randrange(100)}{query})")
+        elif kind == 4:
+            parts.append(f"$x_{rng.randrange(10)} + y$")
+        elif kind == 5:
+            parts.append(rng.choice((f"\\*{w}\\*", f"\\`{w}\\`", f"\\${rng.randrange(100)}",
+                                     f"[{w}\\](x)", f"C:\\{w}")))
+        elif kind == 6:
+            parts.append(f"~~{w}~~")
+        elif kind == 7:
+            parts.append(f'[{w}](https://example.com/{rng.randrange(100)} "{_words(rng, 2)}")')
+        elif kind == 8:
+            tag = rng.choice(("kbd", "sup", "sub", "mark"))
+            title = rng.choice(("", ' title="$a$"'))
+            parts.append(f"<{tag}{title}>{w}</{tag}>")
+        else:
+            parts.append(w)
+    return " ".join(parts)
+
+
+def _list(rng: random.Random, depth: int = 0) -> list[str]:
+    ordered = rng.random() < 0.4
+    task = not ordered and rng.random() < 0.2
+    start = rng.choice((1, 1, 3, 10))
+    lines = []
+    for i in range(rng.randint(1, 4)):
+        marker = f"{start + i}." if ordered else "-"
+        box = rng.choice(("[ ] ", "[x] ")) if task else ""
+        lines.append("    " * depth + f"{marker} {box}{_inline(rng)}")
+        if depth < 2 and rng.random() < 0.25:
+            lines.extend(_list(rng, depth + 1))
+    return lines
+
+
+def fuzz_document(rng: random.Random) -> str:
+    blocks = []
+    for _ in range(rng.randint(3, 12)):
+        kind = rng.randrange(10)
+        if kind == 0:
+            blocks.append("#" * rng.randint(1, 6) + " " + _words(rng, rng.randint(1, 4)))
+        elif kind == 1:
+            blocks.append(_inline(rng))
+        elif kind == 2:
+            # Text that would parse as a block marker without its escape
+            lead = rng.choice(("1\\. ", "\\# ", "\\- ", "\\+ ", "\\> ", ""))
+            blocks.append(lead + _inline(rng))
+        elif kind == 3:
+            blocks.append("\n".join(_list(rng)))
+        elif kind == 4:
+            blocks.append("\n".join("> " + _inline(rng) for _ in range(rng.randint(1, 2))))
+        elif kind == 5:
+            body = "\n".join("    " * rng.randint(0, 1) + _words(rng, 3) for _ in range(rng.randint(1, 4)))
+            blocks.append(f"```{rng.choice(('', 'python'))}\n{body}\n```")
+        elif kind == 6:
+            cols = rng.randint(2, 4)
+            cell = lambda: rng.choice((_words(rng, 1),) * 4 + ("`a \\| b`", "x \\| y"))
+            rows = [" | ".join(cell() for _ in range(cols)) for _ in range(rng.randint(2, 4))]
+            blocks.append("\n".join(["| " + rows[0] + " |", "|" + " --- |" * cols]
+                                    + ["| " + r + " |" for r in rows[1:]]))
+        elif kind == 7:
+            blocks.append(f"$$\n\\sum_{{i={rng.randrange(3)}}}^n i\n$$")
+        elif kind == 8:
+            alt = rng.choice((_words(rng, 1), f"alt $a_{rng.randrange(9)}$"))
+            blocks.append(f"![{alt}](images/{rng.randrange(9)}.png)")
+        else:
+            blocks.append("---")
+    return "\n\n".join(blocks) + "\n"
+
+
+def top_level_blocks(html: str) -> list[str]:
+    """Split a rendered body into its top-level elements, like the page's .content children."""
+    blocks, depth, start = [], 0, None
+    for m in _TAG_RE.finditer(html):
+        closing, name, self_closing = m.group(1), m.group(2).lower(), m.group(3)
+        if depth == 0 and not closing:
+            start = m.start()
+        if closing:
+            depth -= 1
+        elif not self_closing and name not in _VOID:
+            depth += 1
+        if depth == 0 and start is not None:
+            blocks.append(html[start:m.end()])
+            start = None
+    return blocks
+
+
+def _char_ref(m: re.Match) -> str:
+    ref = m.group(1)
+    char = chr(int(ref[1:], 16) if ref[0] == "x" else int(ref))
+    return _KEEP_ESCAPED.get(char, char)
+
+
+def comparable_html(html: str) -> str:
+    """Rendered HTML with whitespace, character references and item paragraphs normalized."""
+    html = _CHAR_REF_RE.sub(_char_ref, html)
+    html = _SPACE_RE.sub(" ", _BETWEEN_TAGS_RE.sub("><", html)).strip()
+    return _ITEM_PARAGRAPH_RE.sub(r"\1\2", html)
+
+
+def blockwise(html: str) -> str:
+    # Same join as MarkdownBlockCache; every part is already in canonical form
+    parts = (html_to_markdown(block) for block in top_level_blocks(html))
+    return "\n\n".join(part for part in parts if part)
+
+
+def check(name: str, text: str, renderer: MarkdownRenderer, max_passes: int,
+          verbose: bool) -> tuple[bool, float, float]:
+    """Return (fixed point after one pass, same rendering and block-wise equal, render s, convert s)."""
+    t0 = time.perf_counter()
+    html = renderer.render_body(text)
+    t1 = time.perf_counter()
+    current = html_to_markdown(html)
+    t2 = time.perf_counter()
+
+    rerendered = renderer.render_body(current)
+    equivalent = comparable_html(rerendered) == comparable_html(html)
+    if not equivalent and verbose:
+        print(f"--- {name}: the first pass renders differently")
+        sys.stdout.writelines(difflib.unified_diff(
+            comparable_html(html).replace("><", ">\n<").splitlines(keepends=True),
+            comparable_html(rerendered).replace("><", ">\n<").splitlines(keepends=True),
+            fromfile="original", tofile="pass 1"))
+
+    passes, previous = 1, current
+    while passes <= max_passes:
+        following = html_to_markdown(renderer.render_body(previous))
+        if following == previous:
+            break
+        passes += 1
+        if passes == 2 and verbose:
+            print(f"--- {name}: second pass changes the text")
+            sys.stdout.writelines(difflib.unified_diff(
+                previous.splitlines(keepends=True), following.splitlines(keepends=True),
+                fromfile="pass 1", tofile="pass 2"))
+        previous = following
+    converged = "fixed point" if passes == 1 else (
+        f"{passes} passes" if passes <= max_passes else f"no fixed point in {max_passes}")
+
+    by_block = blockwise(html)
+    same = by_block == current
+    if not same and verbose:
+        print(f"--- {name}: block-wise conversion differs")
+        sys.stdout.writelines(difflib.unified_diff(
+            current.splitlines(keepends=True), by_block.splitlines(keepends=True),
+            fromfile="whole", tofile="block-wise"))
+    if verbose or passes > 1 or not same or not equivalent:
+        print(f"{name:<24} {converged:<22} render {(t1 - t0) * 1000:6.1f} ms  "
+              f"convert {(t2 - t1) * 1000:6.1f} ms{'' if same else '  BLOCK-WISE DIFFERS'}"
+              f"{'' if equivalent else '  RENDERS DIFFERENTLY'}")
+    return passes == 1 and same and equivalent, t1 - t0, t2 - t1
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Markdown -> HTML -> Markdown round-trip convergence")
+    p.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="directory of *.md files")
+    p.add_argument("--fuzz", type=int, default=200, help="random documents to generate")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--max-passes", type=int, default=4, help="give up after this many passes")
+    p.add_argument("-v", "--verbose", action="store_true", help="report every document and show diffs")
+    args = p.parse_args()
+
+    renderer = MarkdownRenderer(lazy_math=True)
+    documents = [(path.name, path.read_text(encoding="utf-8")) for path in sorted(args.corpus.glob("*.md"))]
+    rng = random.Random(args.seed)
+    documents += [(f"fuzz-{i}", fuzz_document(rng)) for i in range(args.fuzz)]
+
+    failed, render_s, convert_s = [], 0.0, 0.0
+    for name, text in documents:
+        ok, rendered, converted = check(name, text, renderer, args.max_passes, args.verbose)
+        render_s += rendered
+        convert_s += converted
+        if not ok:
+            failed.append(name)
+    size = sum(len(text.encode("utf-8")) for _, text in documents) / 1e6
+    print(f"First pass over {size:.2f} MB of Markdown: render {render_s * 1000:.0f} ms, "
+          f"convert back {convert_s * 1000:.0f} ms")
+    print(f"{len(documents) - len(failed)}/{len(documents)} documents reach a fixed point after one pass "
+          f"and render the same")
+    if failed:
+        print("FAIL: " + ", ".join(failed[:20]) + (" ..." if len(failed) > 20 else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())